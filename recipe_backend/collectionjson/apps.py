@@ -1,5 +1,18 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_save, post_delete
 
 
 class CollectionjsonConfig(AppConfig):
     name = 'collectionjson'
+
+    def ready(self):
+        from .cache import invalidate_fragments, invalidate_counts
+
+        post_save.connect(invalidate_fragments,
+                          dispatch_uid='collectionjson_invalidate_saved_fragments')
+        post_delete.connect(invalidate_fragments,
+                            dispatch_uid='collectionjson_invalidate_deleted_fragments')
+        post_save.connect(invalidate_counts,
+                          dispatch_uid='collectionjson_invalidate_saved_counts')
+        post_delete.connect(invalidate_counts,
+                            dispatch_uid='collectionjson_invalidate_deleted_counts')
@@ -0,0 +1,292 @@
+
+import hashlib
+import time
+from collections import OrderedDict
+from threading import Lock
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class LRUCache(object):
+    """
+    A thread-safe, size-bounded in-process cache that evicts the least recently
+    used entries.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                return default
+            self._data[key] = value
+            return value
+
+    def set(self, key, value):
+        """
+        Store a value and return the list of (key, value) pairs evicted to make
+        room for it.
+        """
+        if self.max_size <= 0:
+            return []
+        evicted = []
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.max_size:
+                evicted.append(self._data.popitem(last=False))
+        return evicted
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def items(self):
+        """
+        Return a snapshot of the cached (key, value) pairs.
+        """
+        with self._lock:
+            return list(self._data.items())
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class FragmentCache(object):
+    """
+    Cache of already rendered Collection+JSON items. Fragments are keyed by model
+    instance (model label and pk), serializer class, row version and the variant
+    of the rendering (e.g. the url prefix used to build the item's absolute
+    hyperlinks and the embedded relations), and every fragment counts towards the
+    cache's maximum size. The row version is the value of the instance's
+    'version_field' attribute so that entries of rows modified by other processes
+    are never served, and the fragments of an instance's older versions are dropped
+    as soon as a newer one is cached. Instances without that attribute are not
+    cached.
+    """
+
+    def __init__(self, max_size, version_field='modified'):
+        self.version_field = version_field
+        self._cache = LRUCache(max_size)
+        # keys of the cached fragments of each instance
+        self._instance_keys = {}
+        self._lock = Lock()
+
+    @property
+    def enabled(self):
+        return self._cache.max_size > 0
+
+    def _get_instance_key(self, model, pk):
+        return model._meta.label_lower, pk
+
+    def get_key(self, serializer_class, instance, variant):
+        """
+        Return the key of an instance's fragment or None if it can not be cached.
+        """
+        version = getattr(instance, self.version_field, None)
+        if version is None:
+            return None
+        return serializer_class, version, variant
+
+    def get(self, instance, key):
+        instance_key = self._get_instance_key(type(instance), instance.pk)
+        return self._cache.get((instance_key, key))
+
+    def set(self, instance, key, fragment):
+        instance_key = self._get_instance_key(type(instance), instance.pk)
+        with self._lock:
+            keys = self._instance_keys.setdefault(instance_key, set())
+            for old_key in [k for k in keys if k[1] != key[1]]:
+                # fragment of an older version of the row
+                keys.discard(old_key)
+                self._cache.delete((instance_key, old_key))
+            keys.add(key)
+            evicted = self._cache.set((instance_key, key), fragment)
+            for ((evicted_instance_key, evicted_key), value) in evicted:
+                self._discard_key(evicted_instance_key, evicted_key)
+
+    def _discard_key(self, instance_key, key):
+        keys = self._instance_keys.get(instance_key)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._instance_keys[instance_key]
+
+    def invalidate(self, model, pk):
+        """
+        Remove all the cached fragments of a model instance.
+        """
+        instance_key = self._get_instance_key(model, pk)
+        with self._lock:
+            for key in self._instance_keys.pop(instance_key, ()):
+                self._cache.delete((instance_key, key))
+
+    def clear(self):
+        with self._lock:
+            self._instance_keys.clear()
+            self._cache.clear()
+
+
+fragment_cache = FragmentCache(getattr(settings, 'COLLECTIONJSON_FRAGMENT_CACHE_SIZE',
+                                       10000))
+
+
+def invalidate_fragments(sender, instance, **kwargs):
+    """
+    Signal receiver that removes the cached fragments of a saved or deleted instance.
+    """
+    fragment_cache.invalidate(sender, instance.pk)
+
+
+class TaggedCache(object):
+    """
+    Cache shared by all the server processes through one of Django's cache backends
+    whose entries are tagged. The backend must be shared by all the processes (e.g.
+    memcached, redis or the database cache): with a local-memory cache a tag
+    invalidated by one process stays valid in the others.
+    An entry's key includes the current version of its tags, so invalidating a tag
+    (bumping its version) makes all of its entries unreachable without having to know
+    their keys. Unreachable entries just expire. The cache alias and the entries'
+    timeout are read from the settings named by 'alias_setting' and
+    'timeout_setting'.
+    """
+    key_prefix = 'collectionjson'
+    alias_setting = None
+    timeout_setting = None
+
+    @property
+    def alias(self):
+        return getattr(settings, self.alias_setting, None)
+
+    @property
+    def timeout(self):
+        return getattr(settings, self.timeout_setting, 300)
+
+    @property
+    def enabled(self):
+        return self.alias is not None and self.timeout != 0
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _get_tag_key(self, tag):
+        return '%s:tag:%s' % (self.key_prefix, tag)
+
+    def _new_version(self):
+        # a new version must differ from any previous one even if the tag's version
+        # was evicted from the cache
+        return int(time.time() * 1000000)
+
+    def get_tag_versions(self, tags):
+        """
+        Return the current versions of a list of tags, initializing missing ones.
+        """
+        keys = [self._get_tag_key(tag) for tag in tags]
+        versions = self.cache.get_many(keys)
+        for key in keys:
+            if key not in versions:
+                self.cache.add(key, self._new_version(), None)
+                versions[key] = self.cache.get(key)
+        return [versions[key] for key in keys]
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, entry):
+        self.cache.set(key, entry, self.timeout)
+
+    def invalidate(self, *tags):
+        """
+        Make all the cached entries that depend on any of the given tags
+        unreachable.
+        """
+        if not self.enabled:
+            return
+        for tag in tags:
+            key = self._get_tag_key(tag)
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                self.cache.set(key, self._new_version(), None)
+
+
+class ResponseCache(TaggedCache):
+    """
+    Cache of rendered responses.
+    """
+    alias_setting = 'COLLECTIONJSON_RESPONSE_CACHE'
+    timeout_setting = 'COLLECTIONJSON_RESPONSE_CACHE_TIMEOUT'
+
+    def get_key(self, path, query_items, variant, tags):
+        """
+        Return the key of a response from the request's path, query parameters (a
+        list of name, values pairs) and variant (e.g. the accepted media type and url
+        prefix) and the list of tags the response depends on.
+        """
+        query = urlencode(sorted(query_items), doseq=True)
+        versions = self.get_tag_versions(tags)
+        parts = [path, query, variant] + ['%s=%s' % tv for tv in zip(tags, versions)]
+        digest = hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest()
+        return '%s:response:%s' % (self.key_prefix, digest)
+
+
+class CountCache(TaggedCache):
+    """
+    Cache of exact queryset counts (e.g. the totals of paginated lists for each
+    combination of filters). Counts are tagged with the database tables of their
+    queries, which are invalidated whenever a row of the table is written.
+    """
+    key_prefix = 'collectionjson:count'
+    alias_setting = 'COLLECTIONJSON_COUNT_CACHE'
+    timeout_setting = 'COLLECTIONJSON_COUNT_CACHE_TIMEOUT'
+
+    def get_key(self, queryset):
+        """
+        Return the key of a queryset's count from its SQL query.
+        """
+        query = queryset.order_by().query
+        (sql, params) = query.sql_with_params()
+        tables = sorted(set(join.table_name for join in query.alias_map.values()))
+        versions = self.get_tag_versions(tables)
+        parts = [queryset.db, sql, repr(params)] + ['%s=%s' % tv for tv in
+                                                     zip(tables, versions)]
+        digest = hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest()
+        return '%s:%s' % (self.key_prefix, digest)
+
+    def count(self, queryset):
+        """
+        Return the cached count of a queryset, counting it on a cache miss.
+        """
+        if not self.enabled:
+            return queryset.count()
+        key = self.get_key(queryset)
+        count = self.get(key)
+        if count is None:
+            count = queryset.count()
+            self.set(key, count)
+        return count
+
+
+response_cache = ResponseCache()
+
+count_cache = CountCache()
+
+
+def invalidate_counts(sender, **kwargs):
+    """
+    Signal receiver that invalidates the cached counts of the queries over the table
+    of a model whose instances have been written.
+    """
+    count_cache.invalidate(sender._meta.db_table)
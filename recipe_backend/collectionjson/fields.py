@@ -1,7 +1,95 @@
+from rest_framework.fields import Field, SerializerMethodField, SkipField
+from rest_framework import relations
 
-from rest_framework.fields import SerializerMethodField
+from . import links
 
 
 class ItemLinkField(SerializerMethodField):
     def __init__(self, method_name, *args, **kwargs):
         super(ItemLinkField, self).__init__(method_name, *args, **kwargs)
+
+
+class CompiledLinkMixin(object):
+    """
+    Mixin for hyperlinked fields that builds urls from compiled link templates
+    instead of reversing the route for every object.
+    """
+
+    def get_url(self, obj, view_name, request, format):
+        # Unsaved objects will not yet have a valid URL.
+        if hasattr(obj, 'pk') and obj.pk in (None, ''):
+            return None
+        lookup_value = getattr(obj, self.lookup_field)
+        kwargs = {self.lookup_url_kwarg: lookup_value}
+        return links.reverse(view_name, kwargs=kwargs, request=request, format=format)
+
+
+class HyperlinkedRelatedField(CompiledLinkMixin, relations.HyperlinkedRelatedField):
+    pass
+
+
+class HyperlinkedIdentityField(CompiledLinkMixin, relations.HyperlinkedIdentityField):
+    pass
+
+
+# query parameter used by clients to request the embedding of related objects
+EXPAND_QUERY_PARAM = 'expand'
+
+
+def get_expanded_relations(request):
+    """
+    Return the set of relation names requested with the 'expand' query parameter
+    (a comma-separated list).
+    """
+    if request is None:
+        return frozenset()
+    value = request.query_params.get(EXPAND_QUERY_PARAM, '')
+    return frozenset(name.strip() for name in value.split(',') if name.strip())
+
+
+class EmbeddedField(Field):
+    """
+    A read-only field with the representations of related objects (or lists of
+    objects), given as a dictionary of relation names to serializers (e.g.
+    {'steps': StepSerializer(many=True)}). The field is only rendered when some of
+    its relations are requested with the 'expand' query parameter (or given in the
+    serializer context's 'expanded_relations') and then contains just those
+    relations.
+    """
+
+    def __init__(self, serializers, **kwargs):
+        kwargs['read_only'] = True
+        kwargs['source'] = '*'
+        super(EmbeddedField, self).__init__(**kwargs)
+        self.serializers = serializers
+
+    def bind(self, field_name, parent):
+        super(EmbeddedField, self).bind(field_name, parent)
+        for (name, serializer) in self.serializers.items():
+            serializer.bind(name, self)
+
+    def get_expanded(self):
+        """
+        Return the names of the requested relations.
+        """
+        try:
+            return self._expanded
+        except AttributeError:
+            expanded = self.context.get('expanded_relations')
+            if expanded is None:
+                expanded = get_expanded_relations(self.context.get('request'))
+            self._expanded = [name for name in self.serializers if name in expanded]
+            return self._expanded
+
+    def get_attribute(self, instance):
+        if not self.get_expanded():
+            raise SkipField()
+        return instance
+
+    def to_representation(self, instance):
+        ret = {}
+        for name in self.get_expanded():
+            serializer = self.serializers[name]
+            value = serializer.get_attribute(instance)
+            ret[name] = None if value is None else serializer.to_representation(value)
+        return ret
@@ -0,0 +1,136 @@
+
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.urls import get_resolver, get_script_prefix, get_urlconf
+from django.urls import reverse as django_reverse
+from django.utils.http import RFC3986_SUBDELIMS, escape_leading_slashes
+
+
+# characters that are never percent-encoded by the url reversing machinery
+_SAFE_CHARS = RFC3986_SUBDELIMS + '/~:@'
+_UNQUOTED_VALUE = re.compile(r'^[A-Za-z0-9_.~-]*$')
+
+
+class LinkTemplate(object):
+    """
+    A route compiled into a string template for a fixed set of url keyword
+    arguments. Formatting it produces the same path as django.urls.reverse().
+    """
+
+    def __init__(self, template, pattern, converters):
+        self.template = template
+        self.regex = re.compile(pattern)
+        self.converters = converters
+        # whether the template itself never needs to be percent-encoded
+        self.is_quoted = quote(template, safe=_SAFE_CHARS + '%') == template
+
+    def format(self, kwargs):
+        """
+        Return the path for the given url keyword arguments or None if they don't
+        match the route (the caller should then fall back to a full reverse).
+        """
+        converters = self.converters
+        subs = {}
+        needs_quoting = not self.is_quoted
+        for (k, v) in kwargs.items():
+            text = converters[k].to_url(v) if k in converters else str(v)
+            if not needs_quoting and not _UNQUOTED_VALUE.match(text):
+                needs_quoting = True
+            subs[k] = text
+        path = self.template % subs
+        if not self.regex.search(path):
+            return None
+        if needs_quoting:
+            path = quote(path, safe=_SAFE_CHARS)
+        return escape_leading_slashes(path)
+
+
+# process-wide cache of compiled link templates
+_link_templates = {}
+
+
+def compile_link_template(viewname, kwarg_names):
+    """
+    Compile the route of a view name into a link template for the given set of
+    url keyword argument names. Return None if no route takes exactly these
+    arguments.
+    """
+    prefix = get_script_prefix()
+    resolver = get_resolver(get_urlconf())
+    for (possibility, pattern, defaults, converters) in resolver.reverse_dict.getlist(
+            viewname):
+        for (result, params) in possibility:
+            if not defaults and set(params) == set(kwarg_names):
+                template = prefix.replace('%', '%%') + result
+                return LinkTemplate(template, '^%s%s' % (re.escape(prefix), pattern),
+                                    converters)
+    return None
+
+
+def get_link_template(viewname, kwarg_names):
+    """
+    Return the cached link template of a view name for the given set of url
+    keyword argument names, compiling it the first time it is requested.
+    """
+    key = (get_urlconf() or settings.ROOT_URLCONF, get_script_prefix(), viewname,
+           kwarg_names)
+    try:
+        return _link_templates[key]
+    except KeyError:
+        template = compile_link_template(viewname, kwarg_names)
+        _link_templates[key] = template
+        return template
+
+
+def use_relative_links():
+    """
+    Whether hrefs should be host-relative instead of absolute urls.
+    """
+    return getattr(settings, 'COLLECTIONJSON_RELATIVE_LINKS', False)
+
+
+def get_url_prefix(request):
+    """
+    Return the scheme and host prepended to the paths of a request's hrefs, or the
+    empty string when relative links are enabled. It is computed once per request.
+    """
+    if use_relative_links():
+        return ''
+    try:
+        return request._collectionjson_url_prefix
+    except AttributeError:
+        prefix = request.build_absolute_uri('/')[:-1]
+        request._collectionjson_url_prefix = prefix
+        return prefix
+
+
+def make_relative(request, url):
+    """
+    Strip the scheme and host from an absolute url of the current host when
+    relative links are enabled.
+    """
+    if url and use_relative_links():
+        prefix = request.build_absolute_uri('/')[:-1]
+        if url.startswith(prefix + '/'):
+            return url[len(prefix):]
+    return url
+
+
+def reverse(viewname, kwargs=None, request=None, format=None):
+    """
+    Fast replacement for rest_framework.reverse.reverse() (without versioning
+    support) based on compiled link templates. The url is absolute when a request
+    is given, unless relative links are enabled.
+    """
+    kwargs = dict(kwargs or {})
+    if format is not None:
+        kwargs['format'] = format
+    template = get_link_template(viewname, frozenset(kwargs))
+    path = template.format(kwargs) if template is not None else None
+    if path is None:
+        path = django_reverse(viewname, kwargs=kwargs)
+    if request is None:
+        return path
+    return get_url_prefix(request) + path
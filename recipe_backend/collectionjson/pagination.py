@@ -0,0 +1,286 @@
+
+import json
+import operator
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from functools import reduce
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Count, Max, Q
+
+from rest_framework import exceptions, pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .cache import count_cache
+
+
+def get_estimated_count(queryset):
+    """
+    Return the PostgreSQL planner's estimate of the number of rows of a queryset or
+    None if the database is not PostgreSQL.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    (sql, params) = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class LimitOffsetPagination(pagination.LimitOffsetPagination):
+    """
+    Limit/offset pagination that can also hand out the requested page as an
+    unevaluated queryset, so that callers can iterate it with a server-side cursor
+    instead of loading the whole page into memory.
+    Totals are taken from the shared count cache or, for lists estimated to be
+    larger than the COLLECTIONJSON_ESTIMATED_COUNT_THRESHOLD setting, from the
+    database planner's estimate. The paginated data tells whether the total
+    ('count') is an estimate ('count_estimated'). A total already computed by
+    get_count_and_latest (e.g. for the response's validators) is reused when the
+    same query is paginated.
+    """
+    count_estimated = False
+    counted = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page = self.paginate_queryset_lazily(queryset, request, view)
+        if page is None:
+            return None
+        return list(page)
+
+    def paginate_queryset_lazily(self, queryset, request, view=None):
+        """
+        Same as paginate_queryset but the page is returned as a sliced (unevaluated)
+        queryset, unless the total is an estimate.
+        """
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.count = self.get_count(queryset)
+        self.offset = self.get_offset(request)
+        self.request = request
+        if self.count > self.limit and self.template is not None:
+            self.display_page_controls = True
+
+        if self.count_estimated:
+            # an estimate can't tell whether there are more rows after the page
+            rows = list(queryset[self.offset:self.offset + self.limit + 1])
+            self.has_next = len(rows) > self.limit
+            return rows[:self.limit]
+        if self.count == 0 or self.offset > self.count:
+            return []
+        return queryset[self.offset:self.offset + self.limit]
+
+    def get_count(self, queryset):
+        """
+        Overriden to estimate large totals and take exact ones from the count cache.
+        """
+        self.count_estimated = False
+        if not hasattr(queryset, 'query'):
+            return len(queryset)
+        key = self.get_count_key(queryset)
+        if self.counted is not None and self.counted[0] == key:
+            (key, count, self.count_estimated) = self.counted
+            return count
+        estimate = self.get_large_estimate(queryset)
+        if estimate is not None:
+            self.count_estimated = True
+            return estimate
+        return count_cache.count(queryset)
+
+    def get_count_and_latest(self, queryset, field_name):
+        """
+        Return the total of a queryset, estimated or exact as get_count does, and the
+        latest value of one of its fields with a single query: an exact total that
+        isn't in the count cache is counted by the same aggregate query. The total is
+        kept for the pagination of the same query.
+        """
+        queryset = queryset.order_by()
+        self.count_estimated = False
+        count = self.get_large_estimate(queryset)
+        if count is not None:
+            self.count_estimated = True
+        elif count_cache.enabled:
+            cache_key = count_cache.get_key(queryset)
+            count = count_cache.get(cache_key)
+        if count is not None:
+            latest = queryset.aggregate(latest=Max(field_name))['latest']
+        else:
+            aggregates = queryset.aggregate(latest=Max(field_name), count=Count('pk'))
+            (latest, count) = (aggregates['latest'], aggregates['count'])
+            if count_cache.enabled:
+                count_cache.set(cache_key, count)
+        self.counted = (self.get_count_key(queryset), count, self.count_estimated)
+        return count, latest
+
+    def get_count_key(self, queryset):
+        (sql, params) = queryset.order_by().query.sql_with_params()
+        return queryset.db, sql, params
+
+    def get_large_estimate(self, queryset):
+        """
+        Return the planner's estimate of the total of a queryset if it's above the
+        COLLECTIONJSON_ESTIMATED_COUNT_THRESHOLD setting, otherwise None.
+        """
+        threshold = getattr(settings, 'COLLECTIONJSON_ESTIMATED_COUNT_THRESHOLD', None)
+        if threshold is None:
+            return None
+        estimate = get_estimated_count(queryset)
+        if estimate is not None and estimate > threshold:
+            return estimate
+        return None
+
+    def get_next_link(self):
+        if not self.count_estimated:
+            return super(LimitOffsetPagination, self).get_next_link()
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('count_estimated', self.count_estimated),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+
+class KeysetPagination(LimitOffsetPagination):
+    """
+    Limit/offset pagination that switches to keyset pagination when the request
+    has a 'cursor' query parameter (empty for the first page). The queryset is then
+    ordered by the view's 'keyset_fields' (which must be unique together, e.g.
+    ('name', 'id')) and each page is selected with a WHERE clause on the values of
+    the last (or first) row of the previous (or next) page instead of an OFFSET, so
+    that any page costs the same as the first one. The opaque cursors of the next
+    and previous pages are given in the usual 'next' and 'previous' links. Querysets
+    with an ordering of their own (e.g. ranked by relevance) can't be paginated by
+    keyset: a cursor is then rejected instead of silently changing their order.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    ordered_cursor_message = 'A cursor can not be used with a ranked list.'
+
+    def paginate_queryset_lazily(self, queryset, request, view=None):
+        """
+        Overriden to paginate by keyset when a cursor is requested. Keyset pages are
+        always evaluated (one extra row is fetched to know whether there is a next
+        page).
+        """
+        self.cursor = None
+        if self.cursor_query_param not in request.query_params:
+            return super(KeysetPagination, self).paginate_queryset_lazily(
+                queryset, request, view)
+
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.request = request
+        self.keyset_fields = tuple(getattr(view, 'keyset_fields', ('pk',)))
+        ordering = tuple(queryset.query.order_by)
+        if ordering and ordering != self.keyset_fields:
+            raise exceptions.ValidationError(
+                {self.cursor_query_param: [self.ordered_cursor_message]})
+        self.cursor = self.decode_cursor(request, queryset.model)
+        (position, reverse) = self.cursor
+        self.count = self.get_count(queryset)
+
+        ordering = [('-' if reverse else '') + f for f in self.keyset_fields]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(position, reverse))
+        rows = list(queryset[:self.limit + 1])
+        has_more = len(rows) > self.limit
+        rows = rows[:self.limit]
+        if reverse:
+            rows.reverse()
+            (self.has_next, self.has_previous) = (position is not None, has_more)
+        else:
+            (self.has_next, self.has_previous) = (has_more, position is not None)
+        self.page_positions = [self.get_position(rows[0]),
+                               self.get_position(rows[-1])] if rows else []
+        return rows
+
+    def get_position_filter(self, position, reverse):
+        """
+        Return the filter selecting the rows strictly after (or before when reverse
+        is true) a position in the keyset ordering.
+        """
+        lookup = 'lt' if reverse else 'gt'
+        clauses = []
+        for (i, field) in enumerate(self.keyset_fields):
+            clause = {f: v for (f, v) in zip(self.keyset_fields[:i], position[:i])}
+            clause['%s__%s' % (field, lookup)] = position[i]
+            clauses.append(Q(**clause))
+        return reduce(operator.or_, clauses)
+
+    def get_position(self, obj):
+        return [getattr(obj, field) for field in self.keyset_fields]
+
+    def decode_cursor(self, request, model):
+        """
+        Return the (position, reverse) pair encoded in the request's cursor. The
+        position's values are converted to the types of the model's keyset fields.
+        """
+        encoded = request.query_params[self.cursor_query_param]
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(b64decode(encoded.encode('ascii')).decode('utf-8'))
+            (position, reverse) = (cursor['p'], bool(cursor.get('r')))
+            if not isinstance(position, list) or len(position) != len(self.keyset_fields):
+                raise ValueError('Invalid position')
+            position = [self.to_python(model, field, value)
+                        for (field, value) in zip(self.keyset_fields, position)]
+        except (TypeError, ValueError, KeyError, UnicodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def to_python(self, model, field_name, value):
+        """
+        Convert a position value to the type of a model's keyset field.
+        """
+        if value is None:
+            raise ValueError('Null position value')
+        opts = model._meta
+        field = opts.pk if field_name == 'pk' else opts.get_field(field_name)
+        return field.to_python(value)
+
+    def encode_cursor(self, position, reverse):
+        """
+        Return the url of the page after (or before when reverse is true) a position.
+        """
+        cursor = {'p': position}
+        if reverse:
+            cursor['r'] = 1
+        encoded = b64encode(json.dumps(cursor, default=str).encode('utf-8'))
+        url = remove_query_param(self.request.build_absolute_uri(), self.offset_query_param)
+        return replace_query_param(url, self.cursor_query_param, encoded.decode('ascii'))
+
+    def get_next_link(self):
+        if self.cursor is None:
+            return super(KeysetPagination, self).get_next_link()
+        if not (self.has_next and self.page_positions):
+            return None
+        return self.encode_cursor(self.page_positions[1], False)
+
+    def get_previous_link(self):
+        if self.cursor is None:
+            return super(KeysetPagination, self).get_previous_link()
+        if not (self.has_previous and self.page_positions):
+            return None
+        return self.encode_cursor(self.page_positions[0], True)
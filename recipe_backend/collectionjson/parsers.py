@@ -5,17 +5,23 @@ class CollectionJsonParser(JSONParser):
     media_type = 'application/vnd.collection+json'
 
     def validate_data(self, stream_data):
+        """
+        Return the dictionary of values of a template. A list of templates (bulk
+        mode) is also accepted in which case a list of dictionaries is returned.
+        """
         template_valid_str = "Valid format: {template:{data:[{name: ,value: },...]}}"
+        template_valid_str += " or {template:[{data:[{name: ,value: },...]},...]}"
 
         if not isinstance(stream_data, dict):
             detail = "Template is not a dictionary. "
             detail += template_valid_str
             raise ParseError(detail=detail)
 
-        json_data = {}
         try:
-            for x in stream_data['template']['data']:
-                json_data[x['name']] = x['value']
+            template = stream_data['template']
+            if isinstance(template, list):
+                return [self._get_template_values(t) for t in template]
+            return self._get_template_values(template)
         except KeyError as e:
             detail = "%s field required. " % e 
             detail += template_valid_str  
@@ -24,7 +30,12 @@ class CollectionJsonParser(JSONParser):
             detail = "Invalid data provided. "
             detail += template_valid_str  
             raise ParseError(detail=detail)
-        return json_data 
+
+    def _get_template_values(self, template):
+        json_data = {}
+        for x in template['data']:
+            json_data[x['name']] = x['value']
+        return json_data
 
     def parse(self, stream, media_type=None, parser_context=None):
         stream_data = super(CollectionJsonParser, self).parse(stream, media_type,
@@ -2,14 +2,141 @@ import json
 
 from rest_framework.serializers import HyperlinkedRelatedField, HyperlinkedIdentityField
 from rest_framework.serializers import HyperlinkedModelSerializer, ManyRelatedField
+from rest_framework.serializers import ListSerializer
 from rest_framework.renderers import JSONRenderer
+from rest_framework.compat import SHORT_SEPARATORS, LONG_SEPARATORS
 
-from .fields import ItemLinkField
+from .fields import EmbeddedField, ItemLinkField
+from .links import make_relative, use_relative_links
+
+
+class RenderingPlan(object):
+    """
+    Precompiled description of how the items produced by a serializer class are
+    transformed into Collection+JSON items. Computing it requires introspecting the
+    serializer's fields so it is done once per serializer class and then reused to
+    transform every item of every response.
+    """
+
+    def __init__(self, serializer):
+        fields = serializer.fields.items()
+        if isinstance(serializer, HyperlinkedModelSerializer):
+            self.id_field = serializer.url_field_name
+        else:
+            self.id_field = None
+        # (field name, whether the field always renders a list of links)
+        self.link_fields = tuple((k, isinstance(v, ManyRelatedField))
+                                 for (k, v) in fields
+                                 if k != self.id_field and self._is_link_field(v))
+        # (field name, {relation name: rendering plan of the embedded items})
+        self.embedded_fields = tuple((k, self._get_embedded_plans(v))
+                                     for (k, v) in fields
+                                     if isinstance(v, EmbeddedField))
+        self.excluded_fields = frozenset([k for (k, m) in self.link_fields] +
+                                         [k for (k, p) in self.embedded_fields] +
+                                         [self.id_field])
+
+    @staticmethod
+    def _get_embedded_plans(field):
+        plans = {}
+        for (name, serializer) in field.serializers.items():
+            if isinstance(serializer, ListSerializer):
+                serializer = serializer.child
+            plans[name] = RenderingPlan(serializer)
+        return plans
+
+    @staticmethod
+    def _is_link_field(field):
+        return (isinstance(field, HyperlinkedRelatedField)
+                or isinstance(field, HyperlinkedIdentityField)
+                or isinstance(field, ItemLinkField)
+                or (isinstance(field, ManyRelatedField)
+                    and isinstance(field.child_relation, HyperlinkedRelatedField)))
+
+    def transform_item(self, item):
+        """
+        Transform a serialized item (dictionary) into a Collection+JSON item. The
+        representations of embedded related objects are transformed into items too
+        and given in the item's (non-standard) 'embedded' property.
+        """
+        excluded = self.excluded_fields
+        result = {'data': [{'name': k, 'value': v} for (k, v) in item.items()
+                           if k not in excluded]}
+        if self.id_field:
+            result['href'] = item[self.id_field]
+        links = []
+        for (name, many) in self.link_fields:
+            value = item[name]
+            if value is None:
+                continue
+            if many or isinstance(value, list):
+                links.extend([{'rel': name, 'href': x} for x in value])
+            else:
+                links.append({'rel': name, 'href': value})
+        if links:
+            result['links'] = links
+        for (name, plans) in self.embedded_fields:
+            if name not in item:
+                continue
+            embedded = {}
+            for (relation, value) in item[name].items():
+                if value is None:
+                    value = []
+                elif not isinstance(value, list):
+                    value = [value]
+                embedded[relation] = [plans[relation].transform_item(x) for x in value]
+            result['embedded'] = embedded
+        return result
+
+
+class RenderedItem(dict):
+    """
+    A serialized item that also carries its already encoded Collection+JSON item in
+    the 'rendered' attribute (e.g. retrieved from the fragment cache), so that the
+    renderer can splice it into the document as is.
+    """
+
+    def __init__(self, data, rendered):
+        super(RenderedItem, self).__init__(data)
+        self.rendered = rendered
 
 
 class CollectionJsonRenderer(JSONRenderer):
     media_type = 'application/vnd.collection+json'
     format = 'collection+json'
+    # approximate size in characters of the chunks yielded by render_stream()
+    stream_chunk_size = 64 * 1024
+
+    # process-wide caches of rendering plans (keyed by serializer class) and of
+    # whether a view class is the API root (keyed by view class)
+    _rendering_plans = {}
+    _api_root_views = {}
+
+    def get_rendering_plan(self, view):
+        """
+        Return the cached rendering plan for the view's serializer class, compiling
+        it the first time the class is seen.
+        """
+        serializer_class = view.get_serializer_class()
+        plan = self._rendering_plans.get(serializer_class)
+        if plan is None:
+            plan = RenderingPlan(view.get_serializer())
+            self._rendering_plans[serializer_class] = plan
+        return plan
+
+    def _is_api_root(self, view):
+        view_class = type(view)
+        is_root = self._api_root_views.get(view_class)
+        if is_root is None:
+            # This lookup of the Api Root string isn't
+            # the right long-term approach. Even if we
+            # looked it up properly from the default
+            # router, we would still need to handle
+            # custom routers. Works okay for now.
+            # ------------------------------------------
+            is_root = view.get_view_name() == 'Api Root'
+            self._api_root_views[view_class] = is_root
+        return is_root
 
     def _transform_field(self, key, value):
         return {'name': key, 'value': value}
@@ -18,77 +145,32 @@ class CollectionJsonRenderer(JSONRenderer):
         data = [self._transform_field(k, v) for (k, v) in item.items()]
         return {'data': data}
 
-    def _get_id_field(self, serializer):
-        if isinstance(serializer, HyperlinkedModelSerializer):
-            return serializer.url_field_name
-        else:
-            return None
-
-    def _get_related_fields(self, fields, id_field):
-        return [k for (k, v) in fields
-                if k != id_field
-                and (isinstance(v, HyperlinkedRelatedField)
-                     or isinstance(v, HyperlinkedIdentityField)
-                     or isinstance(v, ItemLinkField)
-                     or (isinstance(v, ManyRelatedField)
-                         and isinstance(v.child_relation, HyperlinkedRelatedField)))]
-
     def _make_link(self, rel, href):
         return {'rel': rel, 'href': href}
 
-    def _get_item_field_links(self, field_name, item):
-        data = item[field_name]
-
-        if data is None:
-            return []
-        elif isinstance(data, list):
-            return [self._make_link(field_name, x) for x in data]
-        else:
-            return [self._make_link(field_name, data)]
-
-    def _transform_item(self, serializer, item):
-        fields = serializer.fields.items()
-        id_field = self._get_id_field(serializer)
-        related_fields = self._get_related_fields(fields, id_field)
-
-        data = [self._transform_field(k, item[k])
-                for k in item.keys()
-                if k != id_field and k not in related_fields]
-        result = {'data': data}
-
-        if id_field:
-            result['href'] = item[id_field]
-
-        links = []
-        for x in related_fields:
-            links.extend(self._get_item_field_links(x, item))
-
-        if links:
-            result['links'] = links
-
-        return result
-
     def _transform_items(self, view, data):
         if isinstance(data, dict):
             data = [data]
 
         if hasattr(view, 'get_serializer'):
-            serializer = view.get_serializer()
-            return map(lambda x: self._transform_item(serializer, x), data)
+            transform_item = self.get_rendering_plan(view).transform_item
+            return [x if isinstance(x, RenderedItem) else transform_item(x)
+                    for x in data]
         else:
-            return map(self._simple_transform_item, data)
+            return [self._simple_transform_item(x) for x in data]
 
     def _is_paginated(self, data):
         pagination_keys = ('next', 'previous', 'results')
         return all(k in data for k in pagination_keys)
 
-    def _get_pagination_links(self, data):
+    def _get_pagination_links(self, request, data):
         results = []
         if data.get('next', None):
-            results.append(self._make_link('next', data['next']))
+            results.append(self._make_link('next', make_relative(request, data['next'])))
 
         if data.get('previous', None):
-            results.append(self._make_link('previous', data['previous']))
+            results.append(self._make_link('previous',
+                                           make_relative(request, data['previous'])))
 
         return results
 
@@ -103,25 +185,18 @@ class CollectionJsonRenderer(JSONRenderer):
             }
         }
 
-    def _get_items_and_links(self, view, data):
-        # This lookup of the Api Root string isn't
-        # the right long-term approach. Even if we
-        # looked it up properly from the default
-        # router, we would still need to handle
-        # custom routers. Works okay for now.
-        # ------------------------------------------
-
+    def _get_items_and_links(self, request, view, data):
         links = []
         if 'collection_links' in data:
             l = data.pop('collection_links')
             links = [self._make_link(key, l[key]) for key in l.keys()]
 
-        if view.get_view_name() == 'Api Root':
-            links = links.extend([self._make_link(key, data[key]) for key in data.keys()])
+        if self._is_api_root(view):
+            links.extend([self._make_link(key, data[key]) for key in data.keys()])
             items = []
         else:
             if self._is_paginated(data):
-                links.extend(self._get_pagination_links(data))
+                links.extend(self._get_pagination_links(request, data))
                 data = self._get_items_from_paginated_data(data)
 
             items = self._transform_items(view, data)
@@ -132,6 +207,8 @@ class CollectionJsonRenderer(JSONRenderer):
         }
 
     def get_href(self, request):
+        if use_relative_links():
+            return request.get_full_path()
         return request.build_absolute_uri()
 
     def _transform_data(self, request, response, view, data):
@@ -140,20 +217,30 @@ class CollectionJsonRenderer(JSONRenderer):
             "href": self.get_href(request),
         }
 
+        # document-level properties must be removed from the data before the items
+        # are transformed (a detail view's data is itself the item)
+        queries = template = None
+        if isinstance(data, dict):
+            queries = data.pop('queries', None)
+            template = data.pop('template', None)
+
         if response.exception:
             collection.update(self._get_error(data))
         else:
-            collection.update(self._get_items_and_links(view, data))
+            collection.update(self._get_items_and_links(request, view, data))
 
-        if 'queries' in data:
-            collection['queries'] = data.pop('queries')
+        if queries is not None:
+            collection['queries'] = queries
 
-        if 'template' in data:
-            collection['template'] = data.pop('template')
+        if template is not None:
+            collection['template'] = template
 
         if 'count' in data:
             collection['total'] = data['count']
 
+        if 'count_estimated' in data:
+            collection['total_estimated'] = data['count_estimated']
+
         return {'collection': collection}
 
     def render(self, data, media_type=None, renderer_context=None):
@@ -163,6 +250,113 @@ class CollectionJsonRenderer(JSONRenderer):
 
         if data:
             data = self._transform_data(request, response, view, data)
+            items = data['collection'].get('items')
+            if items and any(isinstance(x, RenderedItem) for x in items):
+                collection = data['collection']
+                del collection['items']
+                return b''.join(self._render_chunks(collection, items))
 
         return super(CollectionJsonRenderer, self).render(data, media_type,
                                                           renderer_context)
+
+    def _encode(self, data):
+        separators = SHORT_SEPARATORS if self.compact else LONG_SEPARATORS
+        ret = json.dumps(data, cls=self.encoder_class, ensure_ascii=self.ensure_ascii,
+                         allow_nan=not self.strict, separators=separators)
+        # same escaping of the unicode line separators as JSONRenderer.render()
+        return ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+
+    def render_stream(self, data, items, renderer_context=None):
+        """
+        Return a generator that encodes a Collection+JSON document in chunks. The
+        document-level properties in 'data' (paginated data whose 'results' are
+        ignored) are encoded first, then each element of the 'items' iterable
+        (serialized representations) is transformed and encoded as soon as it is
+        produced so that the whole collection is never held in memory.
+        """
+        request = renderer_context['request']
+        view = renderer_context['view']
+        response = renderer_context['response']
+
+        data = dict(data, results=[])
+        collection = self._transform_data(request, response, view, data)['collection']
+        del collection['items']
+        transform_item = self.get_rendering_plan(view).transform_item
+        items = (x if isinstance(x, RenderedItem) else transform_item(x) for x in items)
+        return self._render_chunks(collection, items)
+
+    def render_item(self, view, item):
+        """
+        Return the encoded Collection+JSON item for a serialized item of a view.
+        """
+        return self._encode(self.get_rendering_plan(view).transform_item(item))
+
+    def _render_chunks(self, collection, items):
+        """
+        Generator that encodes a collection (without its items) followed by the
+        already transformed items, splicing in those that are already rendered.
+        """
+        head = ','.join('%s:%s' % (self._encode(k), self._encode(v))
+                        for (k, v) in collection.items())
+        buffer = ['{"collection":{%s,"items":[' % head]
+        size = len(buffer[0])
+
+        separator = ''
+        for item in items:
+            if isinstance(item, RenderedItem):
+                chunk = separator + item.rendered
+            else:
+                chunk = separator + self._encode(item)
+            separator = ','
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= self.stream_chunk_size:
+                yield ''.join(buffer).encode('utf-8')
+                buffer = []
+                size = 0
+        buffer.append(']}}')
+        yield ''.join(buffer).encode('utf-8')
+
+
+class NDJSONRenderer(JSONRenderer):
+    """
+    Renderer of newline delimited JSON: one compact JSON document per line. Lists
+    are streamed with render_stream(), with one line per item, so that whole
+    catalogs can be exported. Other data (e.g. errors) is rendered as a single line.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+    compact = True
+    # approximate size in characters of the chunks yielded by render_stream()
+    stream_chunk_size = 64 * 1024
+
+    def render(self, data, media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return super(NDJSONRenderer, self).render(data, media_type,
+                                                  renderer_context) + b'\n'
+
+    def _encode(self, data):
+        ret = json.dumps(data, cls=self.encoder_class, ensure_ascii=self.ensure_ascii,
+                         allow_nan=not self.strict, separators=SHORT_SEPARATORS)
+        return ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+
+    def render_stream(self, data, items, renderer_context=None):
+        """
+        Return a generator that encodes each element of the 'items' iterable
+        (serialized representations) as a line as soon as it is produced. The
+        document-level properties in 'data' are ignored.
+        """
+        buffer = []
+        size = 0
+        for item in items:
+            line = self._encode(item) + '\n'
+            buffer.append(line)
+            size += len(line)
+            if size >= self.stream_chunk_size:
+                yield ''.join(buffer).encode('utf-8')
+                buffer = []
+                size = 0
+        if buffer:
+            yield ''.join(buffer).encode('utf-8')
@@ -0,0 +1,29 @@
+
+from django.http import StreamingHttpResponse
+
+
+class StreamingCollectionResponse(StreamingHttpResponse):
+    """
+    A streaming response whose Collection+JSON document is encoded incrementally by
+    the view's accepted renderer (a CollectionJsonRenderer or NDJSONRenderer). Like
+    a DRF Response it exposes a 'data' dictionary with the document-level
+    properties (pagination data, links, queries and template) that can still be
+    modified after the response is created, as long as its content hasn't started
+    being consumed.
+    """
+    exception = False
+
+    def __init__(self, data, items, view, status=None):
+        self.data = data
+        self.items = items
+        self.view = view
+        renderer = view.request.accepted_renderer
+        super(StreamingCollectionResponse, self).__init__(self._stream(renderer),
+                                                          status=status,
+                                                          content_type=renderer.media_type)
+
+    def _stream(self, renderer):
+        renderer_context = {'request': self.view.request, 'view': self.view,
+                            'response': self}
+        for chunk in renderer.render_stream(self.data, self.items, renderer_context):
+            yield chunk
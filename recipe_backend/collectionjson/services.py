@@ -1,10 +1,178 @@
 
+import calendar
+import hashlib
+import itertools
+import re
 from urllib.parse import urlparse
 
-from django.urls import resolve
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import Count, Max, prefetch_related_objects
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.utils.text import compress_sequence
+from django.urls import get_script_prefix, get_urlconf, resolve
 
 from rest_framework.response import Response
-from rest_framework import serializers
+from rest_framework import serializers, status
+
+from .cache import fragment_cache, response_cache
+from .fields import EmbeddedField, get_expanded_relations
+from .links import get_url_prefix, reverse
+from .renderers import CollectionJsonRenderer, RenderedItem
+from .responses import StreamingCollectionResponse
+
+
+# query parameter used by clients to request a streamed list response
+STREAM_QUERY_PARAM = 'stream'
+
+# number of rows fetched at a time from the database's server-side cursor when
+# streaming a list response
+STREAM_CURSOR_CHUNK_SIZE = 500
+
+_ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+
+
+def is_streaming_requested(request):
+    """
+    Convenience function to check whether a request asks for a streamed
+    collection+json response.
+    """
+    value = request.query_params.get(STREAM_QUERY_PARAM, '')
+    return (value.lower() in ('1', 'true', 'yes') and
+            isinstance(request.accepted_renderer, CollectionJsonRenderer))
+
+
+def iter_representations(view_instance, objects):
+    """
+    Convenience generator yielding the serialized representation of each object
+    for a view instance. When the response is rendered as collection+json the
+    representations are taken from the rendered fragment cache if possible and
+    otherwise stored there.
+    """
+    request = view_instance.request
+    serializer = view_instance.get_serializer()
+    renderer = getattr(request, 'accepted_renderer', None)
+    if not (fragment_cache.enabled and isinstance(renderer, CollectionJsonRenderer)):
+        for obj in objects:
+            yield serializer.to_representation(obj)
+        return
+
+    serializer_class = type(serializer)
+    variant = (get_url_prefix(request), get_expanded_relations(request))
+    for obj in objects:
+        key = fragment_cache.get_key(serializer_class, obj, variant)
+        if key is None:
+            yield serializer.to_representation(obj)
+            continue
+        item = fragment_cache.get(obj, key)
+        if item is None:
+            data = serializer.to_representation(obj)
+            item = RenderedItem(data, renderer.render_item(view_instance, data))
+            fragment_cache.set(obj, key, item)
+        # the response's data might be modified so a copy is returned
+        yield RenderedItem(item, item.rendered)
+
+
+def expand_queryset(view_instance, queryset):
+    """
+    Convenience function to load the related objects requested with the 'expand'
+    query parameter (the relations of the view serializer's embedded fields) along
+    with a view's queryset in a fixed number of queries. Forward foreign keys are
+    joined and any other relation is prefetched.
+    """
+    expanded = get_expanded_relations(view_instance.request)
+    if not expanded:
+        return queryset
+    opts = queryset.model._meta
+    for field in view_instance.get_serializer().fields.values():
+        if not isinstance(field, EmbeddedField):
+            continue
+        for (name, serializer) in field.serializers.items():
+            if name not in expanded:
+                continue
+            model_field = opts.get_field(serializer.source)
+            if model_field.concrete and (model_field.many_to_one or
+                                         model_field.one_to_one):
+                queryset = queryset.select_related(serializer.source)
+            else:
+                queryset = queryset.prefetch_related(serializer.source)
+    return queryset
+
+
+def get_streaming_list_response(list_view_instance, queryset):
+    """
+    Convenience function to get a streaming HTTP response with a list of objects
+    from a list view instance and a queryset. The requested page is iterated with a
+    server-side cursor, its related objects are prefetched in chunks and each
+    object is serialized and rendered on the fly.
+    """
+    request = list_view_instance.request
+    paginator = list_view_instance.paginator
+    if paginator is None:
+        page = None
+    elif hasattr(paginator, 'paginate_queryset_lazily'):
+        page = paginator.paginate_queryset_lazily(queryset, request,
+                                                  view=list_view_instance)
+    else:
+        page = paginator.paginate_queryset(queryset, request, view=list_view_instance)
+
+    if page is None:
+        page = queryset
+        data = {'next': None, 'previous': None, 'results': []}
+    else:
+        data = paginator.get_paginated_response([]).data
+
+    if hasattr(page, 'iterator'):
+        # iterator() ignores the prefetched relations (e.g. the expanded ones), which
+        # are prefetched for each chunk of objects instead
+        lookups = page._prefetch_related_lookups
+        objects = iter_prefetched(page.prefetch_related(None), STREAM_CURSOR_CHUNK_SIZE,
+                                  *lookups)
+    else:
+        objects = iter(page)
+    items = iter_representations(list_view_instance, objects)
+    return StreamingCollectionResponse(data, items, list_view_instance)
+
+
+def iter_prefetched(queryset, chunk_size, *lookups):
+    """
+    Convenience generator yielding the objects of a queryset iterated with a
+    server-side cursor, whose related objects (the prefetch lookups) are loaded
+    for each chunk of objects fetched from the cursor. Only one chunk of objects
+    and their related objects are held in memory at any time.
+    """
+    objects = queryset.iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(itertools.islice(objects, chunk_size))
+        if not chunk:
+            return
+        prefetch_related_objects(chunk, *lookups)
+        for obj in chunk:
+            yield obj
+
+
+def get_export_response(view_instance, queryset, *lookups):
+    """
+    Convenience function to get a streaming HTTP response with the representations
+    of all the objects of a queryset (whose related objects in 'lookups' are
+    prefetched in chunks) rendered by the view's accepted renderer (collection+json
+    or NDJSON). The response is gzip compressed on the fly if the client accepts
+    it.
+    """
+    request = view_instance.request
+    serializer = view_instance.get_serializer()
+    objects = iter_prefetched(queryset, STREAM_CURSOR_CHUNK_SIZE, *lookups)
+    items = (serializer.to_representation(obj) for obj in objects)
+    data = {'next': None, 'previous': None, 'results': []}
+    response = StreamingCollectionResponse(data, items, view_instance)
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if _ACCEPTS_GZIP.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+        response.streaming_content = compress_sequence(response.streaming_content)
+        response['Content-Encoding'] = 'gzip'
+    return response
 
 
 def get_list_response(list_view_instance, queryset):
@@ -12,15 +180,203 @@ def get_list_response(list_view_instance, queryset):
     Convenience function to get an HTTP response with a list of objects
     from a list view instance and a queryset
     """
+    if is_streaming_requested(list_view_instance.request):
+        return get_streaming_list_response(list_view_instance, queryset)
+
     page = list_view_instance.paginate_queryset(queryset)
     if page is not None:
-        serializer = list_view_instance.get_serializer(page, many=True)
-        return list_view_instance.get_paginated_response(serializer.data)
+        data = list(iter_representations(list_view_instance, page))
+        return list_view_instance.get_paginated_response(data)
+
+    data = list(iter_representations(list_view_instance, queryset))
+    return Response(data)
+
 
-    serializer = list_view_instance.get_serializer(queryset, many=True)
+def get_detail_response(detail_view_instance, instance):
+    """
+    Convenience function to get an HTTP response with the representation of an
+    object from a detail view instance.
+    """
+    (data,) = iter_representations(detail_view_instance, [instance])
+    return Response(data)
+
+
+def get_bulk_create_response(list_view_instance, data):
+    """
+    Convenience function to get an HTTP response from a list view instance after
+    validating a list of items in one pass and creating them all in a single
+    transaction through the view's perform_create. The view's object (the items'
+    parent) is looked up and its permissions checked before the items are
+    validated, so a missing or forbidden parent isn't answered with their errors.
+    """
+    list_view_instance.get_object()
+    serializer = list_view_instance.get_serializer(data=data, many=True)
+    serializer.is_valid(raise_exception=True)
+    with transaction.atomic():
+        list_view_instance.perform_create(serializer)
+    return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+def get_bulk_replace_response(list_view_instance, data):
+    """
+    Convenience function to get an HTTP response from a list view instance after
+    replacing its whole list of items in a single transaction through the view's
+    perform_replace. The items are given in their new order: existing ones by their
+    'id' (other values are optional and update the item) and new ones without it.
+    The response contains the new list. As for bulk creations, the view's object is
+    looked up and its permissions checked before the items are validated.
+    """
+    list_view_instance.get_object()
+    if not isinstance(data, list):
+        raise serializers.ValidationError(
+            {'non_field_errors': ["Expected a list of items."]})
+    serializer = list_view_instance.get_serializer(data=data, many=True, partial=True)
+    serializer.is_valid(raise_exception=True)
+    items = []
+    for (values, attrs) in zip(data, serializer.validated_data):
+        pk = values.get('id')
+        if pk is None and not attrs:
+            raise serializers.ValidationError(
+                {'non_field_errors': ["New items require values."]})
+        try:
+            items.append((None if pk is None else int(pk), attrs))
+        except (TypeError, ValueError):
+            raise serializers.ValidationError({'id': ["A valid integer is required."]})
+    try:
+        with transaction.atomic():
+            instances = list_view_instance.perform_replace(items)
+    except DjangoValidationError as e:
+        raise serializers.ValidationError({'non_field_errors': e.messages})
+    serializer = list_view_instance.get_serializer(instances, many=True)
     return Response(serializer.data)
 
 
+def get_validators(view_instance, last_modified, *extra_validators):
+    """
+    Convenience function to get the validators (strong ETag, Last-Modified
+    timestamp) of a view's response from the last modification datetime of the
+    underlying data. The ETag also depends on the requested url, the accepted media
+    type, the url prefix of the hrefs and any given extra validators (e.g. a count of
+    objects or the id of a user whose data is included in the response).
+    """
+    request = view_instance.request
+    timestamp = calendar.timegm(last_modified.utctimetuple()) if last_modified else None
+    parts = [request.get_full_path(), request.accepted_media_type or '',
+             get_url_prefix(request), last_modified.isoformat() if last_modified else '']
+    parts.extend(str(x) for x in extra_validators)
+    etag = '"%s"' % hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest()
+    return etag, timestamp
+
+
+def get_list_validators(list_view_instance, queryset, *extra_validators):
+    """
+    Convenience function to get the validators of a list view's response computed
+    with a single aggregate query over the (filtered) queryset: the last
+    modification time and number of its objects (which changes when some are
+    deleted). The number is the total of the view's paginator, which is taken from
+    the count cache or estimated for large lists and is then not counted again when
+    the list is paginated. Only the ETag is given: the last modification time of the
+    objects doesn't change when some are deleted or stop matching the filters, so it
+    can't be used as a Last-Modified timestamp.
+    """
+    paginator = list_view_instance.paginator
+    if hasattr(paginator, 'get_count_and_latest'):
+        (count, last_modified) = paginator.get_count_and_latest(queryset, 'modified')
+    else:
+        aggregates = queryset.order_by().aggregate(last_modified=Max('modified'),
+                                                   count=Count('pk'))
+        (count, last_modified) = (aggregates['count'], aggregates['last_modified'])
+    (etag, timestamp) = get_validators(list_view_instance, last_modified, count,
+                                       *extra_validators)
+    return etag, None
+
+
+def get_not_modified_response(request, validators):
+    """
+    Convenience function to get a 304 Not Modified (or 412 Precondition Failed)
+    response when the request's conditional headers match the validators, otherwise
+    None is returned.
+    """
+    (etag, timestamp) = validators
+    return get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+
+def set_validator_headers(response, validators):
+    """
+    Convenience function to set the ETag and Last-Modified headers of a response.
+    """
+    (etag, timestamp) = validators
+    response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    return response
+
+
+def get_response_cache_key(view_instance):
+    """
+    Convenience function to get the key of a view's response in the shared response
+    cache or None if the response can not be cached. Only anonymous, non-streamed GET
+    responses of views that declare the tags their responses depend on (a
+    'response_cache_tags' tuple of strings formatted with the url keyword arguments)
+    are cached.
+    """
+    request = view_instance.request
+    tags = getattr(view_instance, 'response_cache_tags', None)
+    if (not tags or not response_cache.enabled or request.method != 'GET' or
+            request.user.is_authenticated or is_streaming_requested(request)):
+        return None
+    try:
+        return request._collectionjson_response_cache_key
+    except AttributeError:
+        tags = [tag.format(**view_instance.kwargs) for tag in tags]
+        variant = '%s|%s' % (request.accepted_media_type, get_url_prefix(request))
+        key = response_cache.get_key(request.path, request.query_params.lists(),
+                                     variant, tags)
+        request._collectionjson_response_cache_key = key
+        return key
+
+
+def get_cached_response(view_instance):
+    """
+    Convenience function to get a view's response from the shared response cache.
+    Conditional requests are answered from the cached validators. None is returned
+    on a cache miss.
+    """
+    key = get_response_cache_key(view_instance)
+    if key is None:
+        return None
+    entry = response_cache.get(key)
+    if entry is None:
+        return None
+    response = get_not_modified_response(view_instance.request, entry['validators'])
+    if response is None:
+        response = HttpResponse(entry['content'], status=entry['status'])
+        for (header, value) in entry['headers']:
+            response[header] = value
+    return set_validator_headers(response, entry['validators'])
+
+
+def cache_response(view_instance, response, validators):
+    """
+    Convenience function to store a view's successful response in the shared
+    response cache once it's been rendered.
+    """
+    key = get_response_cache_key(view_instance)
+    if (key is None or response.status_code != status.HTTP_200_OK or
+            not isinstance(response, Response)):
+        return response
+
+    def store(rendered_response):
+        entry = {'content': rendered_response.content,
+                 'status': rendered_response.status_code,
+                 'headers': list(rendered_response.items()),
+                 'validators': validators}
+        response_cache.set(key, entry)
+
+    response.add_post_render_callback(store)
+    return response
+
+
 def append_collection_links(response, link_dict):
     """
     Convenience function to append document-level links to a response object.
@@ -45,23 +401,92 @@ def append_collection_template(response, template_data):
     return response
 
 
+def get_query_data(query_url):
+    """
+    Convenience function to get the data of a collection+json query from the filters
+    of the view that serves the query url.
+    """
+    relative_url = urlparse(query_url).path
+    match = resolve(relative_url)
+    filters = match.func.cls.filterset_class.base_filters
+    data = []
+    for k in filters.keys():
+        data.append({"name": k, "value": ""})
+    return data
+
+
 def append_collection_querylist(response, query_url_list):
     """
     Convenience function to append to a response a collection+json queries template.
     """
     queries = []
     for query_url in query_url_list:
-        relative_url = urlparse(query_url).path
-        match = resolve(relative_url)
-        filters = match.func.cls.filterset_class.base_filters
-        data = []
-        for k in filters.keys():
-            data.append({"name": k, "value": ""})
+        data = get_query_data(query_url)
         queries.append({'href': query_url, 'rel': 'search', "data": data})
     response.data["queries"] = queries
     return response
 
 
+class CollectionDocument(object):
+    """
+    Document-level collection+json properties of a view (a write template and a
+    list of search queries given by the url names of the query views). They are
+    compiled the first time they are appended to a response, once per url
+    configuration and script prefix as the queries' paths depend on them, and then
+    appended to every response with only the host prefix of the queries' hrefs
+    applied per request.
+    """
+
+    def __init__(self, template_data=None, query_url_names=()):
+        self.template_data = template_data
+        self.query_url_names = tuple(query_url_names)
+        self.template = None
+        if template_data is not None:
+            self.template = {'data': [{'name': k, 'value': v}
+                                      for (k, v) in template_data.items()]}
+        # compiled (path, data) pairs of the queries keyed by url configuration and
+        # script prefix
+        self._queries = {}
+
+    def _get_compilation_key(self):
+        return get_urlconf() or settings.ROOT_URLCONF, get_script_prefix()
+
+    @property
+    def is_compiled(self):
+        return self._get_compilation_key() in self._queries
+
+    def get_queries(self):
+        """
+        Return the (path, data) pairs of the queries for the current url
+        configuration and script prefix, compiling them the first time.
+        """
+        key = self._get_compilation_key()
+        queries = self._queries.get(key)
+        if queries is None:
+            script_prefix = key[1]
+            queries = []
+            for url_name in self.query_url_names:
+                path = reverse(url_name)
+                # the url resolver matches paths without the script prefix
+                queries.append((path, get_query_data('/' + path[len(script_prefix):])))
+            self._queries[key] = queries
+        return queries
+
+    def append_to(self, response, request):
+        """
+        Append the compiled template and queries to a response object.
+        """
+        queries = self.get_queries()
+        if queries:
+            prefix = get_url_prefix(request)
+            response.data['queries'] = [{'href': prefix + path, 'rel': 'search',
+                                         'data': data}
+                                        for (path, data) in queries]
+        if self.template is not None:
+            response.data['template'] = self.template
+        return response
+
+
 def collection_serializer_is_valid(is_valid_method):
     """
     Convenience 'is_valid' method decorator to generate a properly formatted message
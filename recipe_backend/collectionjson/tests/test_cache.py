@@ -0,0 +1,161 @@
+import shutil
+import tempfile
+
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from collectionjson.cache import LRUCache, FragmentCache, ResponseCache, CountCache
+
+from .models import Moron
+
+
+class LRUCacheTests(TestCase):
+    """
+    Test the LRUCache class.
+    """
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(len(cache), 2)
+
+    def test_zero_size_cache_stores_nothing(self):
+        cache = LRUCache(0)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+
+class FragmentCacheTests(TestCase):
+    """
+    Test the FragmentCache class.
+    """
+
+    def setUp(self):
+        self.cache = FragmentCache(10, version_field='name')
+        self.moron = Moron(pk=1, name='bob')
+
+    def test_fragments_are_keyed_by_row_version(self):
+        key = self.cache.get_key(object, self.moron, 'http://testserver/')
+        self.cache.set(self.moron, key, 'fragment')
+        self.assertEqual(self.cache.get(self.moron, key), 'fragment')
+        self.moron.name = 'paul'
+        new_key = self.cache.get_key(object, self.moron, 'http://testserver/')
+        self.assertIsNone(self.cache.get(self.moron, new_key))
+
+    def test_instances_without_version_are_not_cached(self):
+        cache = FragmentCache(10, version_field='modified')
+        self.assertIsNone(cache.get_key(object, self.moron, 'http://testserver/'))
+
+    def test_invalidate(self):
+        key = self.cache.get_key(object, self.moron, 'http://testserver/')
+        self.cache.set(self.moron, key, 'fragment')
+        self.cache.invalidate(Moron, 1)
+        self.assertIsNone(self.cache.get(self.moron, key))
+
+    def test_every_fragment_counts_towards_the_maximum_size(self):
+        cache = FragmentCache(3, version_field='name')
+        for i in range(5):
+            key = cache.get_key(object, self.moron, 'http://host%s/' % i)
+            cache.set(self.moron, key, 'fragment')
+        self.assertEqual(len(cache._cache), 3)
+        self.assertIsNone(cache.get(self.moron, cache.get_key(object, self.moron,
+                                                              'http://host0/')))
+        self.assertEqual(cache.get(self.moron, key), 'fragment')
+        self.assertEqual(len(cache._instance_keys[('collectionjson.moron', 1)]), 3)
+
+    def test_older_versions_are_dropped(self):
+        for name in ('bob', 'paul', 'john'):
+            self.moron.name = name
+            key = self.cache.get_key(object, self.moron, 'http://testserver/')
+            self.cache.set(self.moron, key, name)
+        self.assertEqual(len(self.cache._cache), 1)
+        self.assertEqual(self.cache.get(self.moron, key), 'john')
+
+    def test_invalidate_after_eviction(self):
+        cache = FragmentCache(1, version_field='name')
+        other = Moron(pk=2, name='paul')
+        key = cache.get_key(object, self.moron, 'http://testserver/')
+        cache.set(self.moron, key, 'fragment')
+        cache.set(other, cache.get_key(object, other, 'http://testserver/'), 'other')
+        self.assertNotIn(('collectionjson.moron', 1), cache._instance_keys)
+        cache.invalidate(Moron, 2)
+        self.assertEqual(len(cache._cache), 0)
+        self.assertEqual(cache._instance_keys, {})
+
+
+@override_settings(COLLECTIONJSON_RESPONSE_CACHE='default')
+class ResponseCacheTests(TestCase):
+    """
+    Test the ResponseCache class.
+    """
+
+    def setUp(self):
+        self.cache = ResponseCache()
+        self.tags = ['recipes', 'recipe:1']
+
+    def get_key(self, query_items=()):
+        return self.cache.get_key('/api/v1/', list(query_items),
+                                  'application/json|http://testserver', self.tags)
+
+    def test_key_is_independent_of_query_parameter_order(self):
+        key1 = self.get_key([('limit', ['10']), ('offset', ['0'])])
+        key2 = self.get_key([('offset', ['0']), ('limit', ['10'])])
+        self.assertEqual(key1, key2)
+
+    def test_invalidate_makes_tagged_entries_unreachable(self):
+        key = self.get_key()
+        self.cache.set(key, 'response')
+        self.assertEqual(self.cache.get(self.get_key()), 'response')
+        self.cache.invalidate('recipe:1')
+        self.assertIsNone(self.cache.get(self.get_key()))
+
+    def test_evicted_tag_version_is_not_reused(self):
+        key = self.get_key()
+        self.cache.set(key, 'response')
+        self.cache.cache.delete('collectionjson:tag:recipes')
+        self.assertNotEqual(self.get_key(), key)
+
+    def test_file_based_cache_backend(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        backend = 'django.core.cache.backends.filebased.FileBasedCache'
+        cache_settings = {'default': {'BACKEND': 'django.core.cache.backends.locmem.'
+                                                 'LocMemCache'},
+                          'files': {'BACKEND': backend, 'LOCATION': cache_dir}}
+        with override_settings(CACHES=cache_settings,
+                               COLLECTIONJSON_RESPONSE_CACHE='files'):
+            key = self.get_key()
+            self.cache.set(key, 'response')
+            self.assertEqual(self.cache.get(self.get_key()), 'response')
+            self.cache.invalidate('recipes')
+            self.assertIsNone(self.cache.get(self.get_key()))
+
+
+@override_settings(COLLECTIONJSON_COUNT_CACHE='default')
+class CountCacheTests(TestCase):
+    """
+    Test the CountCache class.
+    """
+
+    def setUp(self):
+        self.cache = CountCache()
+        Moron.objects.create(name='bob')
+
+    def test_count_is_cached_per_filter(self):
+        self.assertEqual(self.cache.count(Moron.objects.all()), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.cache.count(Moron.objects.all()), 1)
+        self.assertEqual(self.cache.count(Moron.objects.filter(name='paul')), 0)
+
+    def test_count_is_invalidated_on_write(self):
+        self.assertEqual(self.cache.count(Moron.objects.all()), 1)
+        moron = Moron.objects.create(name='paul')
+        self.assertEqual(self.cache.count(Moron.objects.all()), 2)
+        moron.delete()
+        self.assertEqual(self.cache.count(Moron.objects.all()), 1)
@@ -0,0 +1,40 @@
+from django.test import TestCase, RequestFactory
+from django.test.utils import override_settings
+
+from rest_framework.reverse import reverse as drf_reverse
+
+from collectionjson import links
+
+
+@override_settings(ROOT_URLCONF='collectionjson.tests.test_renderers')
+class ReverseTests(TestCase):
+    """
+    Test the links.reverse() function.
+    """
+
+    def setUp(self):
+        self.request = RequestFactory().get('/rest-api/dummy/')
+
+    def test_absolute_links_are_identical_to_drf_reverse(self):
+        for pk in (1, 25, 'abc', 'é'):
+            kwargs = {'pk': pk}
+            self.assertEqual(links.reverse('moron-detail', kwargs=kwargs,
+                                           request=self.request),
+                             drf_reverse('moron-detail', kwargs=kwargs,
+                                         request=self.request))
+
+    def test_format_suffix_links_are_identical_to_drf_reverse(self):
+        kwargs = {'pk': 1}
+        self.assertEqual(links.reverse('moron-detail', kwargs=kwargs,
+                                       request=self.request, format='json'),
+                         drf_reverse('moron-detail', kwargs=kwargs,
+                                     request=self.request, format='json'))
+
+    def test_links_without_request_are_paths(self):
+        self.assertEqual(links.reverse('moron-list'), '/rest-api/moron/')
+
+    @override_settings(COLLECTIONJSON_RELATIVE_LINKS=True)
+    def test_relative_links(self):
+        self.assertEqual(links.reverse('moron-detail', kwargs={'pk': 1},
+                                       request=self.request),
+                         '/rest-api/moron/1/')
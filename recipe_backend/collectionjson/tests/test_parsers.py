@@ -1,4 +1,5 @@
 
+import io
 import json
 
 from django.conf.urls import url, include
@@ -8,6 +9,8 @@ from django.test import TestCase
 from rest_framework import status
 from rest_framework.routers import DefaultRouter
 
+from collectionjson.parsers import CollectionJsonParser
+
 from . import views
 
 
@@ -32,6 +35,12 @@ class TestCollectionJsonParser(SimplePOSTTest):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(response.data["name"], "Bob")
 
+    def test_parse_template_list(self):
+        post = json.dumps({"template": [{"data": [{"name": "name", "value": "Bob"}]},
+                                        {"data": [{"name": "name", "value": "Paul"}]}]})
+        data = CollectionJsonParser().parse(io.BytesIO(post.encode('utf8')))
+        self.assertEqual(data, [{"name": "Bob"}, {"name": "Paul"}])
+
     def test_create_failure_invalid_template_not_dict(self):
         post = json.dumps([{"template": {"data": [{"name": "name", "value": "Bob"}]}}])
         response = self.client.post(self.endpoint, data=post,
@@ -2,6 +2,8 @@
 import logging
 import json
 
+from unittest import mock
+
 from django.conf.urls import url, include
 from django.test.utils import override_settings
 from django.test import TestCase
@@ -10,7 +12,10 @@ from collection_json import Collection
 from rest_framework import status
 from rest_framework.routers import DefaultRouter
 
+from collectionjson.renderers import CollectionJsonRenderer, RenderingPlan
+
 from .models import Dummy, Idiot, Moron, Simple
+from .serializers import DummyHyperlinkedModelSerializer
 from . import views
 
 
@@ -31,6 +36,7 @@ class SimpleGetTest(TestCase):
         self.response = self.client.get(self.endpoint)
         content = json.loads(self.response.content.decode('utf8'))
         self.total = content['collection'].pop('total', None)  # remove the non-standard 'total' property
+        self.total_estimated = content['collection'].pop('total_estimated', None)
         self.collection = Collection.from_json(json.dumps(content))
 
     def tearDown(self):
@@ -61,6 +67,7 @@ class TestCollectionJsonRenderer(SimpleGetTest):
 
     def test_it_has_the_correct_total(self):
         self.assertEqual(self.total, 1)
+        self.assertFalse(self.total_estimated)
 
     def get_dummy(self):
         return self.collection.items[0]
@@ -172,6 +179,44 @@ class TestEmpty(TestCase):
         self.assertEqual(response.content.decode('utf8'), '')
 
 
+class TestRenderingPlan(TestCase):
+
+    def test_plan_separates_id_data_and_link_fields(self):
+        plan = RenderingPlan(DummyHyperlinkedModelSerializer())
+        self.assertEqual(plan.id_field, 'url')
+        self.assertEqual(plan.link_fields, (('moron', False), ('idiots', True),
+                                            ('other_stuff', False), ('some_link', False),
+                                            ('empty', False)))
+
+    def test_plan_transforms_items(self):
+        plan = RenderingPlan(DummyHyperlinkedModelSerializer())
+        item = {'url': 'http://a/1/', 'name': 'foo', 'moron': 'http://m/1/',
+                'idiots': ['http://i/1/', 'http://i/2/'], 'other_stuff': 'http://o/',
+                'some_link': 'http://s/', 'empty': None}
+        result = plan.transform_item(item)
+        self.assertEqual(result['href'], 'http://a/1/')
+        self.assertEqual(result['data'], [{'name': 'name', 'value': 'foo'}])
+        self.assertEqual([x['rel'] for x in result['links']],
+                         ['moron', 'idiots', 'idiots', 'other_stuff', 'some_link'])
+
+
+@override_settings(ROOT_URLCONF='collectionjson.tests.test_renderers')
+class TestRenderingPlanCache(TestCase):
+
+    def setUp(self):
+        CollectionJsonRenderer._rendering_plans.clear()
+        create_models()
+
+    def test_plan_is_compiled_once_per_serializer_class(self):
+        with mock.patch('collectionjson.renderers.RenderingPlan',
+                        wraps=RenderingPlan) as plan_mock:
+            self.client.get('/rest-api/dummy/')
+            self.client.get('/rest-api/dummy/')
+        self.assertEqual(plan_mock.call_count, 1)
+        self.assertIn(DummyHyperlinkedModelSerializer,
+                      CollectionJsonRenderer._rendering_plans)
+
+
 router = DefaultRouter()
 router.register('dummy', views.DummyReadOnlyModelViewSet)
 router.register('moron', views.MoronReadOnlyModelViewSet)
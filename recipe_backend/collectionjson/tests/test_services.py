@@ -3,6 +3,7 @@ import logging
 from django.conf.urls import url, include
 from django.test.utils import override_settings
 from django.test import TestCase
+from django.urls import set_script_prefix
 
 from rest_framework.routers import DefaultRouter
 
@@ -91,6 +92,38 @@ class FunctionTests(SimpleGetTest):
                          [{'href': query_urls[0], 'rel': 'search',
                            "data": [{"name": "name", "value": ""}]}])
 
+    def test_collection_document_append_to(self):
+        """
+        Test whether services.CollectionDocument.append_to() appends the compiled
+        template and queries to its response argument
+        """
+        response = self.response
+        document = services.CollectionDocument(template_data={"name": ""},
+                                               query_url_names=['moron-list'])
+        response = document.append_to(response, response.renderer_context['request'])
+        self.assertTrue(document.is_compiled)
+        self.assertEqual(response.data['template'],
+                         {'data': [{'name': 'name', 'value': ''}]})
+        self.assertEqual(response.data['queries'],
+                         [{'href': 'http://testserver' + self.endpoint, 'rel': 'search',
+                           "data": [{"name": "name", "value": ""}]}])
+
+    def test_collection_document_queries_use_the_script_prefix(self):
+        """
+        Test whether services.CollectionDocument.append_to() compiles the queries'
+        paths for the current script prefix
+        """
+        response = self.response
+        document = services.CollectionDocument(query_url_names=['moron-list'])
+        document.append_to(response, response.renderer_context['request'])
+        set_script_prefix('/app/')
+        self.addCleanup(set_script_prefix, '/')
+        self.assertFalse(document.is_compiled)
+        response = document.append_to(response, response.renderer_context['request'])
+        self.assertEqual(response.data['queries'],
+                         [{'href': 'http://testserver/app' + self.endpoint,
+                           'rel': 'search', "data": [{"name": "name", "value": ""}]}])
+
 
 router = DefaultRouter()
 router.register('moron', views.MoronModelViewSet)
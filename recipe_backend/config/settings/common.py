@@ -3,6 +3,12 @@
 Django settings for recipe_backend project.
 """
 
+import os
+
+# Directory of the application's own logs (e.g. the slow query log)
+LOG_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'logs')
+
 # Quick-start development settings
 
 ALLOWED_HOSTS = ['*']
@@ -20,6 +26,7 @@ INSTALLED_APPS = [
     'rest_framework.authtoken',
     'corsheaders',
     'collectionjson',
+    'core',
     'recipes',
     'users'
 ]
@@ -27,7 +34,7 @@ INSTALLED_APPS = [
 # Pagination
 REST_FRAMEWORK = {
     'PAGE_SIZE': 10,
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
+    'DEFAULT_PAGINATION_CLASS': 'collectionjson.pagination.LimitOffsetPagination',
     'DEFAULT_RENDERER_CLASSES': (
         'collectionjson.renderers.CollectionJsonRenderer',
         'rest_framework.renderers.JSONRenderer',
@@ -40,7 +47,7 @@ REST_FRAMEWORK = {
         'rest_framework.parsers.MultiPartParser',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.BasicAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
@@ -49,8 +56,97 @@ REST_FRAMEWORK = {
     )
 }
 
+# Maximum number of model instances whose rendered Collection+JSON items are kept in
+# the in-process fragment cache (0 disables the cache)
+COLLECTIONJSON_FRAGMENT_CACHE_SIZE = 10000
+
+# Emit host-relative hrefs (e.g. /api/v1/1/) instead of absolute urls
+COLLECTIONJSON_RELATIVE_LINKS = False
+
+# Cache used to share the rendered responses of anonymous read requests among all the
+# server processes (None disables the response cache) and their lifetime in seconds.
+# It must be a cache shared by all the processes (e.g. memcached or redis), otherwise
+# the processes that don't handle a write keep serving stale responses
+COLLECTIONJSON_RESPONSE_CACHE = None
+COLLECTIONJSON_RESPONSE_CACHE_TIMEOUT = 300
+
+# Cache where the exact totals of paginated lists are kept for each combination of
+# filters until the underlying tables are written (None disables the count cache).
+# Like the response cache it must be shared by all the server processes
+COLLECTIONJSON_COUNT_CACHE = None
+COLLECTIONJSON_COUNT_CACHE_TIMEOUT = 3600
+
+# Lists whose PostgreSQL planner estimate is above this number of rows report the
+# estimate as their total instead of counting them (None always counts)
+COLLECTIONJSON_ESTIMATED_COUNT_THRESHOLD = None
+
+# Number of API tokens whose authenticated users are kept in each server process's
+# in-process cache (0 disables the token cache), the lifetime of the entries in
+# seconds and the cache shared by all the processes that backs it (None disables the
+# token cache). Every hit checks the user's version in the shared cache, so deleted
+# or regenerated tokens and deactivated users stop authenticating on all the
+# processes as soon as the change is saved
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_TOKEN_CACHE_TIMEOUT = 60
+AUTH_TOKEN_CACHE = None
+
+# Same for the users whose username and password have already been verified (by HTTP
+# Basic authentication, auth token requests, etc) so that the password isn't hashed
+# on every request. It's disabled without a shared cache too, since the other
+# processes would accept an old password or a deactivated user until their entries
+# expire
+AUTH_CREDENTIALS_CACHE_SIZE = 10000
+AUTH_CREDENTIALS_CACHE_TIMEOUT = 60
+AUTH_CREDENTIALS_CACHE = None
+
+AUTHENTICATION_BACKENDS = ['users.backends.CachedModelBackend']
+
+# Time the phases (authentication, database, serialization and rendering) of each
+# request and report them to the client in a Server-Timing header
+SERVER_TIMING = True
+
+# Profile the requests that send a signed X-Profile header (see the profiletoken
+# command) or, for staff users, the 'profile' query parameter and store their
+# profiles in PROFILING_DIR (see the profilereport command). The profiling middleware
+# is removed when this is off. Header values expire after PROFILING_TOKEN_MAX_AGE
+# seconds
+PROFILING = False
+PROFILING_DIR = '/tmp/recipe_backend_profiles'
+PROFILING_TOKEN_MAX_AGE = 3600
+
+# Record the number, status, latency, database queries and response sizes of the
+# requests to each route. They are served in the Prometheus text format at
+# /api/v1/metrics/ to staff users and to scrapers sending METRICS_TOKEN as a bearer
+# token. With several server processes, each of them stores its metrics in
+# METRICS_DIR at most every METRICS_FLUSH_INTERVAL seconds so that any of them can
+# serve the metrics of all (None for single-process servers)
+METRICS = True
+METRICS_TOKEN = None
+METRICS_DIR = None
+METRICS_FLUSH_INTERVAL = 5
+
+# Log the database queries slower than SLOW_QUERY_THRESHOLD milliseconds (None
+# disables the slow query log) as lines of JSON to the SLOW_QUERY_LOG file, with the
+# route, view and code that issued them (see the slowqueries command). The log is
+# rotated when it reaches SLOW_QUERY_LOG_MAX_BYTES, keeping SLOW_QUERY_LOG_BACKUP_COUNT
+# old files. The SQL is logged with its parameters (e.g. usernames and search terms),
+# so it's enabled per environment with a log in LOG_DIR, which is created readable
+# by its owner only
+SLOW_QUERY_THRESHOLD = None
+SLOW_QUERY_LOG = None
+SLOW_QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUP_COUNT = 5
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 MIDDLEWARE = [
     'core.middleware.ResponseMiddleware',
+    'core.metrics.MetricsMiddleware',
+    'core.slowqueries.SlowQueryMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -59,6 +155,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
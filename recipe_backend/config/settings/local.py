@@ -8,6 +8,8 @@ Local settings
 - Add django-extensions as app
 """
 
+import os
+
 from .common import *  # noqa
 
 # Quick-start development settings - unsuitable for production
@@ -54,6 +56,11 @@ INSTALLED_APPS += ['django_extensions']
 # ------------------------------------------------------------------------------
 TEST_RUNNER = 'django.test.runner.DiscoverRunner'
 
+# Slow query log
+# ------------------------------------------------------------------------------
+SLOW_QUERY_THRESHOLD = 250
+SLOW_QUERY_LOG = os.path.join(LOG_DIR, 'slow_queries.log')
+
 # corsheaders
 # ------------------------------------------------------------------------------
 CORS_ORIGIN_ALLOW_ALL = True
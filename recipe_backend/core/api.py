@@ -7,12 +7,17 @@ from rest_framework.authtoken.views import obtain_auth_token
 from recipes import views as recipe_views
 from users import views as user_views
 
+from . import views as core_views
+
 # API v1 endpoints
 urlpatterns = format_suffix_patterns([
 
     url(r'^v1/auth-token/$',
         obtain_auth_token),
 
+    url(r'^v1/metrics/$',
+        core_views.Metrics.as_view(), name='metrics'),
+
     url(r'^v1/users/$',
         user_views.UserCreate.as_view(), name='user-create'),
 
@@ -23,6 +28,9 @@ urlpatterns = format_suffix_patterns([
     url(r'^v1/$',
         recipe_views.RecipeList.as_view(), name='recipe-list'),
 
+    url(r'^v1/export/$',
+        recipe_views.RecipeExport.as_view(), name='recipe-export'),
+
     url(r'^v1/search/$',
         recipe_views.RecipeListQuerySearch.as_view(), name='recipe-list-query-search'),
 
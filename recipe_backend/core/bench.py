@@ -0,0 +1,339 @@
+
+import json
+import math
+import secrets
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Recipe, Ingredient, Step, IngredientToken
+
+from .budgets import QueryCounter
+
+
+CONTENT_TYPE = 'application/vnd.collection+json'
+
+INGREDIENTS = ('flour', 'eggs', 'milk', 'butter', 'sugar', 'salt', 'tomato', 'onion',
+               'garlic', 'rice', 'chicken', 'basil', 'cheese', 'pepper', 'lemon',
+               'olive oil', 'potato', 'carrot', 'beef', 'yogurt')
+DISHES = ('soup', 'pie', 'stew', 'salad', 'risotto', 'curry', 'cake', 'omelette',
+          'gratin', 'pasta')
+VERBS = ('chop', 'mix', 'whisk', 'boil', 'bake', 'fry', 'simmer', 'season', 'stir',
+         'serve')
+
+Catalog = namedtuple('Catalog', ['users', 'recipes', 'tokens', 'staff_token',
+                                 'password'])
+
+
+def _chunks(items, size=500):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def seed_catalog(num_users, num_ingredients, num_steps, rng):
+    """
+    Create a synthetic catalog with bulk inserts: 'num_users' users (and an API token
+    each) owning one recipe each with 'num_ingredients' ingredients and 'num_steps'
+    steps, plus a staff user. Return a Catalog with the ids of the users and recipes,
+    the users' tokens and their password, which is random so that kept catalogs
+    don't leave accounts with a known password behind.
+    """
+    prefix = 'bench-%s-' % uuid.uuid4().hex[:8]
+    password = secrets.token_urlsafe()
+    hashed_password = make_password(password)
+    User.objects.bulk_create([User(username='%s%s' % (prefix, i),
+                                   password=hashed_password,
+                                   email='%s%s@bench.org' % (prefix, i))
+                              for i in range(num_users)])
+    staff = User.objects.create_user(prefix + 'staff', password=password,
+                                     is_staff=True)
+    users = list(User.objects.filter(username__startswith=prefix).exclude(
+        pk=staff.pk).order_by('id').values_list('id', flat=True))
+
+    Recipe.objects.bulk_create([
+        Recipe(name='%s %s %s' % (rng.choice(INGREDIENTS), rng.choice(DISHES), i),
+               owner_id=user_id) for (i, user_id) in enumerate(users)])
+    recipes = []
+    for chunk in _chunks(users):
+        recipes.extend(Recipe.objects.filter(owner_id__in=chunk).order_by(
+            'owner_id').values_list('id', flat=True))
+
+    Ingredient.objects.bulk_create(
+        [Ingredient(recipe_id=recipe_id, position=position,
+                    text='%s g %s' % (rng.randint(1, 500), rng.choice(INGREDIENTS)))
+         for recipe_id in recipes for position in range(num_ingredients)],
+        batch_size=1000)
+    Step.objects.bulk_create(
+        [Step(recipe_id=recipe_id, position=position,
+              step_text='%s the %s' % (rng.choice(VERBS), rng.choice(INGREDIENTS)))
+         for recipe_id in recipes for position in range(num_steps)],
+        batch_size=1000)
+    for chunk in _chunks(recipes):
+        Recipe.update_search_documents(*chunk)
+        IngredientToken.update_recipes(*chunk)
+
+    tokens = [Token(key=Token.generate_key(), user_id=user_id) for user_id in users]
+    Token.objects.bulk_create(tokens, batch_size=1000)
+    staff_token = Token.objects.create(user=staff)
+    return Catalog(users, recipes, [token.key for token in tokens], staff_token.key,
+                   password)
+
+
+def _template(**values):
+    return json.dumps({'template': {'data': [{'name': name, 'value': value}
+                                              for (name, value) in values.items()]}})
+
+
+def _templates(*items):
+    return json.dumps({'template': [{'data': [{'name': name, 'value': value}
+                                              for (name, value) in item.items()]}
+                                    for item in items]})
+
+
+class Benchmark(object):
+    """
+    Drives the API endpoints through the test client with a mix of read and write
+    requests over a seeded catalog and records the latency and number of queries of
+    each request per endpoint (method and url name).
+    """
+
+    def __init__(self, catalog, rng):
+        self.catalog = catalog
+        self.rng = rng
+        self.client = Client()
+        self.samples = OrderedDict()
+        self.reads = [
+            self.list_recipes, self.list_recipes_by_cursor, self.search_recipes,
+            self.search_recipes_by_ingredients, self.get_recipe,
+            self.get_expanded_recipe, self.list_ingredients, self.get_ingredient,
+            self.list_steps, self.get_step, self.get_user, self.get_metrics,
+        ]
+        self.writes = [
+            self.create_ingredient, self.reorder_steps, self.update_recipe,
+            self.create_user, self.obtain_token,
+        ]
+
+    def _pick_owner(self):
+        i = self.rng.randrange(len(self.catalog.recipes))
+        return (self.catalog.recipes[i], self.catalog.users[i],
+                'Token %s' % self.catalog.tokens[i])
+
+    def request(self, method, url_name, url, data=None, content_type=CONTENT_TYPE,
+                authorization=None, record=True):
+        extra = {}
+        if authorization:
+            extra['HTTP_AUTHORIZATION'] = authorization
+        handler = getattr(self.client, method.lower())
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            start = time.perf_counter()
+            if method == 'GET':
+                response = handler(url, data, **extra)
+            else:
+                response = handler(url, data=data, content_type=content_type, **extra)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            duration = time.perf_counter() - start
+        if record:
+            key = '%s %s' % (method, url_name)
+            samples = self.samples.setdefault(key, {'latencies': [], 'queries': [],
+                                                    'errors': 0})
+            samples['latencies'].append(duration)
+            samples['queries'].append(counter.count)
+            if response.status_code >= 400:
+                samples['errors'] += 1
+        return response
+
+    # read requests
+
+    def list_recipes(self, record):
+        self.request('GET', 'recipe-list', reverse('recipe-list'), {'limit': 10},
+                     record=record)
+
+    def list_recipes_by_cursor(self, record):
+        (recipe, user, token) = self._pick_owner()
+        self.request('GET', 'recipe-list', reverse('recipe-list'),
+                     {'limit': 10, 'cursor': ''}, authorization=token, record=record)
+
+    def search_recipes(self, record):
+        self.request('GET', 'recipe-list-query-search',
+                     reverse('recipe-list-query-search'),
+                     {'search': self.rng.choice(DISHES), 'limit': 10}, record=record)
+
+    def search_recipes_by_ingredients(self, record):
+        ingredients = ','.join(self.rng.sample(INGREDIENTS, 3))
+        self.request('GET', 'recipe-list-query-search',
+                     reverse('recipe-list-query-search'),
+                     {'ingredients': ingredients, 'min_ingredients': 2, 'limit': 10},
+                     record=record)
+
+    def get_recipe(self, record):
+        (recipe, user, token) = self._pick_owner()
+        self.request('GET', 'recipe-detail', reverse('recipe-detail',
+                                                     kwargs={'pk': recipe}),
+                     record=record)
+
+    def get_expanded_recipe(self, record):
+        (recipe, user, token) = self._pick_owner()
+        self.request('GET', 'recipe-detail', reverse('recipe-detail',
+                                                     kwargs={'pk': recipe}),
+                     {'expand': 'ingredients,steps,owner'}, authorization=token,
+                     record=record)
+
+    def list_ingredients(self, record):
+        (recipe, user, token) = self._pick_owner()
+        self.request('GET', 'ingredient-list', reverse('ingredient-list',
+                                                       kwargs={'pk': recipe}),
+                     record=record)
+
+    def get_ingredient(self, record):
+        (recipe, user, token) = self._pick_owner()
+        pk = Ingredient.objects.filter(recipe_id=recipe).values_list('id',
+                                                                     flat=True).first()
+        if pk is not None:
+            self.request('GET', 'ingredient-detail',
+                         reverse('ingredient-detail', kwargs={'pk': pk}), record=record)
+
+    def list_steps(self, record):
+        (recipe, user, token) = self._pick_owner()
+        self.request('GET', 'step-list', reverse('step-list', kwargs={'pk': recipe}),
+                     authorization=token, record=record)
+
+    def get_step(self, record):
+        (recipe, user, token) = self._pick_owner()
+        pk = Step.objects.filter(recipe_id=recipe).values_list('id', flat=True).first()
+        if pk is not None:
+            self.request('GET', 'step-detail', reverse('step-detail', kwargs={'pk': pk}),
+                         record=record)
+
+    def get_user(self, record):
+        (recipe, user, token) = self._pick_owner()
+        self.request('GET', 'user-detail', reverse('user-detail', kwargs={'pk': user}),
+                     authorization=token, record=record)
+
+    def get_metrics(self, record):
+        self.request('GET', 'metrics', reverse('metrics'),
+                     authorization='Token %s' % self.catalog.staff_token, record=record)
+
+    # write requests
+
+    def create_ingredient(self, record):
+        (recipe, user, token) = self._pick_owner()
+        self.request('POST', 'ingredient-list',
+                     reverse('ingredient-list', kwargs={'pk': recipe}),
+                     _template(text='a pinch of %s' % self.rng.choice(INGREDIENTS)),
+                     authorization=token, record=record)
+
+    def reorder_steps(self, record):
+        (recipe, user, token) = self._pick_owner()
+        ids = list(Step.objects.filter(recipe_id=recipe).values_list('id', flat=True))
+        self.rng.shuffle(ids)
+        self.request('PUT', 'step-list', reverse('step-list', kwargs={'pk': recipe}),
+                     _templates(*[{'id': pk} for pk in ids]), authorization=token,
+                     record=record)
+
+    def update_recipe(self, record):
+        (recipe, user, token) = self._pick_owner()
+        name = '%s %s' % (self.rng.choice(INGREDIENTS), self.rng.choice(DISHES))
+        self.request('PUT', 'recipe-detail', reverse('recipe-detail',
+                                                     kwargs={'pk': recipe}),
+                     _template(name=name), authorization=token, record=record)
+
+    def create_user(self, record):
+        username = 'bench-%s' % uuid.uuid4().hex[:12]
+        self.request('POST', 'user-create', reverse('user-create'),
+                     _template(username=username, password=self.catalog.password,
+                               email='%s@bench.org' % username), record=record)
+
+    def obtain_token(self, record):
+        (recipe, user, token) = self._pick_owner()
+        username = User.objects.filter(pk=user).values_list('username', flat=True)[0]
+        self.request('POST', 'auth-token', '/api/v1/auth-token/',
+                     json.dumps({'username': username,
+                                 'password': self.catalog.password}),
+                     content_type='application/json', record=record)
+
+    def run(self, num_requests, write_ratio, warmup=0):
+        """
+        Make 'warmup' unrecorded requests followed by 'num_requests' recorded ones,
+        a 'write_ratio' fraction of which are writes. Return the wall time of the
+        recorded requests.
+        """
+        for scenario in self.reads + self.writes:
+            for i in range(warmup):
+                scenario(False)
+        start = time.perf_counter()
+        for i in range(num_requests):
+            scenarios = self.writes if self.rng.random() < write_ratio else self.reads
+            self.rng.choice(scenarios)(True)
+        return time.perf_counter() - start
+
+
+def percentile(values, p):
+    """
+    Return the nearest-rank percentile 'p' (0-100) of a list of values.
+    """
+    ordered = sorted(values)
+    rank = max(1, int(math.ceil(p / 100.0 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def summarize(samples, wall_time):
+    """
+    Return the report of the samples of a benchmark: p50, p95 and p99 latencies in
+    milliseconds, requests per second and queries per request of each endpoint and
+    of all of them.
+    """
+    def summarize_endpoint(latencies, queries, errors, elapsed):
+        return OrderedDict([
+            ('requests', len(latencies)),
+            ('errors', errors),
+            ('p50_ms', round(percentile(latencies, 50) * 1000, 3)),
+            ('p95_ms', round(percentile(latencies, 95) * 1000, 3)),
+            ('p99_ms', round(percentile(latencies, 99) * 1000, 3)),
+            ('requests_per_second',
+             round(len(latencies) / elapsed, 1) if elapsed else None),
+            ('queries_per_request', round(sum(queries) / float(len(queries)), 2)),
+        ])
+
+    endpoints = OrderedDict()
+    all_latencies = []
+    all_queries = []
+    errors = 0
+    for key in sorted(samples):
+        s = samples[key]
+        endpoints[key] = summarize_endpoint(s['latencies'], s['queries'], s['errors'],
+                                            sum(s['latencies']))
+        all_latencies.extend(s['latencies'])
+        all_queries.extend(s['queries'])
+        errors += s['errors']
+    total = summarize_endpoint(all_latencies, all_queries, errors, wall_time)
+    return OrderedDict([('total', total), ('endpoints', endpoints)])
+
+
+def compare_with_baseline(report, baseline, tolerance):
+    """
+    Return the list of regressions of a report with respect to a baseline report:
+    endpoints whose p95 latency grew by more than 'tolerance' (a fraction) or that
+    run more queries per request.
+    """
+    regressions = []
+    for (key, current) in report['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(key)
+        if previous is None:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append('%s: p95 %.3fms > baseline %.3fms (+%d%% allowed)' % (
+                key, current['p95_ms'], previous['p95_ms'], tolerance * 100))
+        if current['queries_per_request'] > previous['queries_per_request'] + 0.01:
+            regressions.append('%s: %.2f queries per request > baseline %.2f' % (
+                key, current['queries_per_request'], previous['queries_per_request']))
+    return regressions
@@ -0,0 +1,50 @@
+
+import logging
+
+from django.conf import settings
+from django.db import connection
+
+from rest_framework import permissions
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCounter(object):
+    """
+    Database execute wrapper that counts the executed queries.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class QueryBudgetMixin(object):
+    """
+    Mixin for views that declares the maximum number of database queries a read
+    request (GET or HEAD) may run in 'query_budget', whatever the number of listed
+    objects (page size). When DEBUG is on the requests over budget are logged as
+    warnings.
+    """
+    query_budget = None
+
+    def dispatch(self, request, *args, **kwargs):
+        """
+        Overriden to count the queries of read requests in DEBUG mode.
+        """
+        if (not settings.DEBUG or self.query_budget is None or
+                request.method not in permissions.SAFE_METHODS):
+            return super(QueryBudgetMixin, self).dispatch(request, *args, **kwargs)
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = super(QueryBudgetMixin, self).dispatch(request, *args, **kwargs)
+        if counter.count > self.query_budget:
+            logger.warning('%s %s ran %s queries, over the %s budget of %s',
+                           request.method, request.get_full_path(), counter.count,
+                           type(self).__name__, self.query_budget)
+        return response
+
@@ -0,0 +1,48 @@
+
+class IdentityMap(object):
+    """
+    Map of the model instances already loaded while serving a request, keyed by
+    model and lookup value, so that each object is loaded only once per request.
+    """
+
+    def __init__(self):
+        self._objects = {}
+
+    def get(self, model, lookup_field, value):
+        return self._objects.get((model, lookup_field, str(value)))
+
+    def add(self, obj, lookup_field='pk'):
+        value = getattr(obj, lookup_field)
+        self._objects[(type(obj)._meta.concrete_model, lookup_field, str(value))] = obj
+
+
+def get_identity_map(request):
+    """
+    Return the identity map of a request, creating it the first time.
+    """
+    try:
+        return request._identity_map
+    except AttributeError:
+        request._identity_map = IdentityMap()
+        return request._identity_map
+
+
+class IdentityMapMixin(object):
+    """
+    Mixin for generic views that memoizes get_object() in the request's identity map,
+    so the view's object is looked up (and its permissions checked) only once per
+    request however many times it's needed.
+    """
+
+    def get_object(self):
+        """
+        Overriden to return the object already loaded by this request if any.
+        """
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        model = self.get_queryset().model._meta.concrete_model
+        identity_map = get_identity_map(self.request)
+        obj = identity_map.get(model, self.lookup_field, self.kwargs[lookup_url_kwarg])
+        if obj is None:
+            obj = super(IdentityMapMixin, self).get_object()
+            identity_map.add(obj, self.lookup_field)
+        return obj
@@ -0,0 +1,99 @@
+
+import json
+import random
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+
+from core.bench import Benchmark, compare_with_baseline, seed_catalog, summarize
+
+
+# settings naming the shared caches, which are replaced by a private one
+_CACHE_ALIAS_SETTINGS = ('COLLECTIONJSON_RESPONSE_CACHE', 'COLLECTIONJSON_COUNT_CACHE',
+                         'AUTH_TOKEN_CACHE', 'AUTH_CREDENTIALS_CACHE')
+
+
+class Command(BaseCommand):
+    help = ('Seed a synthetic catalog and benchmark the API endpoints with a mix of '
+            'read and write requests. Print the p50, p95 and p99 latencies, requests '
+            'per second and queries per request of each endpoint as JSON and exit '
+            'with an error if they regressed with respect to a baseline report. The '
+            'catalog and the writes are rolled back unless --keep is given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100,
+                            help='number of users, each with one recipe (default: 100)')
+        parser.add_argument('--ingredients', type=int, default=8,
+                            help='number of ingredients per recipe (default: 8)')
+        parser.add_argument('--steps', type=int, default=6,
+                            help='number of steps per recipe (default: 6)')
+        parser.add_argument('--requests', type=int, default=1000,
+                            help='number of measured requests (default: 1000)')
+        parser.add_argument('--write-ratio', type=float, default=0.1,
+                            help='fraction of write requests (default: 0.1)')
+        parser.add_argument('--warmup', type=int, default=2,
+                            help='unmeasured requests per scenario (default: 2)')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='seed of the random data and requests (default: 0)')
+        parser.add_argument('--output', default=None,
+                            help='also write the report to this file (e.g. to be used '
+                                 'as a baseline)')
+        parser.add_argument('--baseline', default=None,
+                            help='baseline report to compare with')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='allowed p95 latency increase over the baseline as a '
+                                 'fraction (default: 0.2)')
+        parser.add_argument('--keep', action='store_true',
+                            help="don't roll back the seeded catalog and the writes")
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['requests'] < 1:
+            raise CommandError('At least one user and one request are needed.')
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError("Can't read the baseline: %s" % e)
+
+        # the benchmark's data must never reach the caches and metrics shared with
+        # the running servers
+        private_settings = {name: 'default' for name in _CACHE_ALIAS_SETTINGS
+                            if getattr(settings, name, None) is not None}
+        private_settings['CACHES'] = {'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'bench'}}
+        private_settings['METRICS_DIR'] = None
+
+        rng = random.Random(options['seed'])
+        with override_settings(**private_settings), transaction.atomic():
+            catalog = seed_catalog(options['users'], options['ingredients'],
+                                   options['steps'], rng)
+            benchmark = Benchmark(catalog, rng)
+            wall_time = benchmark.run(options['requests'], options['write_ratio'],
+                                      options['warmup'])
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+        if options['keep']:
+            self.stderr.write('The benchmark users were kept, their password is %s' %
+                              catalog.password)
+        report = summarize(benchmark.samples, wall_time)
+        report['config'] = {name: options[name] for name in (
+            'users', 'ingredients', 'steps', 'requests', 'write_ratio', 'seed')}
+        output = json.dumps(report, indent=2)
+        self.stdout.write(output)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+
+        if baseline is not None:
+            regressions = compare_with_baseline(report, baseline, options['tolerance'])
+            if regressions:
+                for regression in regressions:
+                    self.stderr.write(regression)
+                raise CommandError('%s regressions with respect to the baseline.' %
+                                   len(regressions))
@@ -0,0 +1,56 @@
+
+import io
+import os
+import pstats
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.profiling import parse_profile_name
+
+
+class Command(BaseCommand):
+    help = ('Aggregate the request profiles stored in the PROFILING_DIR directory into '
+            'a report of the top hot functions of each view.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=None,
+                            help='directory of the profiles (default: PROFILING_DIR)')
+        parser.add_argument('--top', type=int, default=20,
+                            help='number of functions listed per view (default: 20)')
+        parser.add_argument('--view', action='append', default=[],
+                            help='only report this view (can be repeated)')
+        parser.add_argument('--sort', default='cumulative',
+                            choices=('cumulative', 'tottime', 'ncalls'),
+                            help='sort key of the functions (default: cumulative)')
+
+    def handle(self, *args, **options):
+        directory = options['dir'] or settings.PROFILING_DIR
+        if not os.path.isdir(directory):
+            raise CommandError("Profiles directory '%s' doesn't exist." % directory)
+
+        profiles = defaultdict(list)
+        for name in sorted(os.listdir(directory)):
+            info = parse_profile_name(name)
+            if info is None:
+                continue
+            if options['view'] and info['view'] not in options['view']:
+                continue
+            profiles[info['view']].append((os.path.join(directory, name), info))
+        if not profiles:
+            self.stdout.write('No profiles found in %s.' % directory)
+            return
+
+        for view in sorted(profiles):
+            paths = [path for (path, info) in profiles[view]]
+            durations = sorted(info['duration'] for (path, info) in profiles[view])
+            url_names = sorted(set(info['url_name'] for (path, info) in profiles[view]))
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                '%s (%s): %s profiles, median %sms, max %sms' % (
+                    view, ', '.join(url_names), len(paths),
+                    durations[len(durations) // 2], durations[-1])))
+            report = io.StringIO()
+            stats = pstats.Stats(*paths, stream=report)
+            stats.strip_dirs().sort_stats(options['sort']).print_stats(options['top'])
+            self.stdout.write(report.getvalue())
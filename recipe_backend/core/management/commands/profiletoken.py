@@ -0,0 +1,12 @@
+
+from django.core.management.base import BaseCommand
+
+from core.profiling import make_profiling_token
+
+
+class Command(BaseCommand):
+    help = ('Print a signed value of the X-Profile request header that makes the '
+            'server profile the requests that send it (see the PROFILING settings).')
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_profiling_token())
@@ -0,0 +1,57 @@
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.slowqueries import read_slow_queries
+
+
+class Command(BaseCommand):
+    help = ('Summarize the slow query log (including its rotated files) into the top '
+            'offending queries by total time.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log', default=None,
+                            help='path of the slow query log (default: SLOW_QUERY_LOG)')
+        parser.add_argument('--top', type=int, default=10,
+                            help='number of queries listed (default: 10)')
+        parser.add_argument('--view', default=None,
+                            help='only summarize the queries of this view class')
+
+    def handle(self, *args, **options):
+        path = options['log'] or settings.SLOW_QUERY_LOG
+        if not path:
+            raise CommandError('The slow query log is disabled, set SLOW_QUERY_LOG or '
+                               'give --log.')
+        queries = {}
+        for entry in read_slow_queries(path):
+            if options['view'] and not (entry.get('view') or '').endswith(
+                    options['view']):
+                continue
+            query = queries.get(entry['fingerprint'])
+            if query is None:
+                query = queries[entry['fingerprint']] = {
+                    'sql': entry['sql'], 'count': 0, 'total': 0, 'max': 0,
+                    'views': defaultdict(int), 'stacks': defaultdict(int)}
+            query['count'] += 1
+            query['total'] += entry['duration_ms']
+            query['max'] = max(query['max'], entry['duration_ms'])
+            query['views'][entry.get('url_name') or entry.get('view') or '-'] += 1
+            query['stacks'][' < '.join(reversed(entry.get('stack') or []))] += 1
+        if not queries:
+            self.stdout.write('No slow queries logged in %s.' % path)
+            return
+
+        offenders = sorted(queries.items(), key=lambda item: item[1]['total'],
+                           reverse=True)
+        for (fingerprint, query) in offenders[:options['top']]:
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                '%s: %s queries, total %.1fms, mean %.1fms, max %.1fms' % (
+                    fingerprint, query['count'], query['total'],
+                    query['total'] / query['count'], query['max'])))
+            self.stdout.write('  sql: %s' % query['sql'])
+            views = sorted(query['views'].items(), key=lambda item: -item[1])
+            self.stdout.write('  routes: %s' % ', '.join('%s (%s)' % v for v in views))
+            (stack, count) = max(query['stacks'].items(), key=lambda item: item[1])
+            self.stdout.write('  stack: %s' % (stack or '-'))
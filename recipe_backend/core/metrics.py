@@ -0,0 +1,249 @@
+
+import json
+import os
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import ExitStack
+from threading import Lock
+
+from django.conf import settings
+from django.db import connection
+from django.core.exceptions import MiddlewareNotUsed
+
+from .budgets import QueryCounter
+from .timing import get_request_timer
+
+
+class Metric(object):
+    """
+    Definition of a metric in Prometheus terms: a counter or a histogram with
+    upper bounds 'buckets' whose samples are labeled by 'label_names'.
+    """
+
+    def __init__(self, name, kind, documentation, label_names, buckets=None):
+        self.name = name
+        self.kind = kind
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+
+    def new_value(self):
+        """
+        Return the initial value of a sample: a count or, for histograms, the list
+        of counts per bucket (the last one is +Inf) followed by the sum and the count
+        of the observations.
+        """
+        if self.kind == 'counter':
+            return 0
+        return [0] * (len(self.buckets) + 3)
+
+    def merge(self, value, other):
+        if self.kind == 'counter':
+            return value + other
+        return [x + y for (x, y) in zip(value, other)]
+
+    def format(self, samples):
+        """
+        Return the lines of the samples (a dictionary of label values tuples to
+        values) in the Prometheus text format.
+        """
+        lines = ['# HELP %s %s' % (self.name, self.documentation),
+                 '# TYPE %s %s' % (self.name, self.kind)]
+        for (label_values, value) in sorted(samples.items()):
+            labels = ['%s="%s"' % (name, _escape(v))
+                      for (name, v) in zip(self.label_names, label_values)]
+            if self.kind == 'counter':
+                lines.append('%s{%s} %s' % (self.name, ','.join(labels), value))
+                continue
+            cumulative = 0
+            for (bound, count) in zip(self.buckets + ('+Inf',), value):
+                cumulative += count
+                lines.append('%s_bucket{%s} %s' % (
+                    self.name, ','.join(labels + ['le="%s"' % bound]), cumulative))
+            lines.append('%s_sum{%s} %s' % (self.name, ','.join(labels), value[-2]))
+            lines.append('%s_count{%s} %s' % (self.name, ','.join(labels), value[-1]))
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+METRICS = (
+    Metric('api_requests_total', 'counter', 'Number of requests.',
+           ('route', 'method', 'status')),
+    Metric('api_request_duration_seconds', 'histogram', 'Latency of the requests.',
+           ('route', 'method'),
+           (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)),
+    Metric('api_request_queries', 'histogram', 'Database queries per request.',
+           ('route', 'method'), (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)),
+    Metric('api_response_size_bytes', 'histogram',
+           'Size of the response bodies (streamed ones are not observed).',
+           ('route', 'method'),
+           (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)),
+)
+
+
+class MetricsRegistry(object):
+    """
+    In-process aggregate of the request metrics. When a directory is given in the
+    METRICS_DIR setting each process also stores its aggregate in its own file of
+    that directory (at most every METRICS_FLUSH_INTERVAL seconds), so that any
+    process can serve the metrics of all of them (see collect).
+    """
+
+    def __init__(self, metrics):
+        self.metrics = {metric.name: metric for metric in metrics}
+        self._lock = Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        # a process's file name must be unique even if its pid is reused
+        self._file_name = 'metrics-%s-%s.json' % (self._pid, uuid.uuid4().hex)
+        self._samples = {name: {} for name in self.metrics}
+        self._flushed = time.monotonic()
+
+    def _check_fork(self):
+        # a forked worker must not report the samples of its parent as its own
+        if os.getpid() != self._pid:
+            self._reset()
+
+    def inc(self, name, label_values, amount=1):
+        with self._lock:
+            self._check_fork()
+            samples = self._samples[name]
+            samples[label_values] = samples.get(label_values, 0) + amount
+
+    def observe(self, name, label_values, amount):
+        metric = self.metrics[name]
+        with self._lock:
+            self._check_fork()
+            samples = self._samples[name]
+            value = samples.get(label_values)
+            if value is None:
+                value = samples[label_values] = metric.new_value()
+            value[bisect_left(metric.buckets, amount)] += 1
+            value[-2] += amount
+            value[-1] += 1
+
+    @property
+    def directory(self):
+        return getattr(settings, 'METRICS_DIR', None)
+
+    def maybe_flush(self):
+        """
+        Store this process's samples if it's been more than METRICS_FLUSH_INTERVAL
+        seconds since they were last stored.
+        """
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+        if self.directory and time.monotonic() - self._flushed >= interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Store this process's samples in its file of the METRICS_DIR directory.
+        """
+        directory = self.directory
+        if not directory:
+            return
+        with self._lock:
+            self._check_fork()
+            data = {name: [[list(k), v] for (k, v) in samples.items()]
+                    for (name, samples) in self._samples.items()}
+            self._flushed = time.monotonic()
+            file_name = self._file_name
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, file_name)
+        tmp_path = '%s.tmp' % path
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def collect(self):
+        """
+        Return the samples of all the processes: this process's live ones merged
+        with those stored by the other processes.
+        """
+        with self._lock:
+            self._check_fork()
+            merged = {name: dict((k, v if isinstance(v, int) else list(v))
+                                 for (k, v) in samples.items())
+                      for (name, samples) in self._samples.items()}
+            own_file_name = self._file_name
+        directory = self.directory
+        if directory and os.path.isdir(directory):
+            for file_name in os.listdir(directory):
+                if not file_name.endswith('.json') or file_name == own_file_name:
+                    continue
+                try:
+                    with open(os.path.join(directory, file_name)) as f:
+                        data = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                for (name, samples) in data.items():
+                    metric = self.metrics.get(name)
+                    if metric is None:
+                        continue
+                    for (label_values, value) in samples:
+                        key = tuple(label_values)
+                        current = merged[name].get(key)
+                        merged[name][key] = (value if current is None else
+                                             metric.merge(current, value))
+        return merged
+
+    def format(self):
+        """
+        Return the metrics of all the processes in the Prometheus text format.
+        """
+        samples = self.collect()
+        lines = []
+        for (name, metric) in self.metrics.items():
+            lines.extend(metric.format(samples[name]))
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+
+registry = MetricsRegistry(METRICS)
+
+
+class MetricsMiddleware(object):
+    """
+    Middleware that records the number of requests, their status, latency, number
+    of database queries and response size per url name (route) in the metrics
+    registry. The queries are counted by the request's timer when the
+    ResponseMiddleware times it. It's removed from the middleware chain unless the
+    METRICS setting is on.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS', False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        timer = get_request_timer(request)
+        with ExitStack() as stack:
+            counter = None
+            if timer is None:
+                counter = QueryCounter()
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+        queries = counter.count if counter is not None else timer.query_count
+
+        match = request.resolver_match
+        route = (match.url_name or 'unnamed') if match is not None else 'unmatched'
+        labels = (route, request.method)
+        registry.inc('api_requests_total', labels + (str(response.status_code),))
+        registry.observe('api_request_duration_seconds', labels, duration)
+        registry.observe('api_request_queries', labels, queries)
+        if not response.streaming:
+            registry.observe('api_response_size_bytes', labels, len(response.content))
+        registry.maybe_flush()
+        return response
@@ -1,36 +1,89 @@
 
+import json
+import logging
+
+from django.conf import settings
+from django.db import connection
 from django.http import HttpResponse
 
 from rest_framework import status
 from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
 
 from collectionjson.renderers import CollectionJsonRenderer
 
+from .timing import RequestTimer
+
+
+logger = logging.getLogger(__name__)
+
+# placeholder for the document's href in the pre-rendered Collection+JSON bodies
+_HREF_PLACEHOLDER = '__collectionjson_error_href__'
+
+
+class _PlaceholderRequest(object):
+    """
+    Stand-in request used to pre-render Collection+JSON error documents, its url
+    is a placeholder replaced by the actual request's url when the body is served.
+    """
+
+    def get_full_path(self):
+        return _HREF_PLACEHOLDER
+
+    def build_absolute_uri(self, location=None):
+        return _HREF_PLACEHOLDER
+
+
+class _ErrorResponse(object):
+    exception = True
+
+
+# pre-rendered error bodies keyed by media type, status code and detail
+_error_bodies = {}
+
+
+def get_error_body(media_type, status_code, detail):
+    """
+    Return the body of an error response for a media type, rendering it the first
+    time it's requested. Collection+JSON bodies contain a placeholder href.
+    """
+    key = (media_type, status_code, detail)
+    try:
+        return _error_bodies[key]
+    except KeyError:
+        pass
+    if media_type == 'application/json':
+        body = JSONRenderer().render({'error': detail})
+    else:
+        renderer_context = {'request': _PlaceholderRequest(), 'view': None,
+                            'response': _ErrorResponse()}
+        body = CollectionJsonRenderer().render({'detail': detail},
+                                               renderer_context=renderer_context)
+    _error_bodies[key] = body
+    return body
+
 
 class RenderedResponse(HttpResponse):
     """
-    An HttpResponse that renders its content into Collection+JSON or JSON.
+    An HttpResponse whose content is a Collection+JSON or JSON error document. The
+    documents are rendered once per media type and status, only the href of
+    Collection+JSON documents is filled in for each request.
     """
     def __init__(self, data, **kwargs):
         kwargs['status'] = data['status']
-        del data['status']
         request = data['request']
-        del data['request']
         mime = request.META.get('HTTP_ACCEPT')
         if mime=='application/json':
             kwargs['content_type'] = 'application/json'
-            data['error'] = data['detail']
-            del data['detail']
-            content = JSONRenderer().render(data)
+            content = get_error_body(mime, data['status'], data['detail'])
         else:
             kwargs['content_type'] = 'application/vnd.collection+json'
             self.exception = True
-            renderer_context = {}
-            renderer_context['request'] = request
-            renderer_context['view'] = None
-            renderer_context['response'] = self
-            content = CollectionJsonRenderer().render(data,
-                                                      renderer_context=renderer_context)
+            content = get_error_body(kwargs['content_type'], data['status'],
+                                     data['detail'])
+            href = json.dumps(CollectionJsonRenderer().get_href(request))[1:-1]
+            content = content.replace(_HREF_PLACEHOLDER.encode('utf-8'),
+                                      href.encode('utf-8'))
         super(RenderedResponse, self).__init__(content, **kwargs)
 
 
@@ -48,20 +101,43 @@ def api_500(request):
 
 
 class ResponseMiddleware(object):
+    """
+    Middleware that replaces Django's own 301 and 404 responses (e.g. for unknown
+    urls) and unhandled exceptions with Collection+JSON or JSON error documents.
+    When the SERVER_TIMING setting is on it also times each request, its phases
+    (timed by the views' ServerTimingMixin) and its database queries, which are
+    reported in a Server-Timing header and logged.
+    """
 
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
-        return self.get_response(request)
+        if not getattr(settings, 'SERVER_TIMING', False):
+            return self.process_response(request, self.get_response(request))
+        timer = RequestTimer()
+        request._request_timer = timer
+        with connection.execute_wrapper(timer):
+            response = self.process_response(request, self.get_response(request))
+        response['Server-Timing'] = timer.get_server_timing()
+        logger.debug('%s %s %s in %.1fms with %s queries', request.method,
+                     request.get_full_path(), response.status_code, timer.total * 1000,
+                     timer.query_count)
+        return response
 
     def process_response(self, request, response):
+        if isinstance(response, Response) or getattr(response, 'exception', False):
+            # already an API document
+            return response
         if response.status_code == status.HTTP_404_NOT_FOUND:
             return api_404(request)
         if response.status_code == status.HTTP_301_MOVED_PERMANENTLY:
-            return api_301(request)
+            rendered_response = api_301(request)
+            rendered_response['Location'] = response['Location']
+            return rendered_response
         return response
 
     def process_exception(self, request, exception):
-        print(exception)
+        logger.exception('Unhandled exception on %s %s', request.method,
+                         request.get_full_path())
         return api_500(request)
@@ -0,0 +1,106 @@
+
+import cProfile
+import os
+import re
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_QUERY_PARAM = 'profile'
+
+_SIGNING_SALT = 'core.profiling'
+# name of the stored profiles: <view>__<url name>__<timestamp>__<duration>ms.prof
+_PROFILE_NAME = re.compile(r'^(?P<view>\w+?)__(?P<url_name>.+)__'
+                           r'(?P<time>\d{8}T\d{6}\.\d{6})__(?P<duration>\d+)ms\.prof$')
+
+
+def make_profiling_token():
+    """
+    Return a signed value of the X-Profile header that enables the profiling of
+    the requests that send it until it expires.
+    """
+    return signing.dumps('profile', salt=_SIGNING_SALT)
+
+
+def is_profiling_requested(request):
+    """
+    Whether a request asks to be profiled with a valid signed X-Profile header or,
+    for staff users (authenticated by session), with the 'profile' query parameter.
+    """
+    token = request.META.get(PROFILE_HEADER)
+    if token:
+        max_age = getattr(settings, 'PROFILING_TOKEN_MAX_AGE', 3600)
+        try:
+            return signing.loads(token, salt=_SIGNING_SALT, max_age=max_age) == 'profile'
+        except signing.BadSignature:
+            return False
+    if PROFILE_QUERY_PARAM in request.GET:
+        user = getattr(request, 'user', None)
+        return user is not None and user.is_active and user.is_staff
+    return False
+
+
+def get_profile_name(request, duration):
+    """
+    Return the file name of the profile of a request, tagged with the view's name,
+    the url name, the time and the duration in milliseconds.
+    """
+    match = request.resolver_match
+    view = url_name = 'unknown'
+    if match is not None:
+        func = getattr(match.func, 'view_class', match.func)
+        view = func.__name__
+        url_name = match.url_name or url_name
+    return '%s__%s__%s__%dms.prof' % (view, url_name,
+                                      datetime.now().strftime('%Y%m%dT%H%M%S.%f'),
+                                      duration * 1000)
+
+
+def parse_profile_name(name):
+    """
+    Return a dictionary with the view, url name, time and duration (milliseconds)
+    of a stored profile's file name or None if it isn't a profile.
+    """
+    match = _PROFILE_NAME.match(name)
+    if match is None:
+        return None
+    info = match.groupdict()
+    info['duration'] = int(info['duration'])
+    return info
+
+
+class ProfilingMiddleware(object):
+    """
+    Middleware that runs the requests that ask for it (see is_profiling_requested)
+    under cProfile and stores their profiles in the PROFILING_DIR directory. The name
+    of the stored profile is sent in the X-Profile-File response header. It must be
+    placed after the AuthenticationMiddleware. It's removed from the middleware chain
+    unless the PROFILING setting is on, so it costs nothing when disabled.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING', False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not is_profiling_requested(request):
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        name = get_profile_name(request, time.perf_counter() - start)
+        directory = settings.PROFILING_DIR
+        os.makedirs(directory, exist_ok=True)
+        profiler.dump_stats(os.path.join(directory, name))
+        response['X-Profile-File'] = name
+        return response
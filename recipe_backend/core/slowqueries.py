@@ -0,0 +1,167 @@
+
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import traceback
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from threading import Lock
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+
+# directory of the project's sources, the stacks of slow queries only show its frames
+_SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_STACK_DEPTH = 5
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_VALUES_LIST = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """
+    Return the normalized form of an SQL statement shared by all the executions of
+    the same query: literals and parameters are replaced by '?', lists of values
+    (e.g. of IN clauses) are collapsed and whitespace is squeezed.
+    """
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _VALUES_LIST.sub('(...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def get_fingerprint(normalized_sql):
+    return hashlib.md5(normalized_sql.encode('utf-8')).hexdigest()[:12]
+
+
+def get_short_stack():
+    """
+    Return the innermost frames of the project's sources in the current stack (e.g.
+    the serializer or view that issued a query) as 'file:line in function' strings.
+    """
+    frames = []
+    for frame in traceback.extract_stack():
+        path = os.path.abspath(frame.filename)
+        if path.startswith(_SOURCE_DIR) and path != os.path.abspath(__file__):
+            frames.append('%s:%s in %s' % (os.path.relpath(path, _SOURCE_DIR),
+                                           frame.lineno, frame.name))
+    return frames[-_STACK_DEPTH:]
+
+
+_handler_lock = Lock()
+_handler = None
+
+
+def get_log_handler():
+    """
+    Return the rotating file handler of the SLOW_QUERY_LOG file. Its directory is
+    created, readable by its owner only, if it doesn't exist.
+    """
+    global _handler
+    path = os.path.abspath(settings.SLOW_QUERY_LOG)
+    with _handler_lock:
+        if _handler is None or _handler.baseFilename != path:
+            if _handler is not None:
+                _handler.close()
+            os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+            _handler = RotatingFileHandler(
+                path, maxBytes=getattr(settings, 'SLOW_QUERY_LOG_MAX_BYTES', 10485760),
+                backupCount=getattr(settings, 'SLOW_QUERY_LOG_BACKUP_COUNT', 5),
+                delay=True)
+        return _handler
+
+
+def write_slow_query(entry):
+    """
+    Append an entry (a dictionary) to the slow query log as a line of JSON.
+    """
+    get_log_handler().handle(logging.makeLogRecord(
+        {'name': __name__, 'msg': json.dumps(entry), 'levelno': logging.WARNING,
+         'levelname': 'WARNING'}))
+
+
+def read_slow_queries(path):
+    """
+    Generator of the entries of a slow query log and of its rotated files, oldest
+    first. Malformed lines are skipped.
+    """
+    backup_count = getattr(settings, 'SLOW_QUERY_LOG_BACKUP_COUNT', 5)
+    paths = ['%s.%s' % (path, i) for i in range(backup_count, 0, -1)] + [path]
+    for log_path in paths:
+        if not os.path.exists(log_path):
+            continue
+        with open(log_path) as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+class SlowQueryLogger(object):
+    """
+    Database execute wrapper that writes the queries of a request that take longer
+    than a threshold (in milliseconds) to the slow query log, together with the url
+    name and view class the request resolved to, the normalized SQL and its
+    fingerprint and the short stack of the project's code that issued them.
+    """
+
+    def __init__(self, request, threshold):
+        self.request = request
+        self.threshold = threshold
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - start) * 1000
+            if duration >= self.threshold:
+                self.log(sql, duration)
+
+    def log(self, sql, duration):
+        match = self.request.resolver_match
+        url_name = view = None
+        if match is not None:
+            url_name = match.url_name
+            func = getattr(match.func, 'view_class', match.func)
+            view = '%s.%s' % (func.__module__, func.__name__)
+        normalized_sql = normalize_sql(sql)
+        write_slow_query({
+            'time': datetime.now().isoformat(),
+            'duration_ms': round(duration, 3),
+            'method': self.request.method,
+            'path': self.request.path,
+            'url_name': url_name,
+            'view': view,
+            'fingerprint': get_fingerprint(normalized_sql),
+            'sql': normalized_sql,
+            'stack': get_short_stack(),
+        })
+
+
+class SlowQueryMiddleware(object):
+    """
+    Middleware that logs the slow queries of each request (see SlowQueryLogger). It's
+    removed from the middleware chain when the SLOW_QUERY_THRESHOLD or SLOW_QUERY_LOG
+    setting is None.
+    """
+
+    def __init__(self, get_response):
+        if (getattr(settings, 'SLOW_QUERY_THRESHOLD', None) is None or
+                getattr(settings, 'SLOW_QUERY_LOG', None) is None):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        query_logger = SlowQueryLogger(request, settings.SLOW_QUERY_THRESHOLD)
+        with connection.execute_wrapper(query_logger):
+            return self.get_response(request)
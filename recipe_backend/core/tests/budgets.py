@@ -0,0 +1,23 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetTestMixin(object):
+    """
+    Mixin for test cases that checks that read requests stay within the query
+    budget of their views.
+    """
+
+    def assertWithinQueryBudget(self, view_class, url, data=None, **extra):
+        """
+        Make a GET request and fail if it runs more queries than the view's budget.
+        Return the response.
+        """
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, data, **extra)
+        queries = context.captured_queries
+        if len(queries) > view_class.query_budget:
+            self.fail('GET %s ran %s queries, over the %s budget of %s:\n%s' % (
+                url, len(queries), view_class.__name__, view_class.query_budget,
+                '\n'.join(q['sql'] for q in queries)))
+        return response
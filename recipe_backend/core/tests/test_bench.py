@@ -0,0 +1,80 @@
+
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TransactionTestCase
+
+from core.bench import percentile
+from recipes.models import Recipe
+
+
+class BenchCommandTests(TransactionTestCase):
+    """
+    Test the benchmark command.
+    """
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.report_path = os.path.join(self.dir, 'report.json')
+
+    def bench(self, err=None, **options):
+        out = StringIO()
+        call_command('bench', users=4, ingredients=3, steps=3, requests=60, warmup=1,
+                     write_ratio=0.3, stdout=out, stderr=err or StringIO(), **options)
+        return json.loads(out.getvalue())
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile([3], 99), 3)
+
+    def test_bench_report(self):
+        report = self.bench(output=self.report_path)
+        self.assertEqual(report['total']['requests'], 60)
+        self.assertEqual(report['total']['errors'], 0)
+        for endpoint in report['endpoints'].values():
+            for key in ('p50_ms', 'p95_ms', 'p99_ms', 'requests_per_second',
+                        'queries_per_request'):
+                self.assertIn(key, endpoint)
+        with open(self.report_path) as f:
+            self.assertEqual(json.load(f)['endpoints'], report['endpoints'])
+        # the synthetic catalog is rolled back
+        self.assertEqual(User.objects.count(), 0)
+        self.assertEqual(Recipe.objects.count(), 0)
+
+    def test_bench_keep_uses_a_random_password(self):
+        err = StringIO()
+        self.bench(err=err, keep=True)
+        password = err.getvalue().split()[-1]
+        staff = User.objects.get(is_staff=True)
+        self.assertTrue(staff.check_password(password))
+        self.assertFalse(staff.check_password('bench-password'))
+
+    def test_bench_failure_regression(self):
+        report = self.bench()
+        for endpoint in report['endpoints'].values():
+            endpoint['p95_ms'] = 0.0001
+            endpoint['queries_per_request'] = 0
+        baseline_path = os.path.join(self.dir, 'baseline.json')
+        with open(baseline_path, 'w') as f:
+            json.dump(report, f)
+        with self.assertRaises(CommandError):
+            self.bench(baseline=baseline_path)
+
+    def test_bench_success_no_regression(self):
+        report = self.bench()
+        for endpoint in report['endpoints'].values():
+            endpoint['p95_ms'] = 1000000
+            endpoint['queries_per_request'] = 1000
+        baseline_path = os.path.join(self.dir, 'baseline.json')
+        with open(baseline_path, 'w') as f:
+            json.dump(report, f)
+        self.bench(baseline=baseline_path)
@@ -0,0 +1,99 @@
+
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.contrib.auth.models import User
+from django.urls import reverse
+
+from rest_framework import status
+
+from core.metrics import registry
+
+
+class MetricsTests(TestCase):
+    """
+    Test the recording of request metrics and the metrics view.
+    """
+
+    def setUp(self):
+        registry.clear()
+        self.metrics_url = reverse("metrics")
+        User.objects.create_user(username='staff', password='staffpassword',
+                                 is_staff=True)
+        User.objects.create_user(username='foo', password='foopassword')
+
+    def scrape(self, **extra):
+        response = self.client.get(self.metrics_url, **extra)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode('utf-8')
+
+    def get_sample(self, text, sample):
+        for line in text.splitlines():
+            if line.startswith(sample + ' '):
+                return float(line.split(' ')[-1])
+        return None
+
+    def test_metrics_are_recorded_per_route(self):
+        for i in range(3):
+            self.client.get(reverse("recipe-list"))
+        self.client.get(reverse("recipe-detail", kwargs={"pk": 1000}))
+        self.client.login(username='staff', password='staffpassword')
+        text = self.scrape()
+        self.assertEqual(self.get_sample(
+            text, 'api_requests_total{route="recipe-list",method="GET",status="200"}'), 3)
+        self.assertEqual(self.get_sample(
+            text, 'api_requests_total{route="recipe-detail",method="GET",status="404"}'),
+            1)
+        self.assertEqual(self.get_sample(
+            text, 'api_request_duration_seconds_count{route="recipe-list",method="GET"}'),
+            3)
+        self.assertEqual(self.get_sample(
+            text, 'api_request_duration_seconds_bucket{route="recipe-list",method="GET",'
+                  'le="+Inf"}'), 3)
+        self.assertGreater(self.get_sample(
+            text, 'api_request_queries_sum{route="recipe-list",method="GET"}'), 0)
+        self.assertGreater(self.get_sample(
+            text, 'api_response_size_bytes_sum{route="recipe-list",method="GET"}'), 0)
+        self.assertIn('# TYPE api_request_duration_seconds histogram', text)
+
+    def test_metrics_view_failure_anonymous(self):
+        response = self.client.get(self.metrics_url)
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED,
+                                             status.HTTP_403_FORBIDDEN))
+
+    def test_metrics_view_failure_not_staff(self):
+        self.client.login(username='foo', password='foopassword')
+        response = self.client.get(self.metrics_url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_metrics_view_success_bearer_token(self):
+        self.scrape(HTTP_AUTHORIZATION='Bearer s3cret')
+        response = self.client.get(self.metrics_url, HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertNotEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_metrics_are_shared_through_files(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with self.settings(METRICS_DIR=directory, METRICS_TOKEN='s3cret'):
+            self.client.get(reverse("recipe-list"))
+            # simulate another worker process that has stored its metrics
+            registry.flush()
+            os.rename(os.path.join(directory, os.listdir(directory)[0]),
+                      os.path.join(directory, 'metrics-other.json'))
+            self.client.get(reverse("recipe-list"))
+            text = self.scrape(HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(self.get_sample(
+            text, 'api_requests_total{route="recipe-list",method="GET",status="200"}'), 3)
+
+    @override_settings(METRICS=False)
+    def test_metrics_can_be_disabled(self):
+        self.client.get(reverse("recipe-list"))
+        self.client.login(username='staff', password='staffpassword')
+        text = self.scrape()
+        self.assertIsNone(self.get_sample(
+            text, 'api_requests_total{route="recipe-list",method="GET",status="200"}'))
@@ -0,0 +1,90 @@
+
+import json
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.contrib.auth.models import User
+from django.urls import reverse
+
+from rest_framework import status
+
+from collectionjson.renderers import CollectionJsonRenderer
+from core import middleware
+from recipes.views import RecipeList
+
+
+class ResponseMiddlewareTests(TestCase):
+    """
+    Test the response middleware.
+    """
+
+    def setUp(self):
+        middleware._error_bodies.clear()
+        User.objects.create_user(username='foo', password='foopassword')
+        self.url = reverse("recipe-list")
+
+    def get_server_timing(self, response):
+        metrics = {}
+        for metric in response['Server-Timing'].split(', '):
+            (name, params) = metric.split(';', 1)
+            metrics[name] = params
+        return metrics
+
+    def test_server_timing_header_has_each_phase(self):
+        self.client.login(username='foo', password='foopassword')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        metrics = self.get_server_timing(response)
+        for name in ('auth', 'db', 'serialize', 'render', 'total'):
+            self.assertIn(name, metrics)
+        self.assertIn('desc="%s queries"' % len(context.captured_queries), metrics['db'])
+
+    @override_settings(SERVER_TIMING=False)
+    def test_server_timing_can_be_disabled(self):
+        response = self.client.get(self.url)
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_unknown_url_collection_json_error(self):
+        response = self.client.get('/api/v1/unknown/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        content = json.loads(response.content.decode('utf8'))
+        self.assertEqual(content['collection']['href'],
+                         'http://testserver/api/v1/unknown/')
+        self.assertEqual(content['collection']['error'], {'message': 'Not found'})
+
+    def test_unknown_url_json_error(self):
+        response = self.client.get('/api/v1/unknown/', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(json.loads(response.content.decode('utf8')),
+                         {'error': 'Not found'})
+
+    def test_error_bodies_are_rendered_once(self):
+        with mock.patch.object(CollectionJsonRenderer, 'render',
+                               autospec=True,
+                               side_effect=CollectionJsonRenderer.render) as render:
+            self.client.get('/api/v1/unknown/')
+            response = self.client.get('/api/v1/other/')
+        self.assertEqual(render.call_count, 1)
+        content = json.loads(response.content.decode('utf8'))
+        self.assertEqual(content['collection']['href'], 'http://testserver/api/v1/other/')
+
+    def test_api_errors_are_not_replaced(self):
+        response = self.client.get(self.url, {'cursor': '!'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertContains(response, 'Invalid cursor', status_code=404)
+
+    def test_redirect_keeps_its_location(self):
+        response = self.client.get('/api/v1')
+        self.assertEqual(response.status_code, status.HTTP_301_MOVED_PERMANENTLY)
+        self.assertEqual(response['Location'], '/api/v1/')
+        self.assertContains(response, 'Moved Permanently', status_code=301)
+
+    def test_unhandled_exception_is_logged(self):
+        with mock.patch.object(RecipeList, 'list', side_effect=ValueError('boom')):
+            with self.assertLogs('core.middleware', level='ERROR') as logs:
+                response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertIn('boom', '\n'.join(logs.output))
@@ -0,0 +1,71 @@
+
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.urls import reverse
+
+from rest_framework import status
+
+from core.profiling import make_profiling_token, parse_profile_name
+
+
+class ProfilingTests(TestCase):
+    """
+    Test the on-demand profiling of requests and the profile report.
+    """
+
+    def setUp(self):
+        self.profiles_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profiles_dir)
+        self.url = reverse("recipe-list")
+        User.objects.create_user(username='foo', password='foopassword')
+        User.objects.create_user(username='staff', password='staffpassword',
+                                 is_staff=True)
+
+    def get_profiles(self):
+        return sorted(os.listdir(self.profiles_dir))
+
+    def test_profiling_is_disabled_by_default(self):
+        response = self.client.get(self.url, HTTP_X_PROFILE=make_profiling_token())
+        self.assertFalse(response.has_header('X-Profile-File'))
+
+    def test_signed_header_profiles_request(self):
+        with self.settings(PROFILING=True, PROFILING_DIR=self.profiles_dir):
+            response = self.client.get(self.url, HTTP_X_PROFILE=make_profiling_token())
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        profiles = self.get_profiles()
+        self.assertEqual(profiles, [response['X-Profile-File']])
+        info = parse_profile_name(profiles[0])
+        self.assertEqual(info['view'], 'RecipeList')
+        self.assertEqual(info['url_name'], 'recipe-list')
+
+    def test_invalid_signed_header_is_ignored(self):
+        with self.settings(PROFILING=True, PROFILING_DIR=self.profiles_dir):
+            response = self.client.get(self.url, HTTP_X_PROFILE='profile')
+        self.assertFalse(response.has_header('X-Profile-File'))
+        self.assertEqual(self.get_profiles(), [])
+
+    def test_query_parameter_profiles_staff_requests_only(self):
+        with self.settings(PROFILING=True, PROFILING_DIR=self.profiles_dir):
+            self.client.login(username='foo', password='foopassword')
+            self.client.get(self.url, {'profile': 1})
+            self.assertEqual(self.get_profiles(), [])
+            self.client.login(username='staff', password='staffpassword')
+            response = self.client.get(self.url, {'profile': 1})
+        self.assertEqual(self.get_profiles(), [response['X-Profile-File']])
+
+    def test_profile_report(self):
+        with self.settings(PROFILING=True, PROFILING_DIR=self.profiles_dir):
+            for url in (self.url, self.url, reverse("user-create")):
+                self.client.get(url, HTTP_X_PROFILE=make_profiling_token())
+        out = StringIO()
+        call_command('profilereport', dir=self.profiles_dir, top=5, stdout=out)
+        report = out.getvalue()
+        self.assertIn('RecipeList (recipe-list): 2 profiles', report)
+        self.assertIn('UserCreate (user-create): 1 profiles', report)
+        self.assertIn('cumulative', report)
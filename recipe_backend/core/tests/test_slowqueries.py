@@ -0,0 +1,78 @@
+
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+
+from core.slowqueries import normalize_sql, read_slow_queries
+
+
+class SlowQueryLogTests(TestCase):
+    """
+    Test the slow query log and its summary command.
+    """
+
+    def setUp(self):
+        # responses served from the response cache don't query the database
+        caches['default'].clear()
+        log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, log_dir)
+        self.log = os.path.join(log_dir, 'slow.log')
+
+    def get(self, url, threshold=0):
+        with self.settings(SLOW_QUERY_THRESHOLD=threshold, SLOW_QUERY_LOG=self.log):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return list(read_slow_queries(self.log))
+
+    def test_normalize_sql(self):
+        sql = ('SELECT "recipes_recipe"."id" FROM "recipes_recipe" WHERE '
+               '"recipes_recipe"."name" = \'soup\' AND "recipes_recipe"."id" IN '
+               '(%s, %s, %s)  LIMIT 21')
+        self.assertEqual(normalize_sql(sql),
+                         'SELECT "recipes_recipe"."id" FROM "recipes_recipe" WHERE '
+                         '"recipes_recipe"."name" = ? AND "recipes_recipe"."id" IN (...) '
+                         'LIMIT ?')
+
+    def test_slow_queries_are_attributed_to_route_and_view(self):
+        entries = self.get(reverse("recipe-list"))
+        self.assertTrue(entries)
+        for entry in entries:
+            self.assertEqual(entry['url_name'], 'recipe-list')
+            self.assertEqual(entry['view'], 'recipes.views.RecipeList')
+            self.assertEqual(len(entry['fingerprint']), 12)
+        stacks = '\n'.join('\n'.join(entry['stack']) for entry in entries)
+        self.assertIn('recipes/views.py', stacks)
+
+    def test_fast_queries_are_not_logged(self):
+        self.assertEqual(self.get(reverse("recipe-list"), threshold=60000), [])
+
+    def test_log_directory_is_created_private(self):
+        self.log = os.path.join(os.path.dirname(self.log), 'logs', 'slow.log')
+        self.assertTrue(self.get(reverse("recipe-list")))
+        self.assertEqual(os.stat(os.path.dirname(self.log)).st_mode & 0o777, 0o700)
+
+    def test_slow_queries_summary_failure_log_disabled(self):
+        with self.settings(SLOW_QUERY_LOG=None):
+            with self.assertRaises(CommandError):
+                call_command('slowqueries', stdout=StringIO())
+
+    def test_slow_queries_summary(self):
+        for i in range(2):
+            caches['default'].clear()
+            self.get(reverse("recipe-list"))
+        out = StringIO()
+        call_command('slowqueries', log=self.log, top=3, stdout=out)
+        report = out.getvalue()
+        self.assertIn('routes: recipe-list', report)
+        # each query of the view ran once per request
+        self.assertIn(': 2 queries, total', report)
+        self.assertLessEqual(report.count('  sql: '), 3)
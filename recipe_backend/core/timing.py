@@ -0,0 +1,103 @@
+
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class RequestTimer(object):
+    """
+    Timer of the phases of a request (e.g. authentication, serialization and
+    rendering). The time spent in a phase excludes the time spent in the phases
+    nested in it, so the phases never overlap. It's also a database execute wrapper
+    that times all the queries as the 'db' phase and counts them.
+    """
+
+    def __init__(self):
+        self.durations = OrderedDict()
+        self.query_count = 0
+        self._phase = None
+        self._mark = self.start = time.perf_counter()
+
+    def _switch(self, phase):
+        now = time.perf_counter()
+        if self._phase is not None:
+            self.durations[self._phase] = (self.durations.get(self._phase, 0) +
+                                           now - self._mark)
+        self._phase = phase
+        self._mark = now
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Context manager that times a phase.
+        """
+        previous = self._phase
+        self._switch(name)
+        try:
+            yield
+        finally:
+            self._switch(previous)
+
+    def __call__(self, execute, sql, params, many, context):
+        self.query_count += 1
+        with self.phase('db'):
+            return execute(sql, params, many, context)
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.start
+
+    def get_server_timing(self):
+        """
+        Return the value of a Server-Timing header with the duration of each phase
+        and of the whole request in milliseconds.
+        """
+        metrics = []
+        for (name, duration) in self.durations.items():
+            metric = '%s;dur=%.1f' % (name, duration * 1000)
+            if name == 'db':
+                metric += ';desc="%s queries"' % self.query_count
+            metrics.append(metric)
+        metrics.append('total;dur=%.1f' % (self.total * 1000))
+        return ', '.join(metrics)
+
+
+def get_request_timer(request):
+    """
+    Return the timer of a request (set by the ResponseMiddleware) or None.
+    """
+    return getattr(request, '_request_timer', None)
+
+
+class ServerTimingMixin(object):
+    """
+    Mixin for API views that times the authentication ('auth' phase), the view's
+    handler ('serialize' phase, which includes parsing, permission checks and
+    serialization) and the rendering of the response ('render' phase) of the
+    requests timed by the ResponseMiddleware. The response is rendered by the view
+    instead of by Django's request handler.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        """
+        Overriden to time the view's handler and render the response.
+        """
+        timer = get_request_timer(request)
+        if timer is None:
+            return super(ServerTimingMixin, self).dispatch(request, *args, **kwargs)
+        with timer.phase('serialize'):
+            response = super(ServerTimingMixin, self).dispatch(request, *args, **kwargs)
+        if callable(getattr(response, 'render', None)):
+            with timer.phase('render'):
+                response.render()
+        return response
+
+    def perform_authentication(self, request):
+        """
+        Overriden to time the authentication.
+        """
+        timer = get_request_timer(request)
+        if timer is None:
+            return super(ServerTimingMixin, self).perform_authentication(request)
+        with timer.phase('auth'):
+            super(ServerTimingMixin, self).perform_authentication(request)
@@ -0,0 +1,54 @@
+
+import hmac
+
+from django.conf import settings
+
+from rest_framework import permissions
+from rest_framework.renderers import BaseRenderer
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .metrics import registry
+
+
+class PrometheusRenderer(BaseRenderer):
+    """
+    Renderer of the Prometheus text exposition format.
+    """
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            # error responses
+            data = '# %s\n' % data.get('detail', '')
+        return data.encode(self.charset)
+
+
+class HasMetricsToken(permissions.BasePermission):
+    """
+    Custom permission to only allow the requests that send the METRICS_TOKEN setting
+    as a bearer token (e.g. Prometheus scrapers).
+    """
+
+    def has_permission(self, request, view):
+        token = getattr(settings, 'METRICS_TOKEN', None)
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        if not token or not header.startswith('Bearer '):
+            return False
+        return hmac.compare_digest(header[len('Bearer '):].encode('utf-8'),
+                                   token.encode('utf-8'))
+
+
+class Metrics(APIView):
+    """
+    A view for the request metrics of all the server processes in the Prometheus
+    text format, only available to staff users and metrics scrapers.
+    """
+    permission_classes = (HasMetricsToken | permissions.IsAdminUser,)
+    renderer_classes = (PrometheusRenderer,)
+
+    def get(self, request, *args, **kwargs):
+        return Response(registry.format(),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
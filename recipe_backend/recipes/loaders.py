@@ -0,0 +1,215 @@
+
+import csv
+import io
+import json
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from collectionjson.cache import invalidate_counts, response_cache
+
+from .models import Recipe, Ingredient, Step, IngredientToken, tokenize_ingredients
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def read_ndjson(f):
+    """
+    Generator of the recipe records of an NDJSON file: one JSON object per line with
+    the 'name', 'owner' (username) and lists of 'ingredients' and 'steps' texts.
+    Lines that are not valid JSON are yielded as InvalidRecord exceptions.
+    """
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield InvalidRecord('Invalid JSON: %s' % e)
+
+
+def read_csv(f):
+    """
+    Generator of the recipe records of a CSV file with 'name', 'owner', 'ingredients'
+    and 'steps' columns, where the texts of the ingredients and steps are separated
+    by new lines within their (quoted) cells.
+    """
+    for row in csv.DictReader(f):
+        record = dict(row)
+        for key in ('ingredients', 'steps'):
+            record[key] = [text for text in (record.get(key) or '').splitlines()
+                           if text.strip()]
+        yield record
+
+
+def clean_record(record):
+    """
+    Return the (name, owner, ingredients, steps) of a recipe record or raise
+    InvalidRecord.
+    """
+    if isinstance(record, InvalidRecord):
+        raise record
+    if not isinstance(record, dict):
+        raise InvalidRecord('A record must be an object.')
+    name = record.get('name')
+    owner = record.get('owner')
+    if not isinstance(name, str) or not name.strip():
+        raise InvalidRecord('A name is required.')
+    if len(name) > Recipe._meta.get_field('name').max_length:
+        raise InvalidRecord("Name '%s...' is too long." % name[:20])
+    if not isinstance(owner, str) or not owner:
+        raise InvalidRecord('An owner username is required.')
+    texts = []
+    for key in ('ingredients', 'steps'):
+        values = record.get(key) or []
+        if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+            raise InvalidRecord('%s must be a list of texts.' % key.capitalize())
+        if not all(v.strip() for v in values):
+            # as in the API, the texts of ingredients and steps can't be blank
+            raise InvalidRecord('%s can not be blank.' % key.capitalize())
+        texts.append(values)
+    return name, owner, texts[0], texts[1]
+
+
+class CatalogLoader(object):
+    """
+    Loads chunks of recipe records (see clean_record) with their ingredients and
+    steps using a handful of bulk statements per chunk: the owners are resolved (and
+    created if 'create_owners' is true) with one query, the recipes are inserted
+    with one INSERT and their ingredients, steps and ingredient tokens with
+    PostgreSQL's COPY (or batched INSERTs on other databases). The recipes' search
+    documents and ingredient tokens are computed while loading instead of by the
+    signal receivers, which are not run. Records whose owner already has a recipe
+    (e.g. loaded before a failure) or doesn't exist are skipped.
+    """
+
+    def __init__(self, create_owners=False, use_copy=None):
+        self.db = router.db_for_write(Recipe)
+        self.create_owners = create_owners
+        self.use_copy = (connections[self.db].vendor == 'postgresql' if use_copy is None
+                         else use_copy)
+        self.unusable_password = make_password(None)
+
+    def load(self, records):
+        """
+        Load a chunk of cleaned records in one transaction. Return the number of
+        loaded recipes, ingredients and steps and of skipped records.
+        """
+        with transaction.atomic(using=self.db):
+            owners = self.resolve_owners(set(record[1] for record in records))
+            now = timezone.now()
+            recipes = []
+            loaded = []
+            skipped = 0
+            for (name, owner, ingredients, steps) in records:
+                owner_id = owners.pop(owner, None)
+                if owner_id is None:
+                    # unknown owner, already the owner of a recipe or duplicated
+                    skipped += 1
+                    continue
+                search_document = '\n'.join([name] + ingredients + steps)
+                recipes.append(Recipe(name=name, owner_id=owner_id, modified=now,
+                                      search_document=search_document))
+                loaded.append((owner_id, ingredients, steps))
+            if not recipes:
+                return 0, 0, 0, skipped
+            recipe_ids = self.insert_recipes(recipes)
+
+            ingredient_rows = []
+            step_rows = []
+            token_rows = set()
+            for (recipe_id, (owner_id, ingredients, steps)) in zip(recipe_ids, loaded):
+                for (position, text) in enumerate(ingredients):
+                    ingredient_rows.append((text, now, recipe_id, position))
+                    token_rows.update((token, recipe_id)
+                                      for token in tokenize_ingredients(text))
+                for (position, text) in enumerate(steps):
+                    step_rows.append((text, now, recipe_id, position))
+            self.insert_rows(Ingredient, ('text', 'modified', 'recipe_id', 'position'),
+                             ingredient_rows)
+            self.insert_rows(Step, ('step_text', 'modified', 'recipe_id', 'position'),
+                             step_rows)
+            self.insert_rows(IngredientToken, ('token', 'recipe_id'), sorted(token_rows))
+        self.invalidate_caches(recipe_ids)
+        return len(recipe_ids), len(ingredient_rows), len(step_rows), skipped
+
+    def resolve_owners(self, usernames):
+        """
+        Return a dictionary of the ids of the given users that don't own a recipe
+        yet keyed by username, creating the missing users if requested.
+        """
+        users = dict(User.objects.using(self.db).filter(
+            username__in=usernames).values_list('username', 'id'))
+        missing = usernames - set(users)
+        if missing and self.create_owners:
+            User.objects.using(self.db).bulk_create(
+                [User(username=username, password=self.unusable_password)
+                 for username in sorted(missing)])
+            users.update(User.objects.using(self.db).filter(
+                username__in=missing).values_list('username', 'id'))
+        owners_with_recipe = set(Recipe.objects.using(self.db).filter(
+            owner_id__in=list(users.values())).values_list('owner_id', flat=True))
+        return {username: user_id for (username, user_id) in users.items()
+                if user_id not in owners_with_recipe}
+
+    def insert_recipes(self, recipes):
+        """
+        Insert recipes and return their ids in order.
+        """
+        features = connections[self.db].features
+        # the feature flag was renamed in Django 3.0
+        if (getattr(features, 'can_return_ids_from_bulk_insert', False) or
+                getattr(features, 'can_return_rows_from_bulk_insert', False)):
+            return [obj.pk for obj in Recipe.objects.using(self.db).bulk_create(recipes)]
+        Recipe.objects.using(self.db).bulk_create(recipes, batch_size=500)
+        # the owners are unique so they identify the inserted rows
+        owner_ids = [recipe.owner_id for recipe in recipes]
+        ids = {}
+        for i in range(0, len(owner_ids), 500):
+            ids.update(Recipe.objects.using(self.db).filter(
+                owner_id__in=owner_ids[i:i + 500]).values_list('owner_id', 'id'))
+        return [ids[owner_id] for owner_id in owner_ids]
+
+    def insert_rows(self, model, columns, rows):
+        """
+        Insert rows of values of the given columns of a model's table with COPY or,
+        if it's not available, with batched INSERTs.
+        """
+        if not rows:
+            return
+        if self.use_copy:
+            buffer = io.StringIO()
+            # COPY reads unquoted empty values as NULL
+            writer = csv.writer(buffer, quoting=csv.QUOTE_ALL)
+            for row in rows:
+                writer.writerow([v.isoformat() if hasattr(v, 'isoformat') else v
+                                 for v in row])
+            buffer.seek(0)
+            connection = connections[self.db]
+            sql = 'COPY %s (%s) FROM STDIN WITH (FORMAT csv)' % (
+                connection.ops.quote_name(model._meta.db_table),
+                ', '.join(connection.ops.quote_name(model._meta.get_field(c).column)
+                          for c in columns))
+            with connection.cursor() as cursor:
+                cursor.copy_expert(sql, buffer)
+            return
+        model.objects.using(self.db).bulk_create(
+            [model(**dict(zip(columns, row))) for row in rows], batch_size=500)
+
+    def invalidate_caches(self, recipe_ids):
+        """
+        Invalidate the cached counts and responses that the loaded recipes change.
+        """
+        for model in (Recipe, Ingredient, Step, IngredientToken):
+            invalidate_counts(model)
+        tags = ['recipes']
+        for pk in recipe_ids:
+            # the recipes' urls might have been cached as not found
+            tags.extend(['recipe:%s' % pk, 'recipe:%s:ingredients' % pk,
+                         'recipe:%s:steps' % pk])
+        response_cache.invalidate(*tags)
@@ -0,0 +1,138 @@
+
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.loaders import CatalogLoader, InvalidRecord, clean_record, read_csv, \
+    read_ndjson
+
+
+class Command(BaseCommand):
+    help = ('Load recipes with their ingredients and steps from an NDJSON or CSV file '
+            'in chunks, each committed in its own transaction. After each chunk the '
+            'number of records read is saved to a checkpoint file so that a failed '
+            'load resumes where it stopped. Records whose owner already has a '
+            'recipe or does not exist (unless --create-owners is given) are skipped.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="path of the file or '-' for the standard input")
+        parser.add_argument('--format', choices=('ndjson', 'csv'), default=None,
+                            help="format of the file (default: guessed from the path's "
+                                 "extension, ndjson otherwise)")
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='number of records per transaction (default: 1000)')
+        parser.add_argument('--create-owners', action='store_true',
+                            help='create the missing owners (without a usable password)')
+        parser.add_argument('--skip-invalid', action='store_true',
+                            help='skip invalid records instead of stopping the load')
+        parser.add_argument('--checkpoint', default=None,
+                            help="checkpoint file (default: the path plus "
+                                 "'.checkpoint', none for the standard input)")
+        parser.add_argument('--restart', action='store_true',
+                            help='ignore the checkpoint and read the file from the start')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('The chunk size must be positive.')
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        checkpoint = options['checkpoint']
+        if checkpoint is None and path != '-':
+            checkpoint = path + '.checkpoint'
+        start = 0 if options['restart'] else self.read_checkpoint(checkpoint)
+
+        try:
+            f = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        except OSError as e:
+            raise CommandError("Can't read %s: %s" % (path, e))
+        try:
+            records = read_csv(f) if fmt == 'csv' else read_ndjson(f)
+            self.load(records, start, checkpoint, options)
+        finally:
+            if f is not sys.stdin:
+                f.close()
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+    def load(self, records, start, checkpoint, options):
+        """
+        Custom method to load the records after the first 'start' ones in chunks.
+        """
+        loader = CatalogLoader(create_owners=options['create_owners'])
+        if start:
+            self.stdout.write('Resuming after record %s.' % start)
+        totals = [0, 0, 0, 0, 0]  # recipes, ingredients, steps, skipped, invalid
+        count = 0
+        began = time.time()
+        records = iter(records)
+        while True:
+            chunk = []
+            invalid = 0
+            read = 0
+            try:
+                for record in itertools.islice(records, options['chunk_size']):
+                    read += 1
+                    count += 1
+                    if count <= start:
+                        continue
+                    try:
+                        chunk.append(clean_record(record))
+                    except InvalidRecord as e:
+                        if not options['skip_invalid']:
+                            raise CommandError('Record %s: %s' % (count, e))
+                        invalid += 1
+            except csv.Error as e:
+                raise CommandError('Record %s: %s' % (count + 1, e))
+            if not read:
+                break
+            if count <= start:
+                continue
+            chunk_began = time.time()
+            (recipes, ingredients, steps, skipped) = loader.load(chunk)
+            self.write_checkpoint(checkpoint, count)
+            for (i, n) in enumerate((recipes, ingredients, steps, skipped, invalid)):
+                totals[i] += n
+            elapsed = time.time() - chunk_began
+            self.stdout.write(
+                'Record %s: loaded %s recipes, %s ingredients and %s steps (%s skipped, '
+                '%s invalid) in %.2fs, %.0f recipes/s, %.0f rows/s.' % (
+                    count, recipes, ingredients, steps, skipped, invalid, elapsed,
+                    recipes / elapsed if elapsed else 0,
+                    (recipes + ingredients + steps) / elapsed if elapsed else 0))
+        if count < start:
+            raise CommandError('The checkpoint is beyond the end of the file, use '
+                               '--restart to load it from the start.')
+        elapsed = time.time() - began
+        self.stdout.write(self.style.SUCCESS(
+            'Loaded %s recipes, %s ingredients and %s steps (%s skipped, %s invalid) in '
+            '%.2fs, %.0f recipes/s.' % (tuple(totals) + (
+                elapsed, totals[0] / elapsed if elapsed else 0))))
+
+    def read_checkpoint(self, checkpoint):
+        """
+        Custom method to read the number of records already loaded from the
+        checkpoint file (0 if there is none).
+        """
+        if not checkpoint or not os.path.exists(checkpoint):
+            return 0
+        try:
+            with open(checkpoint) as f:
+                return int(json.load(f)['records'])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            raise CommandError("Can't read the checkpoint %s: %s" % (checkpoint, e))
+
+    def write_checkpoint(self, checkpoint, count):
+        """
+        Custom method to atomically save the number of records already loaded.
+        """
+        if not checkpoint:
+            return
+        tmp_path = '%s.%s.tmp' % (checkpoint, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump({'records': count}, f)
+        os.replace(tmp_path, checkpoint)
@@ -0,0 +1,53 @@
+# Generated by Django 2.1.4 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+# must match recipes.models.SEARCH_CONFIG
+SEARCH_CONFIG = 'english'
+
+
+def build_search_documents(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    Step = apps.get_model('recipes', 'Step')
+    db_alias = schema_editor.connection.alias
+    for recipe in Recipe.objects.using(db_alias).iterator():
+        texts = [recipe.name]
+        texts.extend(Ingredient.objects.using(db_alias).filter(
+            recipe_id=recipe.id).order_by('id').values_list('text', flat=True))
+        texts.extend(Step.objects.using(db_alias).filter(
+            recipe_id=recipe.id).order_by('id').values_list('step_text', flat=True))
+        Recipe.objects.using(db_alias).filter(id=recipe.id).update(
+            search_document='\n'.join(texts))
+
+
+def create_search_index(apps, schema_editor):
+    # full-text search index (only PostgreSQL)
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE INDEX recipe_search_document_idx ON recipes_recipe USING GIN "
+            "(to_tsvector('%s'::regconfig, COALESCE(search_document, '')))"
+            % SEARCH_CONFIG)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS recipe_search_document_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_recipe_name_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_document',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.RunPython(build_search_documents, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 2.1.4 on 2026-10-18 15:20
+
+import re
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# copy of the ingredient tokenizer of recipes.models when the migration was written,
+# so that later changes to it don't change this migration
+STOP_WORDS = frozenset([
+    'and', 'or', 'of', 'the', 'for', 'with', 'to', 'taste', 'cup', 'cups', 'tbsp',
+    'tsp', 'tablespoon', 'tablespoons', 'teaspoon', 'teaspoons', 'pinch', 'gram',
+    'grams', 'kg', 'ml', 'oz', 'ounce', 'ounces', 'lb', 'lbs', 'pound', 'pounds',
+    'large', 'small', 'medium', 'fresh', 'chopped', 'sliced', 'diced', 'some',
+])
+
+WORD = re.compile(r'[^\W\d_]+')
+
+
+def normalize_word(word):
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 4 and word.endswith(('oes', 'ches', 'shes', 'sses', 'xes')):
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us')):
+        return word[:-1]
+    return word
+
+
+def tokenize_ingredients(text):
+    words = (normalize_word(w) for w in WORD.findall(text.lower()))
+    return set(w for w in words if 1 < len(w) <= 100 and w not in STOP_WORDS)
+
+
+def build_ingredient_tokens(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientToken = apps.get_model('recipes', 'IngredientToken')
+    db_alias = schema_editor.connection.alias
+    entries = set()
+    for (recipe_id, text) in Ingredient.objects.using(db_alias).values_list(
+            'recipe_id', 'text').iterator():
+        entries.update((recipe_id, token) for token in tokenize_ingredients(text))
+    IngredientToken.objects.using(db_alias).bulk_create(
+        [IngredientToken(recipe_id=recipe_id, token=token)
+         for (recipe_id, token) in entries], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_search_document'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngredientToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=100)),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingredient_tokens', to='recipes.Recipe')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='ingredienttoken',
+            unique_together={('token', 'recipe')},
+        ),
+        migrations.RunPython(build_ingredient_tokens, migrations.RunPython.noop),
+    ]
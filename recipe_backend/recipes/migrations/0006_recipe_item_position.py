@@ -0,0 +1,68 @@
+# Generated by Django 2.1.4 on 2026-10-18 17:05
+
+from django.db import migrations, models
+from django.db.models import Case, Value, When
+
+
+def set_positions(queryset, positions):
+    whens = [When(pk=pk, then=Value(position)) for (pk, position) in positions]
+    queryset.filter(pk__in=[pk for (pk, position) in positions]).update(
+        position=Case(*whens, output_field=models.PositiveIntegerField()))
+
+
+def number_recipe_items(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    for model_name in ('Ingredient', 'Step'):
+        queryset = apps.get_model('recipes', model_name).objects.using(db_alias)
+        next_positions = {}
+        positions = []
+        for (pk, recipe_id) in queryset.order_by('recipe_id', 'id').values_list(
+                'id', 'recipe_id').iterator():
+            position = next_positions.get(recipe_id, 0)
+            next_positions[recipe_id] = position + 1
+            if position:
+                positions.append((pk, position))
+            if len(positions) == 1000:
+                set_positions(queryset, positions)
+                positions = []
+        if positions:
+            set_positions(queryset, positions)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_ingredienttoken'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='ingredient',
+            options={'ordering': ('position', 'id')},
+        ),
+        migrations.AlterModelOptions(
+            name='step',
+            options={'ordering': ('position', 'id')},
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='position',
+            field=models.PositiveIntegerField(default=0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='step',
+            name='position',
+            field=models.PositiveIntegerField(default=0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.RunPython(number_recipe_items, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['recipe', 'position'], name='ingredient_recipe_position_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='step',
+            index=models.Index(fields=['recipe', 'position'], name='step_recipe_position_idx'),
+        ),
+    ]
@@ -1,46 +1,358 @@
 
-from django.db import models
+import operator
+import re
+from functools import reduce
+
+from django.core.exceptions import ValidationError
+from django.db import connections, models, router
+from django.db.models import Case, Count, F, IntegerField, Max, Value, When
+from django.utils import timezone
 
 import django_filters
 from django_filters.rest_framework import FilterSet
 
 
+# text search configuration of PostgreSQL's full-text search (the search document
+# index in the migrations must use the same configuration)
+SEARCH_CONFIG = 'english'
+
+
+# words that are never indexed as ingredient tokens (quantities, units, etc)
+INGREDIENT_STOP_WORDS = frozenset([
+    'and', 'or', 'of', 'the', 'for', 'with', 'to', 'taste', 'cup', 'cups', 'tbsp',
+    'tsp', 'tablespoon', 'tablespoons', 'teaspoon', 'teaspoons', 'pinch', 'gram',
+    'grams', 'kg', 'ml', 'oz', 'ounce', 'ounces', 'lb', 'lbs', 'pound', 'pounds',
+    'large', 'small', 'medium', 'fresh', 'chopped', 'sliced', 'diced', 'some',
+])
+
+_WORD = re.compile(r'[^\W\d_]+')
+
+
+def normalize_ingredient_word(word):
+    """
+    Return the singular form of a lowercase ingredient word (e.g. tomatoes -> tomato,
+    cherries -> cherry, eggs -> egg).
+    """
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 4 and word.endswith(('oes', 'ches', 'shes', 'sses', 'xes')):
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us')):
+        return word[:-1]
+    return word
+
+
+def tokenize_ingredients(text):
+    """
+    Return the set of normalized tokens of an ingredient text.
+    """
+    words = (normalize_ingredient_word(w) for w in _WORD.findall(text.lower()))
+    return set(w for w in words
+               if 1 < len(w) <= 100 and w not in INGREDIENT_STOP_WORDS)
+
+
+class RecipeQuerySet(models.QuerySet):
+
+    def with_ingredients(self, text, min_match=None):
+        """
+        Return the recipes that have all (or at least 'min_match') of the ingredients
+        in a text (e.g. 'eggs, flour, milk') using the ingredient token index. Recipes
+        are annotated with the number of matched tokens ('coverage') and ordered by
+        it.
+        """
+        tokens = tokenize_ingredients(text)
+        if not tokens:
+            return self.none()
+        min_match = len(tokens) if min_match is None else min(min_match, len(tokens))
+        queryset = self.filter(ingredient_tokens__token__in=tokens).annotate(
+            coverage=Count('ingredient_tokens'))
+        queryset = queryset.filter(coverage__gte=max(min_match, 1))
+        return queryset.order_by('-coverage', 'name', 'id')
+
+    def search(self, text):
+        """
+        Return the recipes whose name, ingredients or steps contain all the words of a
+        search text ordered by relevance (annotated as 'rank'). PostgreSQL's indexed
+        full-text search is used when available, otherwise each word is looked up in
+        the search documents and a word found in the recipe's name ranks higher.
+        """
+        if connections[self.db].vendor == 'postgresql':
+            from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                                        SearchVector)
+            vector = SearchVector('search_document', config=SEARCH_CONFIG)
+            query = SearchQuery(text, config=SEARCH_CONFIG)
+            queryset = self.annotate(search=vector).filter(search=query)
+            queryset = queryset.annotate(rank=SearchRank(vector, query))
+        else:
+            words = text.split()
+            if not words:
+                return self.none()
+            queryset = self
+            ranks = []
+            for word in words:
+                queryset = queryset.filter(search_document__icontains=word)
+                ranks.append(Case(When(name__icontains=word, then=Value(2)),
+                                  default=Value(1), output_field=IntegerField()))
+            queryset = queryset.annotate(rank=reduce(operator.add, ranks))
+        return queryset.order_by('-rank', 'name', 'id')
+
+
 class Recipe(models.Model):
     name = models.CharField(max_length=100)
+    modified = models.DateTimeField(auto_now=True)
+    # text of the recipe's name, ingredients and steps used by the search
+    search_document = models.TextField(default='', editable=False)
     owner = models.OneToOneField('auth.User', on_delete=models.CASCADE,
                                  related_name='recipe')
 
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
         ordering = ('name',)
+        # supports the keyset pagination of recipe listings
+        indexes = [models.Index(fields=['name', 'id'], name='recipe_name_id_idx')]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def touch(cls, *pks):
+        """
+        Update the modification time of the recipes with the given ids (e.g. when
+        their ingredients or steps change) without sending any signal.
+        """
+        cls.objects.filter(pk__in=pks).update(modified=timezone.now())
+
+    @classmethod
+    def update_search_documents(cls, *pks):
+        """
+        Rebuild the search documents of the recipes with the given ids from their
+        names, ingredients and steps without sending any signal.
+        """
+        texts = {pk: [name] for (pk, name) in
+                 cls.objects.filter(pk__in=pks).values_list('id', 'name')}
+        ingredients = Ingredient.objects.filter(recipe_id__in=list(texts))
+        steps = Step.objects.filter(recipe_id__in=list(texts))
+        for (recipe_id, text) in ingredients.values_list('recipe_id', 'text'):
+            texts[recipe_id].append(text)
+        for (recipe_id, text) in steps.values_list('recipe_id', 'step_text'):
+            texts[recipe_id].append(text)
+        for (pk, recipe_texts) in texts.items():
+            cls.objects.filter(pk=pk).update(search_document='\n'.join(recipe_texts))
+
 
 class RecipeFilter(FilterSet):
     owner_username = django_filters.CharFilter(field_name='owner__username',
                                                lookup_expr='exact')
     name = django_filters.CharFilter(field_name='name', lookup_expr='icontains')
     name_exact = django_filters.CharFilter(field_name='name', lookup_expr='exact')
+    search = django_filters.CharFilter(method='search_recipes')
+    ingredients = django_filters.CharFilter(method='filter_ingredients')
+    min_ingredients = django_filters.NumberFilter(method='filter_min_ingredients')
     
     class Meta:
         model = Recipe
-        fields = ['id', 'name', 'name_exact', 'owner_username']
+        fields = ['id', 'name', 'name_exact', 'owner_username', 'search', 'ingredients',
+                  'min_ingredients']
+
+    def search_recipes(self, queryset, name, value):
+        """
+        Custom method to get the recipes matching a full-text search ranked by
+        relevance.
+        """
+        return queryset.search(value)
+
+    def filter_ingredients(self, queryset, name, value):
+        """
+        Custom method to get the recipes that have all the comma-separated
+        ingredients or at least 'min_ingredients' of them.
+        """
+        min_match = self.form.cleaned_data.get('min_ingredients')
+        return queryset.with_ingredients(value, int(min_match) if min_match else None)
+
+    def filter_min_ingredients(self, queryset, name, value):
+        """
+        Custom method that doesn't filter by itself, the value is used by the
+        'ingredients' filter.
+        """
+        return queryset
+
 
+class RecipeItem(models.Model):
+    """
+    Abstract model of the items of a recipe's ordered lists (ingredients and steps).
+    Items are listed by their position within the recipe. New items are appended
+    to the end of the list.
+    """
+    position = models.PositiveIntegerField(editable=False)
 
-class Ingredient(models.Model):
+    class Meta:
+        abstract = True
+        ordering = ('position', 'id')
+
+    def save(self, *args, **kwargs):
+        """
+        Overriden to append a new item to the end of its recipe's list.
+        """
+        if self.position is None:
+            self.assign_positions([self])
+        super(RecipeItem, self).save(*args, **kwargs)
+
+    @classmethod
+    def assign_positions(cls, objs):
+        """
+        Append the given new items (without position) to the end of their recipes'
+        lists, in order.
+        """
+        objs = [obj for obj in objs if obj.position is None]
+        recipe_ids = set(obj.recipe_id for obj in objs)
+        if not recipe_ids:
+            return
+        next_positions = dict.fromkeys(recipe_ids, 0)
+        last_positions = cls.objects.filter(recipe_id__in=recipe_ids).order_by().values(
+            'recipe_id').annotate(last_position=Max('position'))
+        for (recipe_id, position) in last_positions.values_list('recipe_id',
+                                                                'last_position'):
+            next_positions[recipe_id] = position + 1
+        for obj in objs:
+            obj.position = next_positions[obj.recipe_id]
+            next_positions[obj.recipe_id] += 1
+
+    @classmethod
+    def replace_recipe_items(cls, recipe_id, items):
+        """
+        Replace the list of items of a recipe with a new one given as a list of
+        (id, attributes) pairs in the new order, where the id is None for new items.
+        Only the rows that change are written: the existing items that move or whose
+        attributes change are updated with a single UPDATE, the ones missing from
+        the new list are deleted with a single DELETE and the new ones are inserted
+        with a single INSERT, so a reorder is just one UPDATE. No signals are sent.
+        Must be called within a transaction. Return whether any row was written.
+        """
+        current = {obj.id: obj for obj in
+                   cls.objects.select_for_update().filter(recipe_id=recipe_id)}
+        ids = [pk for (pk, attrs) in items if pk is not None]
+        unknown = set(ids) - set(current)
+        if unknown:
+            raise ValidationError('Unknown %s ids: %s.' % (
+                cls._meta.verbose_name, ', '.join(str(pk) for pk in sorted(unknown))))
+        if len(set(ids)) != len(ids):
+            raise ValidationError('Duplicated %s ids.' % cls._meta.verbose_name)
+
+        changes = {}
+        new_objs = []
+        for (position, (pk, attrs)) in enumerate(items):
+            if pk is None:
+                new_objs.append(cls(recipe_id=recipe_id, position=position, **attrs))
+                continue
+            obj = current[pk]
+            changed = {name: value for (name, value) in attrs.items()
+                       if getattr(obj, name) != value}
+            if obj.position != position:
+                changed['position'] = position
+            if changed:
+                changes[pk] = changed
+        removed = set(current) - set(ids)
+
+        if changes:
+            # a single UPDATE sets the changed columns of each row with CASE expressions
+            fields = set(name for changed in changes.values() for name in changed)
+            values = {}
+            for name in fields:
+                whens = [When(pk=pk, then=Value(changed[name]))
+                         for (pk, changed) in changes.items() if name in changed]
+                values[name] = Case(*whens, default=F(name),
+                                    output_field=cls._meta.get_field(name))
+            cls.objects.filter(pk__in=list(changes)).update(modified=timezone.now(),
+                                                            **values)
+        if removed:
+            cls.delete_rows(removed)
+        if new_objs:
+            cls.objects.bulk_create(new_objs)
+        return bool(changes or removed or new_objs)
+
+
+    @classmethod
+    def delete_rows(cls, pks):
+        """
+        Delete the items with the given ids with single DELETE statements (in
+        batches), without the collection of related objects and the signals of
+        QuerySet.delete(), which aren't needed as nothing references the items.
+        """
+        pks = list(pks)
+        connection = connections[router.db_for_write(cls)]
+        quote_name = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            for i in range(0, len(pks), 500):
+                batch = pks[i:i + 500]
+                cursor.execute('DELETE FROM %s WHERE %s IN (%s)' % (
+                    quote_name(cls._meta.db_table), quote_name(cls._meta.pk.column),
+                    ', '.join(['%s'] * len(batch))), batch)
+
+
+class Ingredient(RecipeItem):
     text = models.TextField()
+    modified = models.DateTimeField(auto_now=True)
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
                                related_name='ingredients')
 
+    class Meta(RecipeItem.Meta):
+        indexes = [models.Index(fields=['recipe', 'position'],
+                                name='ingredient_recipe_position_idx')]
+
     def __str__(self):
         return self.text
 
 
-class Step(models.Model):
+class Step(RecipeItem):
     step_text = models.TextField()
+    modified = models.DateTimeField(auto_now=True)
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
                                related_name='steps')
 
+    class Meta(RecipeItem.Meta):
+        indexes = [models.Index(fields=['recipe', 'position'],
+                                name='step_recipe_position_idx')]
+
     def __str__(self):
         return self.step_text
+
+
+class IngredientToken(models.Model):
+    """
+    Inverted index of the normalized words (tokens) of the ingredients of each
+    recipe. The token's index entries are the posting list of the recipes that
+    have the ingredient.
+    """
+    token = models.CharField(max_length=100)
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
+                               related_name='ingredient_tokens')
+
+    class Meta:
+        unique_together = ('token', 'recipe')
+
+    def __str__(self):
+        return self.token
+
+    @classmethod
+    def update_recipes(cls, *recipe_ids):
+        """
+        Bring the index entries of the recipes with the given ids up to date with
+        their ingredients, only inserting and deleting the tokens that changed.
+        """
+        tokens = {recipe_id: set() for recipe_id in recipe_ids}
+        for (recipe_id, text) in Ingredient.objects.filter(
+                recipe_id__in=recipe_ids).values_list('recipe_id', 'text'):
+            tokens[recipe_id].update(tokenize_ingredients(text))
+        indexed = {recipe_id: set() for recipe_id in recipe_ids}
+        for (recipe_id, token) in cls.objects.filter(
+                recipe_id__in=recipe_ids).values_list('recipe_id', 'token'):
+            indexed[recipe_id].add(token)
+        new_entries = []
+        for recipe_id in recipe_ids:
+            removed = indexed[recipe_id] - tokens[recipe_id]
+            if removed:
+                cls.objects.filter(recipe_id=recipe_id, token__in=removed).delete()
+            new_entries.extend(cls(recipe_id=recipe_id, token=token)
+                               for token in tokens[recipe_id] - indexed[recipe_id])
+        cls.objects.bulk_create(new_entries)
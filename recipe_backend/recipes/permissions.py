@@ -14,8 +14,9 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             return True
 
-        # Write permissions are only allowed to the authenticated user.
-        return request.user.is_authenticated and (obj.owner == request.user)
+        # Write permissions are only allowed to the authenticated user. The owner's
+        # id is compared so the owner's row is never fetched.
+        return request.user.is_authenticated and (obj.owner_id == request.user.id)
 
 
 class IsRecipeOwnerOrReadOnly(permissions.BasePermission):
@@ -30,5 +31,12 @@ class IsRecipeOwnerOrReadOnly(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             return True
 
-        # Write permissions are only allowed to the owner of the related recipe.
-        return request.user.is_authenticated and (obj.recipe.owner == request.user)
+        # Write permissions are only allowed to the owner of the related recipe. The
+        # owner's id is read from the 'recipe_owner_id' annotation of the view's
+        # queryset if there is one so the recipe's row is never fetched.
+        if not request.user.is_authenticated:
+            return False
+        owner_id = getattr(obj, 'recipe_owner_id', None)
+        if owner_id is None:
+            owner_id = obj.recipe.owner_id
+        return owner_id == request.user.id
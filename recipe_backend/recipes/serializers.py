@@ -1,20 +1,95 @@
 
+from django.contrib.auth.models import User
+from django.db import router, connections
+
 from rest_framework import serializers
 
+from collectionjson.fields import EmbeddedField
+from collectionjson.fields import HyperlinkedIdentityField, HyperlinkedRelatedField
+
 from .models import Recipe
 from .models import Step
 from .models import Ingredient
+from .signals import post_bulk_create
+
+
+class BulkCreateListSerializer(serializers.ListSerializer):
+    """
+    A list serializer that creates all of its items with a single bulk INSERT.
+    """
+    max_items = 1000
+
+    def validate(self, attrs):
+        if len(attrs) > self.max_items:
+            raise serializers.ValidationError(
+                {'non_field_errors': ["A maximum of %s items can be created at once."
+                                      % self.max_items]})
+        return attrs
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        objs = [model(**attrs) for attrs in validated_data]
+        if hasattr(model, 'assign_positions'):
+            # bulk_create() doesn't call save()
+            model.assign_positions(objs)
+        features = connections[router.db_for_write(model)].features
+        # the feature flag was renamed in Django 3.0
+        if (getattr(features, 'can_return_ids_from_bulk_insert', False) or
+                getattr(features, 'can_return_rows_from_bulk_insert', False)):
+            objs = model.objects.bulk_create(objs)
+            post_bulk_create.send(sender=model, instances=objs)
+            return objs
+        # the database can't report the primary keys of bulk inserted rows
+        for obj in objs:
+            obj.save(force_insert=True)
+        return objs
+
+
+class IngredientSerializer(serializers.HyperlinkedModelSerializer):
+    serializer_url_field = HyperlinkedIdentityField
+    recipe = HyperlinkedRelatedField(view_name='recipe-detail', read_only=True)
+
+    class Meta:
+        model = Ingredient
+        fields = ('url', 'id', 'text', 'recipe', 'position')
+        list_serializer_class = BulkCreateListSerializer
+
+
+class StepSerializer(serializers.HyperlinkedModelSerializer):
+    serializer_url_field = HyperlinkedIdentityField
+    recipe = HyperlinkedRelatedField(view_name='recipe-detail', read_only=True)
+
+    class Meta:
+        model = Step
+        fields = ('url', 'id', 'step_text', 'recipe', 'position')
+        list_serializer_class = BulkCreateListSerializer
+
+
+class OwnerSerializer(serializers.HyperlinkedModelSerializer):
+    """
+    Public representation of a recipe's owner.
+    """
+    serializer_url_field = HyperlinkedIdentityField
+
+    class Meta:
+        model = User
+        fields = ('url', 'username')
 
 
 class RecipeSerializer(serializers.HyperlinkedModelSerializer):
+    serializer_url_field = HyperlinkedIdentityField
     owner_username = serializers.ReadOnlyField(source='owner.username')
-    ingredients = serializers.HyperlinkedIdentityField(view_name='ingredient-list')
-    steps = serializers.HyperlinkedIdentityField(view_name='step-list')
-    owner = serializers.HyperlinkedRelatedField(view_name='user-detail', read_only=True)
+    ingredients = HyperlinkedIdentityField(view_name='ingredient-list')
+    steps = HyperlinkedIdentityField(view_name='step-list')
+    owner = HyperlinkedRelatedField(view_name='user-detail', read_only=True)
+    embedded = EmbeddedField({'ingredients': IngredientSerializer(many=True),
+                              'steps': StepSerializer(many=True),
+                              'owner': OwnerSerializer()})
     
     class Meta:
         model = Recipe
-        fields = ('url', 'id', 'name', 'owner_username', 'ingredients', 'steps', 'owner')
+        fields = ('url', 'id', 'name', 'owner_username', 'ingredients', 'steps', 'owner',
+                  'embedded')
 
     def create(self, validated_data):
         """
@@ -26,21 +101,3 @@ class RecipeSerializer(serializers.HyperlinkedModelSerializer):
             raise serializers.ValidationError(
                 {'non_field_errors': ["User can only create a single recipe."]})
         return super(RecipeSerializer, self).create(validated_data)
-
-
-class IngredientSerializer(serializers.HyperlinkedModelSerializer):
-    recipe = serializers.HyperlinkedRelatedField(view_name='recipe-detail',
-                                                 read_only=True)
-
-    class Meta:
-        model = Ingredient
-        fields = ('url', 'id', 'text', 'recipe')
-
-
-class StepSerializer(serializers.HyperlinkedModelSerializer):
-    recipe = serializers.HyperlinkedRelatedField(view_name='recipe-detail',
-                                                 read_only=True)
-
-    class Meta:
-        model = Step
-        fields = ('url', 'id', 'step_text', 'recipe')
@@ -0,0 +1,154 @@
+
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver, Signal
+
+from collectionjson.cache import fragment_cache, response_cache, invalidate_counts
+
+from .models import Recipe, Ingredient, Step, IngredientToken
+
+
+# sent after model instances are created with a single bulk INSERT, which doesn't
+# send the post_save signal
+post_bulk_create = Signal(providing_args=['instances'])
+post_bulk_create.connect(invalidate_counts, dispatch_uid='recipes_invalidate_bulk_counts')
+
+# sent after the lists of ingredients or steps of some recipes are replaced (e.g.
+# reordered) with bulk queries, which don't send any model signal
+post_bulk_update = Signal(providing_args=['recipe_ids'])
+post_bulk_update.connect(invalidate_counts,
+                         dispatch_uid='recipes_invalidate_bulk_update_counts')
+
+
+@receiver(post_save, sender=User)
+def invalidate_owner_recipe_caches(sender, instance, update_fields=None, **kwargs):
+    """
+    Remove the cached fragments and responses of a user's recipe and update its
+    modification time as they embed the owner's username.
+    """
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    recipe_ids = list(Recipe.objects.filter(owner=instance).values_list('id', flat=True))
+    if recipe_ids:
+        # the recipes' validators must change too
+        Recipe.touch(*recipe_ids)
+    for recipe_id in recipe_ids:
+        fragment_cache.invalidate(Recipe, recipe_id)
+        response_cache.invalidate('recipes', 'recipe:%s' % recipe_id)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe_responses(sender, instance, **kwargs):
+    """
+    Invalidate the cached responses that include a saved or deleted recipe.
+    """
+    tags = ['recipes', 'recipe:%s' % instance.pk]
+    if kwargs.get('created', True):
+        # the recipe's nested lists might have been cached as not found
+        tags.extend(_get_list_tag(model, instance.pk) for model in (Ingredient, Step))
+    response_cache.invalidate(*tags)
+
+
+@receiver(post_save, sender=Recipe)
+def update_search_document(sender, instance, update_fields=None, **kwargs):
+    """
+    Rebuild the search document of a saved recipe as its name might have changed.
+    """
+    if update_fields and 'name' not in update_fields:
+        return
+    Recipe.update_search_documents(instance.pk)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Step)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Step)
+def touch_recipe(sender, instance, **kwargs):
+    """
+    Update the modification time of the recipe of a saved or deleted ingredient or
+    step so that it validates the recipe's nested lists, rebuild its search document
+    and invalidate the cached responses of the affected list and recipe searches.
+    """
+    Recipe.touch(instance.recipe_id)
+    Recipe.update_search_documents(instance.recipe_id)
+    # the fragments of the recipe's previous version can't be served anymore
+    fragment_cache.invalidate(Recipe, instance.recipe_id)
+    invalidate_counts(Recipe)
+    # recipe searches also match the text of ingredients and steps, which can also be
+    # embedded in the recipe's representation
+    response_cache.invalidate('recipes', 'recipe:%s' % instance.recipe_id,
+                              _get_list_tag(sender, instance.recipe_id))
+
+
+@receiver(post_bulk_create, sender=Ingredient)
+@receiver(post_bulk_create, sender=Step)
+def touch_recipes(sender, instances, **kwargs):
+    """
+    Update the modification time and search document of the recipes of bulk created
+    ingredients or steps and invalidate the cached responses of the affected lists
+    and recipe searches.
+    """
+    _touch_recipes(sender, set(obj.recipe_id for obj in instances))
+
+
+@receiver(post_bulk_update, sender=Ingredient)
+@receiver(post_bulk_update, sender=Step)
+def touch_updated_recipes(sender, recipe_ids, **kwargs):
+    """
+    Same as touch_recipes for the recipes whose lists of ingredients or steps have
+    been replaced.
+    """
+    _touch_recipes(sender, set(recipe_ids))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def update_ingredient_tokens(sender, instance, **kwargs):
+    """
+    Update the ingredient token index of the recipe of a saved or deleted ingredient.
+    """
+    IngredientToken.update_recipes(instance.recipe_id)
+    invalidate_counts(IngredientToken)
+
+
+@receiver(post_bulk_create, sender=Ingredient)
+def update_bulk_ingredient_tokens(sender, instances, **kwargs):
+    """
+    Update the ingredient token index of the recipes of bulk created ingredients.
+    """
+    IngredientToken.update_recipes(*set(obj.recipe_id for obj in instances))
+    invalidate_counts(IngredientToken)
+
+
+@receiver(post_bulk_update, sender=Ingredient)
+def update_replaced_ingredient_tokens(sender, recipe_ids, **kwargs):
+    """
+    Update the ingredient token index of the recipes whose ingredients have been
+    replaced.
+    """
+    IngredientToken.update_recipes(*set(recipe_ids))
+    invalidate_counts(IngredientToken)
+
+
+def _touch_recipes(model, recipe_ids):
+    """
+    Update the modification time and search document of the recipes whose
+    ingredients or steps (the given model) have been written in bulk and invalidate
+    the cached responses of the affected lists and recipe searches.
+    """
+    Recipe.touch(*recipe_ids)
+    Recipe.update_search_documents(*recipe_ids)
+    invalidate_counts(Recipe)
+    tags = ['recipes']
+    for pk in recipe_ids:
+        fragment_cache.invalidate(Recipe, pk)
+        tags.extend(['recipe:%s' % pk, _get_list_tag(model, pk)])
+    response_cache.invalidate(*tags)
+
+
+def _get_list_tag(model, recipe_id):
+    """
+    Return the response cache tag of a recipe's nested list of ingredients or steps.
+    """
+    return 'recipe:%s:%ss' % (recipe_id, model._meta.model_name)
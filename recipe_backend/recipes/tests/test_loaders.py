@@ -0,0 +1,132 @@
+
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+
+from recipes.loaders import CatalogLoader
+from recipes.models import Recipe, Ingredient, Step, IngredientToken
+
+
+class LoadCatalogCommandTests(TestCase):
+    """
+    Test the loadcatalog command.
+    """
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'catalog.ndjson')
+        self.records = [{'name': 'Recipe %s' % i, 'owner': 'cook%s' % i,
+                         'ingredients': ['%s tomatoes' % i, 'salt'],
+                         'steps': ['Chop', 'Season']} for i in range(5)]
+        self.write_ndjson(self.records)
+
+    def write_ndjson(self, records):
+        with open(self.path, 'w') as f:
+            for record in records:
+                f.write((record if isinstance(record, str) else json.dumps(record)) +
+                        '\n')
+
+    def load(self, path=None, **options):
+        out = StringIO()
+        call_command('loadcatalog', path or self.path, stdout=out, **options)
+        return out.getvalue()
+
+    def test_load_ndjson(self):
+        out = self.load(chunk_size=2, create_owners=True)
+        self.assertIn('Loaded 5 recipes, 10 ingredients and 10 steps', out)
+        self.assertEqual(out.count('recipes/s'), 4)  # one line per chunk and the total
+        recipe = Recipe.objects.get(name='Recipe 3')
+        self.assertEqual(recipe.owner.username, 'cook3')
+        self.assertFalse(recipe.owner.has_usable_password())
+        self.assertEqual([(i.text, i.position) for i in recipe.ingredients.all()],
+                         [('3 tomatoes', 0), ('salt', 1)])
+        self.assertEqual([s.step_text for s in recipe.steps.all()], ['Chop', 'Season'])
+        self.assertEqual(recipe.search_document, 'Recipe 3\n3 tomatoes\nsalt\nChop\nSeason')
+        self.assertEqual(set(IngredientToken.objects.filter(
+            recipe=recipe).values_list('token', flat=True)), {'tomato', 'salt'})
+        self.assertFalse(os.path.exists(self.path + '.checkpoint'))
+
+    def test_load_csv(self):
+        path = os.path.join(self.dir, 'catalog.csv')
+        with open(path, 'w') as f:
+            f.write('name,owner,ingredients,steps\n'
+                    'Soup,cook0,"water\nonions",Boil\n')
+        User.objects.create_user(username='cook0', password='cookpassword')
+        self.load(path)
+        recipe = Recipe.objects.get(name='Soup')
+        self.assertEqual([i.text for i in recipe.ingredients.all()], ['water', 'onions'])
+        self.assertEqual([s.step_text for s in recipe.steps.all()], ['Boil'])
+
+    def test_load_skips_owners_with_recipe_and_missing_owners(self):
+        user = User.objects.create_user(username='cook0', password='cookpassword')
+        Recipe.objects.create(name='Existing', owner=user)
+        User.objects.create_user(username='cook1', password='cookpassword')
+        out = self.load()
+        self.assertIn('Loaded 1 recipes, 2 ingredients and 2 steps (4 skipped', out)
+        self.assertEqual(Recipe.objects.get(owner=user).name, 'Existing')
+
+    def test_load_resumes_after_failure(self):
+        insert_recipes = CatalogLoader.insert_recipes
+        calls = []
+
+        def failing_insert_recipes(loader, recipes):
+            calls.append(recipes)
+            if len(calls) == 2:
+                raise RuntimeError('Connection lost')
+            return insert_recipes(loader, recipes)
+
+        with mock.patch.object(CatalogLoader, 'insert_recipes', failing_insert_recipes):
+            with self.assertRaises(RuntimeError):
+                self.load(chunk_size=2, create_owners=True)
+        # the first chunk was committed and the second one rolled back
+        self.assertEqual(Recipe.objects.count(), 2)
+        with open(self.path + '.checkpoint') as f:
+            self.assertEqual(json.load(f), {'records': 2})
+
+        out = self.load(chunk_size=2, create_owners=True)
+        self.assertIn('Resuming after record 2.', out)
+        self.assertIn('Loaded 3 recipes', out)
+        self.assertEqual(Recipe.objects.count(), 5)
+        self.assertEqual(Ingredient.objects.count(), 10)
+        self.assertEqual(Step.objects.count(), 10)
+
+    def test_load_failure_invalid_record(self):
+        self.write_ndjson(self.records[:2] + ['{not json'] + [{'name': 'No owner'}])
+        with self.assertRaisesRegex(CommandError, 'Record 3: Invalid JSON'):
+            self.load(create_owners=True)
+        self.assertEqual(Recipe.objects.count(), 0)
+        out = self.load(create_owners=True, skip_invalid=True)
+        self.assertIn('Loaded 2 recipes, 4 ingredients and 4 steps (0 skipped, 2 invalid)',
+                      out)
+
+    def test_insert_rows_with_copy(self):
+        loader = CatalogLoader(use_copy=True)
+        cursor = mock.MagicMock()
+        with mock.patch.object(connection, 'cursor') as cursor_factory:
+            cursor_factory.return_value.__enter__.return_value = cursor
+            loader.insert_rows(Step, ('step_text', 'recipe_id', 'position'),
+                               [('Boil, then "simmer"', 1, 0), ('', 1, 1)])
+        (sql, buffer) = cursor.copy_expert.call_args[0]
+        self.assertEqual(sql, 'COPY "recipes_step" ("step_text", "recipe_id", '
+                              '"position") FROM STDIN WITH (FORMAT csv)')
+        # empty texts are quoted so that they aren't read as NULL
+        self.assertEqual(buffer.read(), '"Boil, then ""simmer""","1","0"\r\n'
+                                        '"","1","1"\r\n')
+
+    def test_load_failure_blank_text(self):
+        self.write_ndjson([dict(self.records[0], steps=['Chop', ''])] + self.records[1:])
+        with self.assertRaisesRegex(CommandError, 'Record 1: Steps can not be blank.'):
+            self.load(create_owners=True)
+        self.assertEqual(Recipe.objects.count(), 0)
+        out = self.load(create_owners=True, skip_invalid=True)
+        self.assertIn('Loaded 4 recipes', out)
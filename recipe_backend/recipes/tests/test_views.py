@@ -1,16 +1,27 @@
 
+import gzip
 import json
+from base64 import b64encode
 from unittest import mock
 
+from django.core.cache import caches
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.urls import reverse
 from django.contrib.auth.models import User
 
 from rest_framework import status
 
+from collectionjson.cache import fragment_cache
+from core.tests.budgets import QueryBudgetTestMixin
 from recipes.models import Recipe
 from recipes.models import Ingredient
 from recipes.models import Step
+from recipes.permissions import IsRecipeOwnerOrReadOnly
+from recipes.serializers import RecipeSerializer
+from recipes import views
+from recipes.views import RecipeList
 
 
 class ViewTests(TestCase):
@@ -68,6 +79,130 @@ class RecipeListViewTests(ViewTests):
         response = self.client.get(self.create_read_url)
         self.assertContains(response, self.recipe_name)
 
+    def test_recipe_list_collection_document_is_compiled_on_first_use(self):
+        response = self.client.get(self.create_read_url)
+        self.assertTrue(RecipeList.collection_document.is_compiled)
+        collection = json.loads(response.content.decode('utf8'))['collection']
+        self.assertEqual(collection['queries'][0]['href'],
+                         'http://testserver' + reverse("recipe-list-query-search"))
+        self.assertEqual(collection['template'], {'data': [{'name': 'name', 'value': ''}]})
+
+    @override_settings(COLLECTIONJSON_RELATIVE_LINKS=True)
+    def test_recipe_list_relative_links(self):
+        response = self.client.get(self.create_read_url)
+        collection = json.loads(response.content.decode('utf8'))['collection']
+        recipe = Recipe.objects.get(name=self.recipe_name)
+        self.assertEqual(collection['href'], self.create_read_url)
+        self.assertEqual(collection['items'][0]['href'],
+                         reverse("recipe-detail", kwargs={"pk": recipe.id}))
+
+    def test_recipe_list_conditional_get(self):
+        response1 = self.client.get(self.create_read_url)
+        response2 = self.client.get(self.create_read_url,
+                                    HTTP_IF_NONE_MATCH=response1['ETag'])
+        self.assertEqual(response2.status_code, status.HTTP_304_NOT_MODIFIED)
+        user = User.objects.get(username='another')
+        Recipe.objects.create(name='another_recipe', owner=user)
+        response3 = self.client.get(self.create_read_url,
+                                    HTTP_IF_NONE_MATCH=response1['ETag'])
+        self.assertEqual(response3.status_code, status.HTTP_200_OK)
+        self.assertContains(response3, 'another_recipe')
+
+    def test_recipe_list_has_no_last_modified(self):
+        user = User.objects.get(username='another')
+        Recipe.objects.create(name='another_recipe', owner=user)
+        response1 = self.client.get(self.create_read_url)
+        self.assertNotIn('Last-Modified', response1)
+        Recipe.objects.get(name='another_recipe').delete()
+        response2 = self.client.get(self.create_read_url,
+                                    HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(response2.status_code, status.HTTP_200_OK)
+        self.assertNotContains(response2, 'another_recipe')
+
+    def create_recipes(self, names):
+        for name in names:
+            user = User.objects.create_user(username='cook%s' % User.objects.count(),
+                                            password='cook-pass')
+            Recipe.objects.create(name=name, owner=user)
+
+    def get_collection(self, url, params=None):
+        response = self.client.get(url, params, HTTP_ACCEPT=self.content_type)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return json.loads(response.content.decode('utf8'))['collection']
+
+    def get_link(self, collection, rel):
+        hrefs = [link['href'] for link in collection['links'] if link['rel'] == rel]
+        return hrefs[0] if hrefs else None
+
+    def test_recipe_list_keyset_pagination(self):
+        self.create_recipes(['pie', 'cake', 'pie', 'stew'])
+        expected = list(Recipe.objects.order_by('name', 'id').values_list('id',
+                                                                           flat=True))
+        collection = self.get_collection(self.create_read_url,
+                                         {'cursor': '', 'limit': 2})
+        self.assertIsNone(self.get_link(collection, 'previous'))
+        ids = [item['data'][0]['value'] for item in collection['items']]
+        pages = [ids]
+        next_link = self.get_link(collection, 'next')
+        while next_link:
+            collection = self.get_collection(next_link)
+            pages.append([item['data'][0]['value'] for item in collection['items']])
+            next_link = self.get_link(collection, 'next')
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(sum(pages, []), expected)
+        # walk back from the last page
+        collection = self.get_collection(self.get_link(collection, 'previous'))
+        self.assertEqual([item['data'][0]['value'] for item in collection['items']],
+                         pages[1])
+        self.assertEqual(collection['total'], 5)
+
+    def test_recipe_list_keyset_pagination_failure_invalid_cursor(self):
+        response = self.client.get(self.create_read_url, {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_recipe_list_keyset_pagination_failure_invalid_cursor_values(self):
+        for position in (['r01', 'abc'], ['r01', None], ['r01', [1]]):
+            cursor = b64encode(json.dumps({'p': position}).encode('utf-8'))
+            response = self.client.get(self.create_read_url,
+                                       {'cursor': cursor.decode('ascii')})
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_recipe_list_expand_uses_a_fixed_number_of_queries(self):
+        def count_queries():
+            fragment_cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(self.create_read_url,
+                                           {'expand': 'ingredients,steps,owner'},
+                                           HTTP_ACCEPT='application/json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(context.captured_queries)
+
+        self.client.login(username=self.username, password=self.password)
+        self.create_recipes(['pie'])
+        queries = count_queries()
+        self.create_recipes(['cake', 'stew', 'soup'])
+        for recipe in Recipe.objects.all():
+            Ingredient.objects.create(recipe=recipe, text='salt')
+        self.assertEqual(count_queries(), queries)
+        response = self.client.get(self.create_read_url, {'expand': 'ingredients'},
+                                   HTTP_ACCEPT='application/json')
+        embedded = response.data['results'][0]['embedded']
+        self.assertEqual(list(embedded), ['ingredients'])
+        self.assertEqual(embedded['ingredients'][0]['text'], 'salt')
+
+    def test_recipe_list_streaming_success(self):
+        self.client.login(username=self.username, password=self.password)
+        response = self.client.get(self.create_read_url, {'stream': 'true'})
+        self.assertTrue(response.streaming)
+        content = json.loads(b''.join(response.streaming_content).decode('utf8'))
+        collection = content['collection']
+        self.assertEqual(collection['total'], 1)
+        self.assertEqual(collection['items'][0]['data'][1],
+                         {'name': 'name', 'value': self.recipe_name})
+        self.assertIn('template', collection)
+        self.assertIn('queries', collection)
+        self.assertIn('user', [link['rel'] for link in collection['links']])
+
 
 class RecipeDetailViewTests(ViewTests):
     """
@@ -91,6 +226,130 @@ class RecipeDetailViewTests(ViewTests):
         response = self.client.get(self.read_update_delete_url)
         self.assertContains(response, self.recipe_name)
 
+    def test_recipe_detail_is_served_from_fragment_cache(self):
+        fragment_cache.clear()
+        with mock.patch.object(RecipeSerializer, 'to_representation', autospec=True,
+                               side_effect=RecipeSerializer.to_representation) as to_repr:
+            response1 = self.client.get(self.read_update_delete_url)
+            response2 = self.client.get(self.read_update_delete_url)
+        self.assertEqual(to_repr.call_count, 1)
+        self.assertEqual(json.loads(response1.content.decode('utf8')),
+                         json.loads(response2.content.decode('utf8')))
+
+    def test_recipe_detail_fragment_is_invalidated_on_update(self):
+        self.client.get(self.read_update_delete_url)
+        recipe = Recipe.objects.get(name=self.recipe_name)
+        recipe.name = 'renamed_recipe'
+        recipe.save()
+        response = self.client.get(self.read_update_delete_url)
+        self.assertContains(response, 'renamed_recipe')
+
+    def test_recipe_detail_fragments_are_dropped_when_recipe_is_touched(self):
+        fragment_cache.clear()
+        caches['default'].clear()
+        recipe = Recipe.objects.get(name=self.recipe_name)
+        self.client.get(self.read_update_delete_url)
+        self.assertIn(('recipes.recipe', recipe.pk), fragment_cache._instance_keys)
+        Ingredient.objects.create(recipe=recipe, text='salt')
+        self.assertNotIn(('recipes.recipe', recipe.pk), fragment_cache._instance_keys)
+
+    def test_recipe_detail_template_is_not_an_item_field(self):
+        response = self.client.get(self.read_update_delete_url)
+        collection = json.loads(response.content.decode('utf8'))['collection']
+        item_fields = [d['name'] for d in collection['items'][0]['data']]
+        self.assertNotIn('template', item_fields)
+        self.assertEqual(collection['template'], {'data': [{'name': 'name', 'value': ''}]})
+
+    def test_recipe_detail_conditional_get_not_modified(self):
+        response1 = self.client.get(self.read_update_delete_url)
+        self.assertIn('ETag', response1)
+        self.assertIn('Last-Modified', response1)
+        with mock.patch.object(RecipeSerializer, 'to_representation',
+                               autospec=True) as to_repr:
+            response2 = self.client.get(self.read_update_delete_url,
+                                        HTTP_IF_NONE_MATCH=response1['ETag'])
+        self.assertEqual(response2.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response2['ETag'], response1['ETag'])
+        to_repr.assert_not_called()
+
+    def test_recipe_detail_conditional_get_modified(self):
+        response1 = self.client.get(self.read_update_delete_url)
+        recipe = Recipe.objects.get(name=self.recipe_name)
+        recipe.name = 'renamed_recipe'
+        recipe.save()
+        response2 = self.client.get(self.read_update_delete_url,
+                                    HTTP_IF_NONE_MATCH=response1['ETag'])
+        self.assertEqual(response2.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response2['ETag'], response1['ETag'])
+
+    @override_settings(COLLECTIONJSON_RESPONSE_CACHE='default')
+    def test_recipe_detail_anonymous_response_is_cached(self):
+        response1 = self.client.get(self.read_update_delete_url)
+        with self.assertNumQueries(0):
+            response2 = self.client.get(self.read_update_delete_url)
+        self.assertEqual(response2.content, response1.content)
+        self.assertEqual(response2['ETag'], response1['ETag'])
+        with self.assertNumQueries(0):
+            response3 = self.client.get(self.read_update_delete_url,
+                                        HTTP_IF_NONE_MATCH=response1['ETag'])
+        self.assertEqual(response3.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @override_settings(COLLECTIONJSON_RESPONSE_CACHE='default')
+    def test_recipe_detail_cached_response_is_keyed_by_accept_variant(self):
+        self.client.get(self.read_update_delete_url)
+        response = self.client.get(self.read_update_delete_url,
+                                   HTTP_ACCEPT='application/json')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.json()['name'], self.recipe_name)
+
+    @override_settings(COLLECTIONJSON_RESPONSE_CACHE='default')
+    def test_recipe_detail_cached_response_is_invalidated_on_update(self):
+        self.client.get(self.read_update_delete_url)
+        recipe = Recipe.objects.get(name=self.recipe_name)
+        recipe.name = 'renamed_recipe'
+        recipe.save()
+        response = self.client.get(self.read_update_delete_url)
+        self.assertContains(response, 'renamed_recipe')
+
+    @override_settings(COLLECTIONJSON_RESPONSE_CACHE='default')
+    def test_recipe_detail_cached_response_is_invalidated_on_owner_update(self):
+        self.client.get(self.read_update_delete_url)
+        user = User.objects.get(username=self.username)
+        user.username = 'renamed_user'
+        user.save()
+        response = self.client.get(self.read_update_delete_url)
+        self.assertContains(response, 'renamed_user')
+
+    @override_settings(COLLECTIONJSON_RESPONSE_CACHE='default')
+    def test_recipe_detail_authenticated_response_is_not_cached(self):
+        self.client.login(username=self.username, password=self.password)
+        self.client.get(self.read_update_delete_url)
+        with mock.patch('collectionjson.services.response_cache.get') as cache_get:
+            self.client.get(self.read_update_delete_url)
+        cache_get.assert_not_called()
+
+    def test_recipe_detail_expand_success(self):
+        recipe = Recipe.objects.get(name=self.recipe_name)
+        Ingredient.objects.create(recipe=recipe, text='flour')
+        Step.objects.create(recipe=recipe, step_text='mix')
+        response = self.client.get(self.read_update_delete_url,
+                                   {'expand': 'ingredients,steps,owner'})
+        item = json.loads(response.content.decode('utf8'))['collection']['items'][0]
+        self.assertNotIn('embedded', [d['name'] for d in item['data']])
+        embedded = item['embedded']
+        self.assertEqual(embedded['ingredients'][0]['data'][1],
+                         {'name': 'text', 'value': 'flour'})
+        self.assertEqual(embedded['steps'][0]['data'][1],
+                         {'name': 'step_text', 'value': 'mix'})
+        self.assertEqual(embedded['owner'][0]['data'],
+                         [{'name': 'username', 'value': self.username}])
+        self.assertNotContains(response, self.email)
+
+    def test_recipe_detail_is_not_expanded_by_default(self):
+        response = self.client.get(self.read_update_delete_url)
+        item = json.loads(response.content.decode('utf8'))['collection']['items'][0]
+        self.assertNotIn('embedded', item)
+
     def test_recipe_update_success(self):
         self.client.login(username=self.username, password=self.password)
         response = self.client.put(self.read_update_delete_url, data=self.put,
@@ -133,18 +392,218 @@ class RecipeListQuerySearchViewTests(ViewTests):
         super(RecipeListQuerySearchViewTests, self).setUp()
         self.list_url = reverse("recipe-list-query-search") + '?owner_username=' + self.username
 
+    def test_recipe_list_query_search_streaming_prefetches_expanded_relations(self):
+        for i in range(5):
+            user = User.objects.create_user(username='cook%s' % i, password='pass')
+            recipe = Recipe.objects.create(name='dish%s' % i, owner=user)
+            Ingredient.objects.create(recipe=recipe, text='salt')
+            Step.objects.create(recipe=recipe, step_text='mix')
+        url = reverse("recipe-list-query-search")
+        params = {'limit': 20, 'expand': 'ingredients,steps'}
+        fragment_cache.clear()
+        with self.assertNumQueries(4):
+            response = self.client.get(url, params)
+        fragment_cache.clear()
+        with self.assertNumQueries(4):
+            response = self.client.get(url, dict(params, stream='true'))
+            content = json.loads(b''.join(response.streaming_content).decode('utf8'))
+        items = content['collection']['items']
+        self.assertEqual(len(items), 6)
+        self.assertEqual(len(items[1]['embedded']['ingredients']), 1)
+
     def test_recipe_list_query_search_success_authenticated(self):
         self.client.login(username=self.username, password=self.password)
         response = self.client.get(self.list_url)
         self.assertContains(response, self.username)
         self.assertContains(response, self.recipe_name)
 
+    @override_settings(COLLECTIONJSON_ESTIMATED_COUNT_THRESHOLD=100)
+    def test_recipe_list_query_search_estimated_total(self):
+        with mock.patch('collectionjson.pagination.get_estimated_count',
+                        return_value=1000):
+            response = self.client.get(self.list_url, {'limit': 1})
+        collection = json.loads(response.content.decode('utf8'))['collection']
+        self.assertEqual(collection['total'], 1000)
+        self.assertTrue(collection['total_estimated'])
+        self.assertEqual(len(collection['items']), 1)
+        self.assertEqual(collection['links'], [])
+
+    def test_recipe_list_query_search_counts_once(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.list_url)
+        self.assertEqual(response.data['count'], 1)
+        # the validators' aggregate query counts the total of the page
+        self.assertEqual(len(context.captured_queries), 2)
+        self.assertEqual(len([q for q in context.captured_queries
+                              if 'COUNT(' in q['sql']]), 1)
+
+    @override_settings(COLLECTIONJSON_ESTIMATED_COUNT_THRESHOLD=100)
+    def test_recipe_list_query_search_estimated_total_is_not_counted(self):
+        with mock.patch('collectionjson.pagination.get_estimated_count',
+                        return_value=1000):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(self.list_url, {'limit': 1})
+        self.assertEqual(response.data['count'], 1000)
+        self.assertFalse([q for q in context.captured_queries if 'COUNT(' in q['sql']])
+
+    def test_recipe_list_query_search_exact_total(self):
+        response = self.client.get(self.list_url)
+        collection = json.loads(response.content.decode('utf8'))['collection']
+        self.assertEqual(collection['total'], 1)
+        self.assertFalse(collection['total_estimated'])
+
+    def test_recipe_list_query_search_full_text(self):
+        recipe = Recipe.objects.get(name=self.recipe_name)
+        ingredient = Ingredient.objects.create(recipe=recipe, text='Fresh basil')
+        Step.objects.create(recipe=recipe, step_text='Chop the basil leaves')
+        user = User.objects.create_user(username='cook', password='cook-pass')
+        Recipe.objects.create(name='Basil pesto', owner=user)
+        response = self.client.get(reverse("recipe-list-query-search"),
+                                   {'search': 'basil'})
+        # the recipe with the word in its name ranks first
+        self.assertEqual([r['name'] for r in response.data['results']],
+                         ['Basil pesto', self.recipe_name])
+        response = self.client.get(reverse("recipe-list-query-search"),
+                                   {'search': 'chop leaves'})
+        self.assertEqual([r['name'] for r in response.data['results']],
+                         [self.recipe_name])
+        # the search document is maintained on write
+        ingredient.delete()
+        Step.objects.filter(recipe=recipe).delete()
+        response = self.client.get(reverse("recipe-list-query-search"),
+                                   {'search': 'basil'})
+        self.assertEqual([r['name'] for r in response.data['results']],
+                         ['Basil pesto'])
+        self.assertEqual(response.data['count'], 1)
+
+    def test_recipe_list_query_search_by_ingredients(self):
+        pantry = {'omelette': ['3 large Eggs', 'Milk', 'Salt'],
+                  'pancakes': ['2 cups of flour', '2 eggs', 'milk'],
+                  'salad': ['tomatoes', 'olive oil', 'salt']}
+        for (name, ingredients) in pantry.items():
+            user = User.objects.create_user(username=name, password='cook-pass')
+            recipe = Recipe.objects.create(name=name, owner=user)
+            for text in ingredients:
+                Ingredient.objects.create(recipe=recipe, text=text)
+        url = reverse("recipe-list-query-search")
+        response = self.client.get(url, {'ingredients': 'egg, milk'})
+        self.assertEqual([r['name'] for r in response.data['results']],
+                         ['omelette', 'pancakes'])
+        response = self.client.get(url, {'ingredients': 'eggs, flour, milk',
+                                         'min_ingredients': 2})
+        # ranked by the number of matched ingredients
+        self.assertEqual([r['name'] for r in response.data['results']],
+                         ['pancakes', 'omelette'])
+        response = self.client.get(url, {'ingredients': 'salt, tomato',
+                                         'min_ingredients': 1})
+        self.assertEqual([r['name'] for r in response.data['results']],
+                         ['salad', 'omelette'])
+        self.assertEqual(response.data['count'], 2)
+        # the index is maintained on ingredient writes
+        Ingredient.objects.filter(text='Salt').delete()
+        response = self.client.get(url, {'ingredients': 'salt, tomato',
+                                         'min_ingredients': 1})
+        self.assertEqual([r['name'] for r in response.data['results']], ['salad'])
+        self.assertEqual(response.data['count'], 1)
+
     def test_plugin_list_query_search_success_unauthenticated(self):
         response = self.client.get(self.list_url)
         self.assertContains(response, self.username)
         self.assertContains(response, self.recipe_name)
 
 
+    def test_recipe_list_query_search_keyset_pagination_with_filters(self):
+        for (i, name) in enumerate(['apple pie', 'cherry pie', 'stew', 'pie']):
+            user = User.objects.create_user(username='cook%s' % i, password='pass')
+            Recipe.objects.create(name=name, owner=user)
+        response = self.client.get(reverse("recipe-list-query-search"),
+                                   {'name': 'pie', 'cursor': '', 'limit': 2})
+        self.assertEqual([r['name'] for r in response.data['results']],
+                         ['apple pie', 'cherry pie'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([r['name'] for r in response.data['results']], ['pie'])
+        self.assertIsNone(response.data['next'])
+
+    def test_recipe_list_query_search_keyset_pagination_failure_full_text(self):
+        recipe = Recipe.objects.get(name=self.recipe_name)
+        Ingredient.objects.create(recipe=recipe, text='Fresh basil')
+        response = self.client.get(reverse("recipe-list-query-search"),
+                                   {'search': 'basil', 'cursor': ''})
+        # the keyset ordering would silently replace the ranking by relevance
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_recipe_list_query_search_keyset_pagination_failure_by_ingredients(self):
+        recipe = Recipe.objects.get(name=self.recipe_name)
+        Ingredient.objects.create(recipe=recipe, text='eggs')
+        response = self.client.get(reverse("recipe-list-query-search"),
+                                   {'ingredients': 'eggs', 'cursor': ''})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class RecipeExportViewTests(ViewTests):
+    """
+    Test the recipe-export view.
+    """
+
+    def setUp(self):
+        super(RecipeExportViewTests, self).setUp()
+        self.export_url = reverse("recipe-export")
+        User.objects.create_user(username='admin', password='admin-pass', is_staff=True)
+        for i in range(4):
+            user = User.objects.create_user(username='cook%s' % i, password='pass')
+            recipe = Recipe.objects.create(name='recipe%s' % (i + 2), owner=user)
+            Ingredient.objects.create(recipe=recipe, text='salt')
+            Ingredient.objects.create(recipe=recipe, text='%s eggs' % i)
+            Step.objects.create(recipe=recipe, step_text='Mix')
+
+    def export(self, *args, **kwargs):
+        self.client.login(username='admin', password='admin-pass')
+        response = self.client.get(self.export_url, *args, **kwargs)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response
+
+    def test_recipe_export_failure_not_staff(self):
+        self.client.login(username=self.username, password=self.password)
+        response = self.client.get(self.export_url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_recipe_export_ndjson_success(self):
+        response = self.export({'format': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode('utf8').splitlines()
+        recipes = [json.loads(line) for line in lines]
+        self.assertEqual([r['name'] for r in recipes],
+                         ['recipe1', 'recipe2', 'recipe3', 'recipe4', 'recipe5'])
+        embedded = recipes[2]['embedded']
+        self.assertEqual([i['text'] for i in embedded['ingredients']], ['salt', '1 eggs'])
+        self.assertEqual([s['step_text'] for s in embedded['steps']], ['Mix'])
+        self.assertEqual(embedded['owner']['username'], 'cook1')
+
+    def test_recipe_export_collectionjson_success(self):
+        response = self.export()
+        self.assertEqual(response['Content-Type'], self.content_type)
+        content = json.loads(b''.join(response.streaming_content).decode('utf8'))
+        items = content['collection']['items']
+        self.assertEqual(len(items), 5)
+        self.assertEqual(len(items[1]['embedded']['ingredients']), 2)
+
+    def test_recipe_export_gzip_success(self):
+        response = self.export({'format': 'ndjson'}, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        content = gzip.decompress(b''.join(response.streaming_content))
+        self.assertEqual(len(content.decode('utf8').splitlines()), 5)
+
+    def test_recipe_export_prefetches_in_chunks(self):
+        with mock.patch('collectionjson.services.STREAM_CURSOR_CHUNK_SIZE', 2):
+            response = self.export({'format': 'ndjson'})
+            with CaptureQueriesContext(connection) as queries:
+                content = b''.join(response.streaming_content)
+        self.assertEqual(len(content.splitlines()), 5)
+        # the recipes' query plus the ingredients and steps of each of 3 chunks
+        self.assertEqual(len(queries), 7)
+
+
 class IngredientListViewTests(ViewTests):
     """
     Test the ingredient-list view.
@@ -168,6 +627,49 @@ class IngredientListViewTests(ViewTests):
                                     content_type=self.content_type)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
+    def test_ingredient_bulk_create_success(self):
+        self.client.login(username=self.username, password=self.password)
+        post = json.dumps({"template": [
+            {"data": [{"name": "text", "value": "flour"}]},
+            {"data": [{"name": "text", "value": "eggs"}]}]})
+        response = self.client.post(self.create_read_url, data=post,
+                                    content_type=self.content_type)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(Ingredient.objects.count(), 3)
+
+    def test_ingredient_bulk_create_failure_invalid_item(self):
+        self.client.login(username=self.username, password=self.password)
+        post = json.dumps({"template": [
+            {"data": [{"name": "text", "value": "flour"}]},
+            {"data": [{"name": "text", "value": ""}]}]})
+        response = self.client.post(self.create_read_url, data=post,
+                                    content_type=self.content_type)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Ingredient.objects.count(), 1)
+
+    def test_ingredient_bulk_create_failure_access_denied(self):
+        self.client.login(username='another', password='another-pass')
+        post = json.dumps({"template": [{"data": [{"name": "text", "value": "flour"}]}]})
+        response = self.client.post(self.create_read_url, data=post,
+                                    content_type=self.content_type)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(Ingredient.objects.count(), 1)
+
+    def test_ingredient_bulk_create_failure_access_denied_invalid_item(self):
+        self.client.login(username='another', password='another-pass')
+        post = json.dumps({"template": [{"data": [{"name": "text", "value": ""}]}]})
+        response = self.client.post(self.create_read_url, data=post,
+                                    content_type=self.content_type)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_ingredient_bulk_create_failure_not_found_invalid_item(self):
+        self.client.login(username=self.username, password=self.password)
+        post = json.dumps({"template": [{"data": [{"name": "text", "value": ""}]}]})
+        response = self.client.post(reverse("ingredient-list", kwargs={"pk": 9999}),
+                                    data=post, content_type=self.content_type)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_ingredient_create_failure_unauthenticated(self):
         response = self.client.post(self.create_read_url, data=self.post,
                                     content_type=self.content_type)
@@ -188,6 +690,46 @@ class IngredientListViewTests(ViewTests):
         response = self.client.get(self.create_read_url)
         self.assertContains(response, self.text)
 
+    def test_ingredient_list_conditional_get_modified_by_new_ingredient(self):
+        response1 = self.client.get(self.create_read_url)
+        response2 = self.client.get(self.create_read_url,
+                                    HTTP_IF_NONE_MATCH=response1['ETag'])
+        self.assertEqual(response2.status_code, status.HTTP_304_NOT_MODIFIED)
+        recipe = Recipe.objects.get(name=self.recipe_name)
+        Ingredient.objects.create(recipe=recipe, text='flour')
+        response3 = self.client.get(self.create_read_url,
+                                    HTTP_IF_NONE_MATCH=response1['ETag'])
+        self.assertEqual(response3.status_code, status.HTTP_200_OK)
+        self.assertContains(response3, 'flour')
+
+    @override_settings(COLLECTIONJSON_RESPONSE_CACHE='default')
+    def test_ingredient_list_cached_response_is_invalidated_by_new_ingredient(self):
+        self.client.get(self.create_read_url)
+        recipe = Recipe.objects.get(name=self.recipe_name)
+        Ingredient.objects.create(recipe=recipe, text='flour')
+        response = self.client.get(self.create_read_url)
+        self.assertContains(response, 'flour')
+
+    def test_ingredient_list_loads_recipe_once(self):
+        recipe = Recipe.objects.get(name=self.recipe_name)
+        self.client.login(username=self.username, password=self.password)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.create_read_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        recipe_lookups = [q['sql'] for q in context.captured_queries
+                          if q['sql'].startswith('SELECT') and
+                          'FROM "recipes_recipe" WHERE "recipes_recipe"."id" = %s' %
+                          recipe.id in q['sql']]
+        self.assertEqual(len(recipe_lookups), 1)
+
+    def test_ingredient_list_streaming_success(self):
+        response = self.client.get(self.create_read_url, {'stream': 'true', 'limit': 1})
+        self.assertTrue(response.streaming)
+        content = json.loads(b''.join(response.streaming_content).decode('utf8'))
+        items = content['collection']['items']
+        self.assertEqual(len(items), 1)
+        self.assertEqual(items[0]['data'][1], {'name': 'text', 'value': self.text})
+
 
 class IngredientDetailViewTests(ViewTests):
     """
@@ -224,6 +766,14 @@ class IngredientDetailViewTests(ViewTests):
                                    content_type=self.content_type)
         self.assertContains(response, self.update_text)
 
+    def test_ingredient_permission_check_does_not_fetch_recipe(self):
+        user = User.objects.get(username=self.username)
+        ingredient = views.IngredientDetail.queryset.get(text=self.text)
+        request = mock.Mock(method='PUT', user=user)
+        permission = IsRecipeOwnerOrReadOnly()
+        with self.assertNumQueries(0):
+            self.assertTrue(permission.has_object_permission(request, None, ingredient))
+
     def test_ingredient_update_failure_unauthenticated(self):
         response = self.client.put(self.read_update_delete_url, data=self.put,
                                    content_type=self.content_type)
@@ -274,6 +824,17 @@ class StepListViewTests(ViewTests):
                                     content_type=self.content_type)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
+    def test_step_bulk_create_success(self):
+        self.client.login(username=self.username, password=self.password)
+        post = json.dumps({"template": [
+            {"data": [{"name": "step_text", "value": "mix"}]},
+            {"data": [{"name": "step_text", "value": "bake"}]}]})
+        response = self.client.post(self.create_read_url, data=post,
+                                    content_type=self.content_type)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(Step.objects.count(), 3)
+
     def test_step_create_failure_unauthenticated(self):
         response = self.client.post(self.create_read_url, data=self.post,
                                     content_type=self.content_type)
@@ -294,6 +855,95 @@ class StepListViewTests(ViewTests):
         response = self.client.get(self.create_read_url)
         self.assertContains(response, self.text)
 
+    def get_put(self, items):
+        return json.dumps({"template": [
+            {"data": [{"name": name, "value": value} for (name, value) in item.items()]}
+            for item in items]})
+
+    def test_step_create_appends_to_the_list(self):
+        self.client.login(username=self.username, password=self.password)
+        post = json.dumps({"template": [
+            {"data": [{"name": "step_text", "value": "mix"}]},
+            {"data": [{"name": "step_text", "value": "bake"}]}]})
+        self.client.post(self.create_read_url, data=post, content_type=self.content_type)
+        self.client.post(self.create_read_url, data=json.dumps({
+            "template": {"data": [{"name": "step_text", "value": "serve"}]}}),
+                         content_type=self.content_type)
+        response = self.client.get(self.create_read_url)
+        texts = [item['step_text'] for item in response.data['results']]
+        self.assertEqual(texts, [self.text, 'mix', 'bake', 'serve'])
+
+    def test_step_reorder_success(self):
+        recipe = Recipe.objects.get(name=self.recipe_name)
+        for text in ('mix', 'bake', 'serve'):
+            Step.objects.create(recipe=recipe, step_text=text)
+        ids = list(recipe.steps.values_list('id', flat=True))
+        new_ids = list(reversed(ids))
+        self.client.login(username=self.username, password=self.password)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.put(self.create_read_url,
+                                       data=self.get_put([{'id': pk} for pk in new_ids]),
+                                       content_type=self.content_type)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data], new_ids)
+        updates = [q['sql'] for q in context.captured_queries
+                   if q['sql'].startswith('UPDATE "recipes_step"')]
+        self.assertEqual(len(updates), 1)
+        response = self.client.get(self.create_read_url)
+        self.assertEqual([item['id'] for item in response.data['results']], new_ids)
+
+    def test_step_replace_only_writes_changed_rows(self):
+        recipe = Recipe.objects.get(name=self.recipe_name)
+        mix = Step.objects.create(recipe=recipe, step_text='mix')
+        bake = Step.objects.create(recipe=recipe, step_text='bake')
+        first = Step.objects.get(step_text=self.text)
+        self.client.login(username=self.username, password=self.password)
+        put = self.get_put([{'id': first.id}, {'id': bake.id, 'step_text': 'bake well'},
+                            {'step_text': 'serve'}])
+        response = self.client.put(self.create_read_url, data=put,
+                                   content_type=self.content_type)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['step_text'] for item in response.data],
+                         [self.text, 'bake well', 'serve'])
+        self.assertFalse(Step.objects.filter(id=mix.id).exists())
+        # the first step didn't change
+        self.assertEqual(Step.objects.get(id=first.id).modified, first.modified)
+        recipe = Recipe.objects.get(id=recipe.id)
+        self.assertIn('bake well', recipe.search_document)
+        self.assertNotIn('mix', recipe.search_document)
+
+    def test_step_replace_failure_unknown_id(self):
+        other = Recipe.objects.create(name='other',
+                                      owner=User.objects.get(username='another'))
+        step = Step.objects.create(recipe=other, step_text='boil')
+        self.client.login(username=self.username, password=self.password)
+        response = self.client.put(self.create_read_url,
+                                   data=self.get_put([{'id': step.id}]),
+                                   content_type=self.content_type)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Step.objects.filter(step_text=self.text).count(), 1)
+
+    def test_step_replace_failure_access_denied(self):
+        self.client.login(username='another', password='another-pass')
+        response = self.client.put(self.create_read_url,
+                                   data=self.get_put([{'step_text': 'boil'}]),
+                                   content_type=self.content_type)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_step_replace_failure_access_denied_invalid_item(self):
+        self.client.login(username='another', password='another-pass')
+        response = self.client.put(self.create_read_url,
+                                   data=self.get_put([{'id': 'invalid'}]),
+                                   content_type=self.content_type)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_step_replace_failure_not_found_invalid_item(self):
+        self.client.login(username=self.username, password=self.password)
+        response = self.client.put(reverse("step-list", kwargs={"pk": 9999}),
+                                   data=self.get_put([{'id': 'invalid'}]),
+                                   content_type=self.content_type)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
 
 class StepDetailViewTests(ViewTests):
     """
@@ -353,3 +1003,60 @@ class StepDetailViewTests(ViewTests):
         self.client.login(username='another', password='another-pass')
         response = self.client.delete(self.read_update_delete_url)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class QueryBudgetTests(QueryBudgetTestMixin, ViewTests):
+    """
+    Test that the views stay within their query budgets whatever the page size.
+    """
+
+    def setUp(self):
+        super(QueryBudgetTests, self).setUp()
+        for i in range(12):
+            user = User.objects.create_user(username='cook%s' % i, password='pass')
+            recipe = Recipe.objects.create(name='dish%s' % i, owner=user)
+            for j in range(3):
+                Ingredient.objects.create(recipe=recipe, text='salt %s' % j)
+                Step.objects.create(recipe=recipe, step_text='mix %s' % j)
+        recipe = Recipe.objects.get(name='dish0')
+        ingredient = recipe.ingredients.first()
+        step = recipe.steps.first()
+        self.urls = [
+            (views.RecipeList, reverse("recipe-list")),
+            (views.RecipeListQuerySearch, reverse("recipe-list-query-search")),
+            (views.RecipeDetail, reverse("recipe-detail", kwargs={"pk": recipe.id})),
+            (views.IngredientList, reverse("ingredient-list", kwargs={"pk": recipe.id})),
+            (views.IngredientDetail, reverse("ingredient-detail",
+                                             kwargs={"pk": ingredient.id})),
+            (views.StepList, reverse("step-list", kwargs={"pk": recipe.id})),
+            (views.StepDetail, reverse("step-detail", kwargs={"pk": step.id})),
+        ]
+
+    def clear_caches(self):
+        fragment_cache.clear()
+        caches['default'].clear()
+
+    def test_views_are_within_budget_unauthenticated(self):
+        for (view_class, url) in self.urls:
+            for limit in (1, 10):
+                self.clear_caches()
+                response = self.assertWithinQueryBudget(view_class, url,
+                                                        {'limit': limit})
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_views_are_within_budget_authenticated(self):
+        self.client.login(username=self.username, password=self.password)
+        for (view_class, url) in self.urls:
+            for limit in (1, 10):
+                self.clear_caches()
+                response = self.assertWithinQueryBudget(
+                    view_class, url, {'limit': limit,
+                                      'expand': 'ingredients,steps,owner'})
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(DEBUG=True)
+    def test_requests_over_budget_are_logged(self):
+        with mock.patch.object(views.RecipeList, 'query_budget', 1):
+            with self.assertLogs('core.budgets', level='WARNING') as logs:
+                self.client.get(reverse("recipe-list"))
+        self.assertIn('RecipeList', logs.output[0])
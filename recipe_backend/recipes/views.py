@@ -1,8 +1,14 @@
 
-from rest_framework import generics, permissions
-from rest_framework.reverse import reverse
+from django.db.models import F
 
+from rest_framework import generics, permissions
 from collectionjson import services
+from collectionjson.links import reverse
+from collectionjson.pagination import KeysetPagination
+from collectionjson.renderers import CollectionJsonRenderer, NDJSONRenderer
+from core.budgets import QueryBudgetMixin
+from core.timing import ServerTimingMixin
+from core.identitymap import IdentityMapMixin
 
 from .models import Recipe, RecipeFilter
 from .models import Step
@@ -11,15 +17,29 @@ from .serializers import RecipeSerializer
 from .serializers import StepSerializer
 from .serializers import IngredientSerializer
 from .permissions import IsOwnerOrReadOnly, IsRecipeOwnerOrReadOnly
+from .signals import post_bulk_update
 
 
-class RecipeList(generics.ListCreateAPIView):
+class RecipeList(QueryBudgetMixin, ServerTimingMixin, generics.ListCreateAPIView):
     """
     A view for the collection of recipes.
     """
     serializer_class = RecipeSerializer
-    queryset = Recipe.objects.all()
+    queryset = Recipe.objects.select_related('owner')
+    query_budget = 7
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
+    pagination_class = KeysetPagination
+    keyset_fields = ('name', 'id')
+    response_cache_tags = ('recipes',)
+    collection_document = services.CollectionDocument(
+        template_data={'name': ''}, query_url_names=('recipe-list-query-search',))
+
+    def get_queryset(self):
+        """
+        Overriden to load the relations requested with the 'expand' query parameter.
+        """
+        queryset = super(RecipeList, self).get_queryset()
+        return services.expand_queryset(self, queryset)
 
     def perform_create(self, serializer):
         """
@@ -30,158 +50,334 @@ class RecipeList(generics.ListCreateAPIView):
     def list(self, request, *args, **kwargs):
         """
         Overriden to append a document-level link relation, a query list and a
-        collection+json template to the response.
+        collection+json template to the response. Conditional requests are also
+        answered.
+        Anonymous responses are served from the shared response cache.
         """
-        response = super(RecipeList, self).list(request, *args, **kwargs)
-        # append document-level link relations
+        response = services.get_cached_response(self)
+        if response is not None:
+            return response
+        queryset = self.filter_queryset(self.get_queryset())
         user = self.request.user
-        if user.is_authenticated:
-            links = {'user': reverse('user-detail', request=request,
-                                     kwargs={"pk": user.id})}
-            response = services.append_collection_links(response, links)
-        # append query list
-        query_list = [reverse('recipe-list-query-search', request=request)]
-        response = services.append_collection_querylist(response, query_list)
-        # append write template
-        template_data = {'name': ''}
-        return services.append_collection_template(response, template_data)
+        validators = services.get_list_validators(self, queryset, user.id)
+        response = services.get_not_modified_response(request, validators)
+        if response is None:
+            response = services.get_list_response(self, queryset)
+            # append document-level link relations
+            if user.is_authenticated:
+                links = {'user': reverse('user-detail', request=request,
+                                         kwargs={"pk": user.id})}
+                response = services.append_collection_links(response, links)
+            # append query list and write template
+            response = self.collection_document.append_to(response, request)
+        response = services.set_validator_headers(response, validators)
+        return services.cache_response(self, response, validators)
 
 
-class RecipeListQuerySearch(generics.ListAPIView):
+class RecipeListQuerySearch(QueryBudgetMixin, ServerTimingMixin, generics.ListAPIView):
     """
     A view for the collection of recipes resulting from a query search.
     """
     serializer_class = RecipeSerializer
-    queryset = Recipe.objects.all()
+    queryset = Recipe.objects.select_related('owner')
+    query_budget = 7
     filterset_class = RecipeFilter
-        
+    pagination_class = KeysetPagination
+    keyset_fields = ('name', 'id')
+    response_cache_tags = ('recipes',)
+
+    def get_queryset(self):
+        """
+        Overriden to load the relations requested with the 'expand' query parameter.
+        """
+        queryset = super(RecipeListQuerySearch, self).get_queryset()
+        return services.expand_queryset(self, queryset)
+
+    def list(self, request, *args, **kwargs):
+        """
+        Overriden to support streamed responses and answer conditional requests.
+        Anonymous responses are served from the shared response cache.
+        """
+        response = services.get_cached_response(self)
+        if response is not None:
+            return response
+        queryset = self.filter_queryset(self.get_queryset())
+        validators = services.get_list_validators(self, queryset)
+        response = services.get_not_modified_response(request, validators)
+        if response is None:
+            response = services.get_list_response(self, queryset)
+        response = services.set_validator_headers(response, validators)
+        return services.cache_response(self, response, validators)
 
-class RecipeDetail(generics.RetrieveUpdateDestroyAPIView):
+
+class RecipeExport(ServerTimingMixin, generics.GenericAPIView):
+    """
+    A view streaming the whole catalog of recipes with their embedded ingredients,
+    steps and owner as one collection+json document or as NDJSON (one recipe per
+    line), only available to staff users (e.g. search indexers).
+    """
+    serializer_class = RecipeSerializer
+    queryset = Recipe.objects.select_related('owner').order_by('id')
+    permission_classes = (permissions.IsAdminUser,)
+    renderer_classes = (CollectionJsonRenderer, NDJSONRenderer)
+    prefetch_lookups = ('ingredients', 'steps')
+
+    def get_serializer_context(self):
+        """
+        Overriden to always embed the related objects in the recipes.
+        """
+        context = super(RecipeExport, self).get_serializer_context()
+        context['expanded_relations'] = frozenset(['ingredients', 'steps', 'owner'])
+        return context
+
+    def get(self, request, *args, **kwargs):
+        return services.get_export_response(self, self.get_queryset(),
+                                            *self.prefetch_lookups)
+
+
+class RecipeDetail(IdentityMapMixin, QueryBudgetMixin, ServerTimingMixin,
+                   generics.RetrieveUpdateDestroyAPIView):
     """
     A recipe view.
     """
     serializer_class = RecipeSerializer
-    queryset = Recipe.objects.all()
+    queryset = Recipe.objects.select_related('owner')
+    query_budget = 5
     permission_classes = (IsOwnerOrReadOnly,)
+    response_cache_tags = ('recipe:{pk}',)
+    collection_document = services.CollectionDocument(template_data={'name': ''})
+
+    def get_queryset(self):
+        """
+        Overriden to load the relations requested with the 'expand' query parameter.
+        """
+        queryset = super(RecipeDetail, self).get_queryset()
+        return services.expand_queryset(self, queryset)
 
     def retrieve(self, request, *args, **kwargs):
         """
-        Overriden to append a collection+json template.
+        Overriden to use the rendered fragment cache, append a collection+json
+        template and answer conditional requests.
+        Anonymous responses are served from the shared response cache.
         """
-        response = super(RecipeDetail, self).retrieve(request, *args, **kwargs)
-        template_data = {'name': ''}
-        return services.append_collection_template(response, template_data)
+        response = services.get_cached_response(self)
+        if response is not None:
+            return response
+        instance = self.get_object()
+        validators = services.get_validators(self, instance.modified)
+        response = services.get_not_modified_response(request, validators)
+        if response is None:
+            response = services.get_detail_response(self, instance)
+            response = self.collection_document.append_to(response, request)
+        response = services.set_validator_headers(response, validators)
+        return services.cache_response(self, response, validators)
 
 
-class IngredientList(generics.ListCreateAPIView):
+class IngredientList(IdentityMapMixin, QueryBudgetMixin, ServerTimingMixin,
+                     generics.ListCreateAPIView):
     """
     A view for the collection of recipe-specific ingredients.
     """
     serializer_class = IngredientSerializer
     queryset = Recipe.objects.all()
+    query_budget = 5
     permission_classes = (IsOwnerOrReadOnly,)
+    response_cache_tags = ('recipe:{pk}:ingredients',)
+    collection_document = services.CollectionDocument(template_data={'text': ''})
 
     def perform_create(self, serializer):
         """
-        Overriden to associate a recipe with the newly created ingredient.
+        Overriden to associate a recipe with the newly created ingredient. The recipe
+        is the one already loaded by the request's permission check.
         """
         recipe = self.get_object()
         serializer.save(recipe=recipe)
 
+    def create(self, request, *args, **kwargs):
+        """
+        Overriden to also accept a list of ingredients (bulk creation).
+        """
+        if isinstance(request.data, list):
+            return services.get_bulk_create_response(self, request.data)
+        return super(IngredientList, self).create(request, *args, **kwargs)
+
+    def put(self, request, *args, **kwargs):
+        """
+        Custom method to replace the whole list of ingredients of the recipe (e.g. to
+        reorder them). Only the ingredients that change are written.
+        """
+        return services.get_bulk_replace_response(self, request.data)
+
+    def perform_replace(self, items):
+        """
+        Custom method to replace the recipe's ingredients with the given list of
+        (id, attributes) pairs and return the new list.
+        """
+        recipe = self.get_object()
+        if Ingredient.replace_recipe_items(recipe.id, items):
+            post_bulk_update.send(sender=Ingredient, recipe_ids=[recipe.id])
+        return recipe.ingredients.all()
+
     def list(self, request, *args, **kwargs):
         """
         Overriden to return the list of ingredients for the queried recipe.
         A document-level link relation and a collection+json template are also added
-        to the response.
+        to the response. Conditional requests are answered from the recipe's
+        modification time, which is updated whenever any of its ingredients change.
+        Anonymous responses are served from the shared response cache.
         """
-        queryset = self.get_ingredients_queryset()
-        response = services.get_list_response(self, queryset)
+        response = services.get_cached_response(self)
+        if response is not None:
+            return response
         recipe = self.get_object()
-        # append document-level link relations
-        links = {'recipe': reverse('recipe-detail', request=request,
-                                   kwargs={"pk": recipe.id})}
-        response = services.append_collection_links(response, links)
-        # append write template
-        template_data = {'text': ""}
-        return services.append_collection_template(response, template_data)
+        validators = services.get_validators(self, recipe.modified)
+        response = services.get_not_modified_response(request, validators)
+        if response is None:
+            queryset = self.get_ingredients_queryset()
+            response = services.get_list_response(self, queryset)
+            # append document-level link relations
+            links = {'recipe': reverse('recipe-detail', request=request,
+                                       kwargs={"pk": recipe.id})}
+            response = services.append_collection_links(response, links)
+            # append write template
+            response = self.collection_document.append_to(response, request)
+        response = services.set_validator_headers(response, validators)
+        return services.cache_response(self, response, validators)
 
     def get_ingredients_queryset(self):
         """
-        Custom method to get the actual ingredients' queryset.
+        Custom method to get the actual ingredients' queryset. The recipe is taken
+        from the request's identity map.
         """
         recipe = self.get_object()
         return self.filter_queryset(recipe.ingredients.all())
 
     
-class IngredientDetail(generics.RetrieveUpdateDestroyAPIView):
+class IngredientDetail(IdentityMapMixin, QueryBudgetMixin, ServerTimingMixin,
+                       generics.RetrieveUpdateDestroyAPIView):
     """
     An ingredient view.
     """
     serializer_class = IngredientSerializer
-    queryset = Ingredient.objects.all()
+    queryset = Ingredient.objects.annotate(recipe_owner_id=F('recipe__owner'))
+    query_budget = 3
     permission_classes = (IsRecipeOwnerOrReadOnly,)
+    collection_document = services.CollectionDocument(template_data={'text': ''})
 
     def retrieve(self, request, *args, **kwargs):
         """
-        Overriden to append a collection+json template.
+        Overriden to use the rendered fragment cache, append a collection+json
+        template and answer conditional requests.
         """
-        response = super(IngredientDetail, self).retrieve(request, *args, **kwargs)
-        template_data = {'text': ''}
-        return services.append_collection_template(response, template_data)
+        instance = self.get_object()
+        validators = services.get_validators(self, instance.modified)
+        response = services.get_not_modified_response(request, validators)
+        if response is None:
+            response = services.get_detail_response(self, instance)
+            response = self.collection_document.append_to(response, request)
+        return services.set_validator_headers(response, validators)
 
 
-class StepList(generics.ListCreateAPIView):
+class StepList(IdentityMapMixin, QueryBudgetMixin, ServerTimingMixin,
+               generics.ListCreateAPIView):
     """
     A view for the collection of recipe-specific steps.
     """
     serializer_class = StepSerializer
     queryset = Recipe.objects.all()
+    query_budget = 5
     permission_classes = (IsOwnerOrReadOnly,)
+    response_cache_tags = ('recipe:{pk}:steps',)
+    collection_document = services.CollectionDocument(template_data={'step_text': ''})
 
     def perform_create(self, serializer):
         """
-        Overriden to associate a recipe with the newly created step.
+        Overriden to associate a recipe with the newly created step. The recipe is
+        the one already loaded by the request's permission check.
         """
         recipe = self.get_object()
         serializer.save(recipe=recipe)
 
+    def create(self, request, *args, **kwargs):
+        """
+        Overriden to also accept a list of steps (bulk creation).
+        """
+        if isinstance(request.data, list):
+            return services.get_bulk_create_response(self, request.data)
+        return super(StepList, self).create(request, *args, **kwargs)
+
+    def put(self, request, *args, **kwargs):
+        """
+        Custom method to replace the whole list of steps of the recipe (e.g. to
+        reorder them). Only the steps that change are written.
+        """
+        return services.get_bulk_replace_response(self, request.data)
+
+    def perform_replace(self, items):
+        """
+        Custom method to replace the recipe's steps with the given list of
+        (id, attributes) pairs and return the new list.
+        """
+        recipe = self.get_object()
+        if Step.replace_recipe_items(recipe.id, items):
+            post_bulk_update.send(sender=Step, recipe_ids=[recipe.id])
+        return recipe.steps.all()
+
     def list(self, request, *args, **kwargs):
         """
         Overriden to return the list of steps for the queried recipe.
         A document-level link relation and a collection+json template are also added
-        to the response.
+        to the response. Conditional requests are answered from the recipe's
+        modification time, which is updated whenever any of its steps change.
+        Anonymous responses are served from the shared response cache.
         """
-        queryset = self.get_steps_queryset()
-        response = services.get_list_response(self, queryset)
+        response = services.get_cached_response(self)
+        if response is not None:
+            return response
         recipe = self.get_object()
-        # append document-level link relations
-        links = {'recipe': reverse('recipe-detail', request=request,
-                                   kwargs={"pk": recipe.id})}
-        response = services.append_collection_links(response, links)
-        # append write template
-        template_data = {'step_text': ""}
-        return services.append_collection_template(response, template_data)
+        validators = services.get_validators(self, recipe.modified)
+        response = services.get_not_modified_response(request, validators)
+        if response is None:
+            queryset = self.get_steps_queryset()
+            response = services.get_list_response(self, queryset)
+            # append document-level link relations
+            links = {'recipe': reverse('recipe-detail', request=request,
+                                       kwargs={"pk": recipe.id})}
+            response = services.append_collection_links(response, links)
+            # append write template
+            response = self.collection_document.append_to(response, request)
+        response = services.set_validator_headers(response, validators)
+        return services.cache_response(self, response, validators)
 
     def get_steps_queryset(self):
         """
-        Custom method to get the actual steps' queryset.
+        Custom method to get the actual steps' queryset. The recipe is taken from the
+        request's identity map.
         """
         recipe = self.get_object()
         return self.filter_queryset(recipe.steps.all())
 
 
-class StepDetail(generics.RetrieveUpdateDestroyAPIView):
+class StepDetail(IdentityMapMixin, QueryBudgetMixin, ServerTimingMixin,
+                 generics.RetrieveUpdateDestroyAPIView):
     """
     An step view.
     """
     serializer_class = StepSerializer
-    queryset = Step.objects.all()
+    queryset = Step.objects.annotate(recipe_owner_id=F('recipe__owner'))
+    query_budget = 3
     permission_classes = (IsRecipeOwnerOrReadOnly,)
+    collection_document = services.CollectionDocument(template_data={'step_text': ''})
 
     def retrieve(self, request, *args, **kwargs):
         """
-        Overriden to append a collection+json template.
+        Overriden to use the rendered fragment cache, append a collection+json
+        template and answer conditional requests.
         """
-        response = super(StepDetail, self).retrieve(request, *args, **kwargs)
-        template_data = {'step_text': ''}
-        return services.append_collection_template(response, template_data)
+        instance = self.get_object()
+        validators = services.get_validators(self, instance.modified)
+        response = services.get_not_modified_response(request, validators)
+        if response is None:
+            response = services.get_detail_response(self, instance)
+            response = self.collection_document.append_to(response, request)
+        return services.set_validator_headers(response, validators)
@@ -0,0 +1,204 @@
+
+import copy
+import hashlib
+import hmac
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.base import ModelState
+
+from rest_framework.authentication import TokenAuthentication
+
+from collectionjson.cache import LRUCache
+
+
+def copy_instance(instance):
+    """
+    Convenience function to return a shallow copy of a model instance with its own
+    ModelState. Before Django 3.0 copy.copy shares the state, and so the cache of
+    related objects, between the copy and the original.
+    """
+    clone = copy.copy(instance)
+    clone._state = ModelState()
+    clone._state.db = instance._state.db
+    clone._state.adding = instance._state.adding
+    return clone
+
+
+class AuthenticationCache(object):
+    """
+    Cache of successful authentications (the authenticated user's id and the
+    authentication result) keyed by a keyed digest (an HMAC with the SECRET_KEY) of
+    the credentials, so the credentials themselves are never stored. Entries live
+    for the number of seconds of the setting named by 'timeout_setting' in a bounded
+    in-process LRU cache (its size is read from 'size_setting', 0 disables the
+    cache) backed by the shared Django cache named by 'alias_setting'. Invalidating a
+    user bumps its version in the shared cache: every entry records the version of
+    its user and is checked against the shared one, even on hits of the LRU cache,
+    so the invalidation reaches the LRU caches of all processes. The cache is
+    disabled when there is no shared cache, since the other processes would keep
+    authenticating revoked credentials until their entries expire.
+    """
+    key_prefix = 'users:auth'
+    size_setting = None
+    timeout_setting = None
+    alias_setting = None
+
+    def __init__(self):
+        self._cache = LRUCache(getattr(settings, self.size_setting, 10000))
+
+    @property
+    def timeout(self):
+        return getattr(settings, self.timeout_setting, 60)
+
+    @property
+    def enabled(self):
+        return (self._cache.max_size > 0 and self.timeout > 0 and
+                self.shared_cache is not None)
+
+    @property
+    def shared_cache(self):
+        alias = getattr(settings, self.alias_setting, None)
+        return caches[alias] if alias is not None else None
+
+    def get_digest(self, *credentials):
+        """
+        Return the keyed digest of a set of credentials.
+        """
+        key = hashlib.sha256(
+            ('%s:%s' % (self.key_prefix, settings.SECRET_KEY)).encode('utf-8')).digest()
+        msg = '\0'.join(credentials).encode('utf-8')
+        return hmac.new(key, msg, hashlib.sha256).hexdigest()
+
+    def _get_shared_key(self, digest):
+        return '%s:%s' % (self.key_prefix, digest)
+
+    def _get_user_version_key(self, user_id):
+        return '%s:user:%s' % (self.key_prefix, user_id)
+
+    def get(self, digest):
+        """
+        Return the cached authentication result of the credentials with the given
+        digest or None.
+        """
+        if not self.enabled:
+            return None
+        shared_cache = self.shared_cache
+        entry = self._cache.get(digest)
+        if entry is not None:
+            (expires, user_id, version, result) = entry
+            # the user might have been invalidated by another process
+            if expires > time.monotonic() and (
+                    shared_cache is None or
+                    shared_cache.get(self._get_user_version_key(user_id)) == version):
+                return result
+            self._cache.delete(digest)
+        if shared_cache is None:
+            return None
+        entry = shared_cache.get(self._get_shared_key(digest))
+        if entry is None:
+            return None
+        (user_id, version, result) = entry
+        if shared_cache.get(self._get_user_version_key(user_id)) != version:
+            return None
+        self._cache.set(digest,
+                        (time.monotonic() + self.timeout, user_id, version, result))
+        return result
+
+    def set(self, digest, user_id, result):
+        """
+        Cache the authentication result of the credentials with the given digest.
+        """
+        if not self.enabled:
+            return
+        shared_cache = self.shared_cache
+        version = None
+        if shared_cache is not None:
+            version_key = self._get_user_version_key(user_id)
+            shared_cache.add(version_key, self._new_version(), None)
+            version = shared_cache.get(version_key)
+            shared_cache.set(self._get_shared_key(digest), (user_id, version, result),
+                             self.timeout)
+        self._cache.set(digest,
+                        (time.monotonic() + self.timeout, user_id, version, result))
+
+    def invalidate(self, digest):
+        """
+        Remove the cached authentication result of the credentials with the given
+        digest.
+        """
+        self._cache.delete(digest)
+        shared_cache = self.shared_cache
+        if shared_cache is not None:
+            shared_cache.delete(self._get_shared_key(digest))
+
+    def invalidate_user(self, user_id):
+        """
+        Remove all the cached authentication results of a user.
+        """
+        for (digest, (expires, entry_user_id, version, result)) in self._cache.items():
+            if entry_user_id == user_id:
+                self._cache.delete(digest)
+        shared_cache = self.shared_cache
+        if shared_cache is not None:
+            shared_cache.set(self._get_user_version_key(user_id), self._new_version(),
+                             None)
+
+    def _new_version(self):
+        # a new version must differ from any previous one even if the user's version
+        # was evicted from the cache
+        return int(time.time() * 1000000)
+
+    def clear(self):
+        self._cache.clear()
+
+
+class TokenCache(AuthenticationCache):
+    """
+    Cache of the users authenticated by each API token.
+    """
+    key_prefix = 'users:token'
+    size_setting = 'AUTH_TOKEN_CACHE_SIZE'
+    timeout_setting = 'AUTH_TOKEN_CACHE_TIMEOUT'
+    alias_setting = 'AUTH_TOKEN_CACHE'
+
+
+token_cache = TokenCache()
+
+
+class CredentialCache(AuthenticationCache):
+    """
+    Cache of the users whose username and password have already been verified.
+    """
+    key_prefix = 'users:credentials'
+    size_setting = 'AUTH_CREDENTIALS_CACHE_SIZE'
+    timeout_setting = 'AUTH_CREDENTIALS_CACHE_TIMEOUT'
+    alias_setting = 'AUTH_CREDENTIALS_CACHE'
+
+
+credential_cache = CredentialCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication that caches the user authenticated by each token, so that
+    most requests don't need any database query to be authenticated. The cache is
+    invalidated when the token is deleted (or regenerated) and when its user changes
+    (e.g. it's deactivated).
+    """
+
+    def authenticate_credentials(self, key):
+        """
+        Overriden to look the token up in the token cache first.
+        """
+        digest = token_cache.get_digest(key)
+        result = token_cache.get(digest)
+        if result is None:
+            result = super(CachedTokenAuthentication, self).authenticate_credentials(key)
+            token_cache.set(digest, result[0].id, result)
+        # each request gets its own copy of the cached objects
+        user = copy_instance(result[0])
+        token = copy_instance(result[1])
+        token.user = user
+        return user, token
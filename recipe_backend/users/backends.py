@@ -0,0 +1,32 @@
+
+from django.contrib.auth.backends import ModelBackend
+
+from .authentication import copy_instance, credential_cache
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    Authentication backend that remembers successful username and password
+    verifications for a short time, so that repeated logins (e.g. HTTP Basic
+    authenticated requests or auth token requests) don't hash the password again.
+    The cache is invalidated in all the processes when the user changes (e.g. its
+    password) and is disabled unless AUTH_CREDENTIALS_CACHE names a shared cache.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        """
+        Overriden to look the credentials up in the credential cache first.
+        """
+        if username is None or password is None:
+            return super(CachedModelBackend, self).authenticate(
+                request, username=username, password=password, **kwargs)
+        digest = credential_cache.get_digest(username, password)
+        user = credential_cache.get(digest)
+        if user is None:
+            user = super(CachedModelBackend, self).authenticate(
+                request, username=username, password=password, **kwargs)
+            if user is None:
+                return None
+            credential_cache.set(digest, user.id, user)
+        # each request gets its own copy of the cached user
+        return copy_instance(user)
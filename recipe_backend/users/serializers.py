@@ -4,10 +4,12 @@ from django.contrib.auth.models import User
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 
+from collectionjson.fields import HyperlinkedIdentityField, HyperlinkedRelatedField
+
 
 class UserSerializer(serializers.HyperlinkedModelSerializer):
-    recipe = serializers.HyperlinkedRelatedField(view_name='recipe-detail',
-                                                 read_only=True)
+    serializer_url_field = HyperlinkedIdentityField
+    recipe = HyperlinkedRelatedField(view_name='recipe-detail', read_only=True)
     username = serializers.CharField(max_length=50,
                                      validators=[UniqueValidator(
                                          queryset=User.objects.all())])
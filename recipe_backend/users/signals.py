@@ -0,0 +1,33 @@
+
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from .authentication import credential_cache, token_cache
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    """
+    Remove a saved or deleted (e.g. regenerated) token from the token cache. The
+    user's token entries are invalidated, rather than just the token's, so that the
+    other processes' cached entries are invalidated too.
+    """
+    token_cache.invalidate(token_cache.get_digest(instance.key))
+    token_cache.invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_authentications(sender, instance, update_fields=None, **kwargs):
+    """
+    Remove the tokens and verified credentials of a saved (e.g. deactivated or whose
+    password changed) or deleted user from the authentication caches.
+    """
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    token_cache.invalidate_user(instance.pk)
+    credential_cache.invalidate_user(instance.pk)
@@ -0,0 +1,194 @@
+
+import base64
+from unittest import mock
+
+from django.contrib.auth import authenticate, base_user
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.contrib.auth.models import User
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from users.authentication import CachedTokenAuthentication, CredentialCache, TokenCache, \
+    credential_cache, token_cache
+
+
+@override_settings(AUTH_TOKEN_CACHE='default')
+class CachedTokenAuthenticationTests(TestCase):
+    """
+    Test the cached token authentication.
+    """
+
+    def setUp(self):
+        token_cache.clear()
+        caches['default'].clear()
+        self.user = User.objects.create_user(username='cube', password='cubepass')
+        self.token = Token.objects.create(user=self.user)
+        self.url = reverse("user-detail", kwargs={"pk": self.user.id})
+
+    def get(self):
+        return self.client.get(self.url, HTTP_AUTHORIZATION='Token %s' % self.token.key)
+
+    def get_token_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.get()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [q['sql'] for q in context.captured_queries if 'authtoken_token' in q['sql']]
+
+    def test_token_lookup_is_cached(self):
+        self.assertEqual(len(self.get_token_queries()), 1)
+        self.assertEqual(len(self.get_token_queries()), 0)
+
+    def test_token_is_not_stored_in_the_cache(self):
+        self.get()
+        for (digest, entry) in token_cache._cache.items():
+            self.assertNotIn(self.token.key, digest)
+
+    def test_deleted_token_is_invalidated(self):
+        self.get()
+        # deleting self.token would reset its key, which is its primary key
+        Token.objects.get(key=self.token.key).delete()
+        self.assertEqual(self.get().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_is_invalidated(self):
+        self.get()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_each_authentication_gets_its_own_instances(self):
+        authentication = CachedTokenAuthentication()
+        (user, token) = authentication.authenticate_credentials(self.token.key)
+        (other_user, other_token) = authentication.authenticate_credentials(
+            self.token.key)
+        self.assertEqual(other_user, user)
+        self.assertIsNot(other_user._state, user._state)
+        self.assertIsNot(other_user._state.fields_cache, user._state.fields_cache)
+        self.assertIsNot(other_token._state, token._state)
+        self.assertIs(other_token.user, other_user)
+
+    @override_settings(AUTH_TOKEN_CACHE=None)
+    def test_token_cache_is_disabled_without_shared_cache(self):
+        self.assertEqual(len(self.get_token_queries()), 1)
+        self.assertEqual(len(self.get_token_queries()), 1)
+        self.assertEqual(len(token_cache._cache), 0)
+
+    def test_token_lookup_is_shared_through_django_cache(self):
+        self.get()
+        token_cache.clear()
+        self.assertEqual(len(self.get_token_queries()), 0)
+
+    def test_shared_entries_are_invalidated_with_their_user(self):
+        self.get()
+        token_cache.clear()
+        token_cache.invalidate_user(self.user.id)
+        self.assertEqual(len(self.get_token_queries()), 1)
+
+    def test_token_deleted_by_another_process_invalidates_local_entries(self):
+        self.get()
+        # another process deletes the token: its receivers use their own cache
+        with mock.patch('users.signals.token_cache', TokenCache()):
+            Token.objects.get(key=self.token.key).delete()
+        self.assertEqual(len(token_cache._cache), 1)
+        self.assertEqual(self.get().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_user_deactivated_by_another_process_invalidates_local_entries(self):
+        self.get()
+        User.objects.filter(pk=self.user.id).update(is_active=False)
+        TokenCache().invalidate_user(self.user.id)
+        self.assertEqual(len(token_cache._cache), 1)
+        self.assertEqual(self.get().status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(AUTH_CREDENTIALS_CACHE='default')
+class CachedModelBackendTests(TestCase):
+    """
+    Test the authentication backend that caches verified credentials.
+    """
+
+    def setUp(self):
+        credential_cache.clear()
+        caches['default'].clear()
+        self.password = 'cubepass'
+        self.user = User.objects.create_user(username='cube', password=self.password)
+        self.url = reverse("user-detail", kwargs={"pk": self.user.id})
+
+    def get(self, password):
+        credentials = base64.b64encode(('cube:%s' % password).encode('utf-8'))
+        return self.client.get(self.url,
+                               HTTP_AUTHORIZATION='Basic %s' % credentials.decode('ascii'))
+
+    def test_basic_authentication_does_not_rehash_password(self):
+        with mock.patch.object(base_user, 'check_password',
+                               wraps=base_user.check_password) as check_password:
+            for i in range(3):
+                self.assertEqual(self.get(self.password).status_code,
+                                 status.HTTP_200_OK)
+        self.assertEqual(check_password.call_count, 1)
+
+    def test_each_authentication_gets_its_own_user(self):
+        user = authenticate(username='cube', password=self.password)
+        other_user = authenticate(username='cube', password=self.password)
+        self.assertEqual(other_user, user)
+        self.assertIsNot(other_user._state, user._state)
+        self.assertIsNot(other_user._state.fields_cache, user._state.fields_cache)
+
+    @override_settings(AUTH_CREDENTIALS_CACHE=None)
+    def test_credential_cache_is_disabled_without_shared_cache(self):
+        with mock.patch.object(base_user, 'check_password',
+                               wraps=base_user.check_password) as check_password:
+            for i in range(2):
+                self.assertEqual(self.get(self.password).status_code,
+                                 status.HTTP_200_OK)
+        self.assertEqual(check_password.call_count, 2)
+        self.assertEqual(len(credential_cache._cache), 0)
+
+    def test_password_is_not_stored_in_the_cache(self):
+        self.get(self.password)
+        for (digest, entry) in credential_cache._cache.items():
+            self.assertNotIn(self.password, digest)
+
+    def test_wrong_password_is_not_cached(self):
+        self.assertEqual(self.get('wrongpass').status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(len(credential_cache._cache), 0)
+
+    def test_password_change_invalidates_verified_credentials(self):
+        self.get(self.password)
+        self.user.set_password('newpass')
+        self.user.save()
+        self.assertEqual(self.get(self.password).status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.get('newpass').status_code, status.HTTP_200_OK)
+
+    def test_auth_token_request_does_not_rehash_password(self):
+        url = '/api/v1/auth-token/'
+        with mock.patch.object(base_user, 'check_password',
+                               wraps=base_user.check_password) as check_password:
+            for i in range(2):
+                response = self.client.post(url, {'username': 'cube',
+                                                  'password': self.password})
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(check_password.call_count, 1)
+
+    def test_password_change_by_another_process_invalidates_local_entries(self):
+        self.get(self.password)
+        # another process changes the password: only the shared user version changes
+        User.objects.filter(pk=self.user.id).update(password=make_password('newpass'))
+        CredentialCache().invalidate_user(self.user.id)
+        self.assertEqual(len(credential_cache._cache), 1)
+        self.assertEqual(self.get(self.password).status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.get('newpass').status_code, status.HTTP_200_OK)
+
+    def test_user_deactivated_by_another_process_invalidates_local_entries(self):
+        self.get(self.password)
+        User.objects.filter(pk=self.user.id).update(is_active=False)
+        CredentialCache().invalidate_user(self.user.id)
+        self.assertEqual(len(credential_cache._cache), 1)
+        self.assertEqual(self.get(self.password).status_code,
+                         status.HTTP_401_UNAUTHORIZED)
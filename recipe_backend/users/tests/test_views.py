@@ -7,6 +7,9 @@ from django.urls import reverse
 
 from rest_framework import status
 
+from core.tests.budgets import QueryBudgetTestMixin
+from users.views import UserCreate, UserDetail
+
 
 class UserViewTests(TestCase):
     """
@@ -20,7 +23,7 @@ class UserViewTests(TestCase):
         self.email = 'dev@server.org'
 
 
-class UserCreateViewTests(UserViewTests):
+class UserCreateViewTests(QueryBudgetTestMixin, UserViewTests):
     """
     Test the user-create view.
     """
@@ -48,6 +51,10 @@ class UserCreateViewTests(UserViewTests):
                                     content_type=self.content_type)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_user_create_list_is_within_query_budget(self):
+        response = self.assertWithinQueryBudget(UserCreate, self.create_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
     def test_user_create_failure_bad_password(self):
         post = json.dumps(
             {"template": {"data": [{"name": "username", "value": "new_user"},
@@ -58,7 +65,7 @@ class UserCreateViewTests(UserViewTests):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
 
-class UserDetailViewTests(UserViewTests):
+class UserDetailViewTests(QueryBudgetTestMixin, UserViewTests):
     """
     Test the user-detail view.
     """
@@ -86,3 +93,8 @@ class UserDetailViewTests(UserViewTests):
         self.client.login(username="other_username", password="other_password")
         response = self.client.get(self.read_url)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_user_detail_is_within_query_budget(self):
+        self.client.login(username=self.username, password=self.password)
+        response = self.assertWithinQueryBudget(UserDetail, self.read_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -4,26 +4,31 @@ from django.contrib.auth.models import User
 from rest_framework import generics, permissions
 
 from collectionjson import services
+from core.budgets import QueryBudgetMixin
+from core.timing import ServerTimingMixin
 
 from .serializers import UserSerializer
 from .permissions import IsUser
 
 
-class UserCreate(generics.ListCreateAPIView):
+class UserCreate(QueryBudgetMixin, ServerTimingMixin, generics.ListCreateAPIView):
     queryset = User.objects.all()
+    query_budget = 2
     serializer_class = UserSerializer
+    collection_document = services.CollectionDocument(
+        template_data={"username": "", "email": "", "password": "", "first_name": "",
+                       "last_name": ""})
 
     def list(self, request, *args, **kwargs):
         """
         Overriden to append a collection+json write template.
         """
         response = services.get_list_response(self, [])
-        template_data = {"username": "",  "email": "", "password": "", "first_name": "",
-                         "last_name": ""}
-        return services.append_collection_template(response, template_data)
+        return self.collection_document.append_to(response, request)
 
 
-class UserDetail(generics.RetrieveAPIView):
-    queryset = User.objects.all()
+class UserDetail(QueryBudgetMixin, ServerTimingMixin, generics.RetrieveAPIView):
+    queryset = User.objects.select_related('recipe')
+    query_budget = 3
     serializer_class = UserSerializer
     permission_classes = (permissions.IsAuthenticated, IsUser)